@@ -0,0 +1,34 @@
+"""Índices para la paginación por cursor
+
+Revision ID: 3d2a8bf56762
+Revises: d4a5c3cb051f
+Create Date: 2026-10-18 10:12:04.512731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d2a8bf56762'
+down_revision: Union[str, Sequence[str], None] = 'd4a5c3cb051f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_publicaciones_fecha_id', 'Publicaciones', ['fecha_publicacion', 'id_publicacion'], unique=False)
+    op.create_index('ix_publicaciones_usuario_fecha_id', 'Publicaciones', ['id_usuario', 'fecha_publicacion', 'id_publicacion'], unique=False)
+    op.create_index('ix_coleccion_usuario_fecha_id', 'Coleccion', ['id_usuario', 'fecha_captura', 'id_coleccion'], unique=False)
+    op.create_index('ix_comentarios_pub_padre_fecha_id', 'Comentarios', ['id_publicacion', 'id_padre', 'fecha_comentario', 'id_comentario'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_comentarios_pub_padre_fecha_id', table_name='Comentarios')
+    op.drop_index('ix_coleccion_usuario_fecha_id', table_name='Coleccion')
+    op.drop_index('ix_publicaciones_usuario_fecha_id', table_name='Publicaciones')
+    op.drop_index('ix_publicaciones_fecha_id', table_name='Publicaciones')
@@ -0,0 +1,45 @@
+"""Diferencias de contadores pendientes de aplicar
+
+Revision ID: 5e8c1a7d9f20
+Revises: b031fe2c19d7
+Create Date: 2026-10-18 16:40:12.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8c1a7d9f20'
+down_revision: Union[str, Sequence[str], None] = 'b031fe2c19d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'ContadoresPendientes',
+        sa.Column('id_pendiente', sa.Integer(), nullable=False),
+        sa.Column('likes', sa.Integer(), nullable=False),
+        sa.Column('dislikes', sa.Integer(), nullable=False),
+        sa.Column('fecha', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('id_publicacion', sa.Integer(), nullable=True),
+        sa.Column('id_comentario', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['id_publicacion'], ['Publicaciones.id_publicacion'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['id_comentario'], ['Comentarios.id_comentario'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id_pendiente'),
+    )
+    op.create_index('ix_pendientes_publicacion', 'ContadoresPendientes', ['id_publicacion'], unique=False)
+    op.create_index('ix_pendientes_comentario', 'ContadoresPendientes', ['id_comentario'], unique=False)
+    op.create_index('ix_pendientes_fecha', 'ContadoresPendientes', ['fecha'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_pendientes_fecha', table_name='ContadoresPendientes')
+    op.drop_index('ix_pendientes_comentario', table_name='ContadoresPendientes')
+    op.drop_index('ix_pendientes_publicacion', table_name='ContadoresPendientes')
+    op.drop_table('ContadoresPendientes')
@@ -0,0 +1,39 @@
+"""Subidas pendientes de confirmar
+
+Revision ID: 8f3b2d6a1c47
+Revises: 5e8c1a7d9f20
+Create Date: 2026-10-18 19:12:40.551372
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3b2d6a1c47'
+down_revision: Union[str, Sequence[str], None] = '5e8c1a7d9f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'SubidasPendientes',
+        sa.Column('id_subida', sa.Integer(), nullable=False),
+        sa.Column('id_usuario', sa.Integer(), nullable=False),
+        sa.Column('file_id', sa.String(), nullable=False),
+        sa.Column('path_foto', sa.String(), nullable=False),
+        sa.Column('expira', sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(['id_usuario'], ['Usuarios.id_usuario'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id_subida'),
+    )
+    op.create_index('ix_subidas_pendientes_expira', 'SubidasPendientes', ['expira'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_subidas_pendientes_expira', table_name='SubidasPendientes')
+    op.drop_table('SubidasPendientes')
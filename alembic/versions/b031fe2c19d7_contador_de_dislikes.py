@@ -0,0 +1,41 @@
+"""Contador de dislikes
+
+Revision ID: b031fe2c19d7
+Revises: 3d2a8bf56762
+Create Date: 2026-10-18 11:03:47.220918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b031fe2c19d7'
+down_revision: Union[str, Sequence[str], None] = '3d2a8bf56762'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('Publicaciones', sa.Column('dislikes', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Comentarios', sa.Column('dislikes', sa.Integer(), server_default='0', nullable=False))
+    # Los contadores pasan a mantenerse sumando diferencias: partimos de los votos reales
+    op.execute(
+        'UPDATE "Publicaciones" p SET '
+        'likes = (SELECT count(*) FROM "VotosPublicacion" v WHERE v.id_publicacion = p.id_publicacion AND v.es_like), '
+        'dislikes = (SELECT count(*) FROM "VotosPublicacion" v WHERE v.id_publicacion = p.id_publicacion AND NOT v.es_like)'
+    )
+    op.execute(
+        'UPDATE "Comentarios" c SET '
+        'likes = (SELECT count(*) FROM "VotosComentario" v WHERE v.id_comentario = c.id_comentario AND v.es_like), '
+        'dislikes = (SELECT count(*) FROM "VotosComentario" v WHERE v.id_comentario = c.id_comentario AND NOT v.es_like)'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('Comentarios', 'dislikes')
+    op.drop_column('Publicaciones', 'dislikes')
@@ -15,6 +15,8 @@ from sqlalchemy.orm import Session
 # Esta es la "URL" que FastAPI usará para saber dónde está el endpoint de login
 # "token" es la URL que crearemos en routes_auth.py
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
+# Igual, pero sin error 401 si no hay token (rutas que también usan anónimos)
+oauth2_scheme_opcional = OAuth2PasswordBearer(tokenUrl="auth/token", auto_error=False)
 
 # 1. Configuración de encriptación (si no la tienes ya)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -41,6 +43,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
+def create_pending_upload_token(datos: dict) -> str:
+    """
+    Token firmado y de vida corta con una foto ya subida pendiente de confirmar
+    (ver /coleccion/identificar). No lleva "sub", así que no sirve como token de acceso.
+    """
+    to_encode = datos.copy()
+    expire = datetime.now(timezone.utc) + timedelta(minutes=settings.PENDING_UPLOAD_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire, "tipo": "subida_pendiente"})
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+def decode_pending_upload_token(token: str) -> Optional[dict]:
+    """Datos del token de subida pendiente, o None si no es válido o ha caducado."""
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("tipo") != "subida_pendiente":
+        return None
+    return payload
+
 def get_current_user(
     token: str = Depends(oauth2_scheme), 
     db: Session = Depends(get_db)
@@ -74,4 +96,20 @@ def get_current_user(
     if user is None:
         raise credentials_exception
     
-    return user
\ No newline at end of file
+    return user
+
+
+def get_current_user_optional(
+    token: Optional[str] = Depends(oauth2_scheme_opcional),
+    db: Session = Depends(get_db)
+) -> Optional[models.Usuario]:
+    """
+    Como get_current_user, pero devuelve None si no hay token o no es válido
+    en lugar de responder 401.
+    """
+    if not token:
+        return None
+    try:
+        return get_current_user(token=token, db=db)
+    except HTTPException:
+        return None
@@ -0,0 +1,135 @@
+"""
+Prueba de carga de votos sobre una sola publicación ("post caliente").
+
+Lanza `--votos` votos desde `--hilos` hilos (cada uno con su sesión y con
+usuarios distintos) contra la misma fila de Publicaciones, primero con el
+contador al momento y después con el AcumuladorVotos, y mide votos/s y la
+latencia de cada voto. Al terminar comprueba que el contador coincide con los
+votos guardados.
+
+Crea sus propios usuarios y publicación y los borra al acabar. Hay que
+lanzarlo contra PostgreSQL: con SQLite las escrituras se serializan de todas
+formas y no hay bloqueo de fila que medir.
+
+Uso (desde backend/):
+    python -m app.bench_votos --database-url postgresql://... --hilos 16 --votos 4000
+"""
+import argparse
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from . import crud, models
+from .ia.benchmark import percentiles
+from .services.votos_service import AcumuladorVotos
+
+
+def preparar(session_factory: Callable, n_usuarios: int):
+    """Publicación y `n_usuarios` votantes nuevos. Devuelve (id_publicacion, ids_usuarios)."""
+    marca = uuid.uuid4().hex[:8]
+    db = session_factory()
+    try:
+        usuarios = [
+            models.Usuario(nombre="bench", apellidos=marca, email=f"bench-{marca}-{i}@vitia.invalid", password_hash="-")
+            for i in range(n_usuarios)
+        ]
+        db.add_all(usuarios)
+        db.flush()
+        publicacion = models.Publicacion(titulo=f"bench {marca}", texto="-", id_usuario=usuarios[0].id_usuario, likes=0)
+        db.add(publicacion)
+        db.commit()
+        return publicacion.id_publicacion, [u.id_usuario for u in usuarios]
+    finally:
+        db.close()
+
+
+def limpiar(session_factory: Callable, id_publicacion: int, ids_usuarios: List[int]):
+    db = session_factory()
+    try:
+        db.query(models.VotoPublicacion).filter(models.VotoPublicacion.id_publicacion == id_publicacion).delete()
+        db.query(models.Publicacion).filter(models.Publicacion.id_publicacion == id_publicacion).delete()
+        db.query(models.Usuario).filter(models.Usuario.id_usuario.in_(ids_usuarios)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def cargar(
+    session_factory: Callable,
+    id_publicacion: int,
+    ids_usuarios: List[int],
+    hilos: int,
+    registrar_pendiente: Optional[Callable] = None,
+) -> dict:
+    """Un voto (like) por usuario, repartidos entre `hilos` hilos."""
+    def votar(id_usuario):
+        db = session_factory()
+        try:
+            inicio = time.perf_counter()
+            crud.votar_publicacion(db, id_usuario, id_publicacion, True, registrar_pendiente)
+            return (time.perf_counter() - inicio) * 1000
+        finally:
+            db.close()
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        latencias = list(pool.map(votar, ids_usuarios))
+    segundos = time.perf_counter() - inicio
+    return {"votos": len(ids_usuarios), "votos_por_s": round(len(ids_usuarios) / segundos, 1), **percentiles(latencias)}
+
+
+def contador(session_factory: Callable, id_publicacion: int) -> int:
+    db = session_factory()
+    try:
+        return crud.get_publicacion(db, id_publicacion).likes
+    finally:
+        db.close()
+
+
+def medir(session_factory: Callable, votos: int, hilos: int, acumulador: Optional[AcumuladorVotos] = None) -> dict:
+    id_publicacion, ids_usuarios = preparar(session_factory, votos)
+    try:
+        fila = cargar(session_factory, id_publicacion, ids_usuarios, hilos, acumulador.registrar if acumulador else None)
+        if acumulador:
+            acumulador.vaciar()
+            fila["escrituras_contador"] = acumulador.escrituras
+        fila["contador_correcto"] = contador(session_factory, id_publicacion) == votos
+        return fila
+    finally:
+        limpiar(session_factory, id_publicacion, ids_usuarios)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Carga de votos sobre un post caliente")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--hilos", type=int, default=16)
+    parser.add_argument("--votos", type=int, default=2000)
+    parser.add_argument("--max-eventos", type=int, default=500)
+    parser.add_argument("--salida", default="benchmark_votos.json")
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.database_url, pool_size=args.hilos, max_overflow=0)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    resultados = {}
+    # Sin vaciado periódico: se escribe cada `max_eventos` votos y al final
+    for modo, acumulador in (("directo", None), ("acumulado", AcumuladorVotos(session_factory, max_eventos=args.max_eventos))):
+        fila = medir(session_factory, args.votos, args.hilos, acumulador)
+        print(
+            f"{modo:<10} {fila['votos_por_s']:>8.1f} votos/s | p95 {fila.get('p95_ms')} ms | "
+            f"contador {'OK' if fila['contador_correcto'] else 'DESCUADRADO'}"
+        )
+        resultados[modo] = fila
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2)
+    print(f"\nResultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -12,11 +13,72 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    PENDING_UPLOAD_EXPIRE_MINUTES: int = 15  # Vida del token de /coleccion/identificar
+    PENDING_UPLOAD_CLEANUP_S: float = 300    # Cada cuánto se borran de ImageKit las no confirmadas (0 = nunca)
 
     IMAGEKIT_PRIVATE_KEY: str
     IMAGEKIT_PUBLIC_KEY: str
     IMAGEKIT_URL_ENDPOINT: str
 
+    # --- Inferencia IA (/ia/predict) ---
+    IA_BATCH_MAX_SIZE: int = 8       # Máximo de imágenes por llamada a model.predict
+    IA_BATCH_MAX_WAIT_MS: float = 10 # Espera máxima para completar un lote
+    IA_EXECUTOR_WORKERS: int = 2     # Hilos dedicados a model.predict
+    IA_MAX_QUEUE: int = 64           # Peticiones admitidas a la vez; si no, 503
+    IA_RESERVA_PREMIUM: int = 16     # Plazas de la cola solo para usuarios premium
+    IA_PLAZO_PREMIUM_MS: float = 10000  # Plazo por defecto de una identificación premium
+    IA_PLAZO_GRATIS_MS: float = 5000    # Plazo por defecto de una identificación gratuita
+    IA_BATCH_MAX_FILES: int = 32     # Máximo de fotos en /ia/predict/batch
+    IA_RAFAGA_MAX_FRAMES: int = 32   # Máximo de frames de una ráfaga o de un vídeo
+    IA_RAFAGA_UMBRAL: float = 80     # Puntuación del consenso (%) con la que se deja de inferir
+    IA_RAFAGA_MIN_FRAMES: int = 2    # Frames válidos mínimos antes de poder parar
+    IA_RAFAGA_MAX_VIDEO_BYTES: int = 50 * 1024 * 1024
+    IA_MAX_UPLOAD_BYTES: int = 25 * 1024 * 1024  # Tamaño máximo de cada foto subida
+    IA_MAX_PIXELS: int = 60_000_000  # Rechaza imágenes de más de 60 MP (413)
+    IA_DECODE_MAX_SIDE: int = 1280   # Lado mayor tras decodificar (YOLO usa 640)
+    IA_IMGSZ_NIVELES: str = "640,512,416,320"  # Resoluciones de inferencia, de la completa a la más rápida
+    IA_RES_ADAPTATIVA: bool = True   # Bajar la resolución automáticamente bajo carga
+    IA_RES_COLA_ALTA: int = 16       # Con esta cola (o más) se baja un nivel...
+    IA_RES_P95_ALTO_MS: float = 800  # ...o con este p95 de inferencia
+    IA_RES_COLA_BAJA: int = 4        # Por debajo de esta cola y de este p95 se sube un nivel
+    IA_RES_P95_BAJO_MS: float = 300
+    IA_RES_ENFRIAMIENTO_S: float = 5 # Tiempo mínimo entre dos cambios de nivel
+    IA_WARMUP_ON_STARTUP: bool = False # Cargar el modelo al arrancar (si no, en la 1ª petición)
+    IA_BACKEND: str = "pytorch"      # pytorch | onnx | onnx_int8 | openvino
+    IA_SERVING_MODE: str = "local"   # local | preload | sidecar (ver SERVING.md)
+    # En el directorio de runtime del usuario (o en backend/run), no en /tmp
+    IA_SIDECAR_SOCKET: str = str(Path(os.environ.get("XDG_RUNTIME_DIR") or BASE_DIR / "run") / "vitia-ia.sock")
+    IA_TORCH_THREADS: Optional[int] = None  # Hilos de torch por proceso
+    IA_MODELS_DIR: Optional[str] = None  # Si se define, se sirve el .pt más reciente de este directorio
+    IA_MODEL_WATCH_S: float = 0      # Cada cuánto buscar pesos nuevos (0 = no vigilar)
+    IA_ADMIN_TOKEN: Optional[str] = None  # Cabecera X-Admin-Token de /ia/modelo/recargar
+    IA_CATALOGO_TTL_S: float = 300   # Caducidad del índice clase -> variedad de cada worker
+
+    # --- Fotos parecidas (índice de embeddings) ---
+    IA_SIMILARES: bool = False          # Construir el índice al arrancar (descarga todas las fotos)
+    IA_SIMILARES_PATH: Optional[str] = None  # Fichero .npz para no reconstruirlo en cada arranque
+    IA_ANN_MIN_VECTORES: int = 20000    # A partir de aquí, búsqueda aproximada (IVF) en vez de exacta
+    IA_ANN_NPROBE: int = 8              # Listas IVF que se recorren en cada búsqueda
+    IA_SIMILARES_ORIGENES: str = ""     # URLs base de las que se descargan fotos (vacío = IMAGEKIT_URL_ENDPOINT)
+    IA_SIMILARES_VIGILAR_S: float = 30  # Cada cuánto comprobar si hay que rehacerlo por cambio de modelo
+
+    # --- Foro ---
+    FORO_MAX_PROFUNDIDAD: int = 5    # Niveles de respuestas bajo cada comentario de /comentarios/publicacion/{id}
+    FORO_MAX_RESPUESTAS: int = 20    # Respuestas por comentario; del resto solo se indica que hay más
+    FORO_FEED_COMENTARIOS: int = 3   # Comentarios principales que lleva cada publicación del feed
+    FORO_FEED_PROFUNDIDAD: int = 2   # ...con estos niveles de respuestas
+    FORO_FEED_RESPUESTAS: int = 3    # ...y estas respuestas por comentario
+    FORO_VOTOS_INTERVALO_MS: float = 200  # Agrupar los contadores de votos y escribirlos cada X ms (0 = al momento)
+    FORO_VOTOS_MAX_EVENTOS: int = 500     # ...o en cuanto se acumulen tantos votos
+
+    # --- Caché de predicciones ---
+    IA_CACHE_MAX_ENTRIES: int = 1024
+    IA_CACHE_TTL_S: float = 3600
+    IA_CACHE_DIR: Optional[str] = None  # Si se define, añade una caché en disco
+    IA_CACHE_DISK_MAX_ENTRIES: int = 10000  # Ficheros en disco; se borran los usados hace más tiempo
+    IA_CACHE_PHASH: bool = False        # Reutilizar predicciones de fotos casi idénticas
+    IA_CACHE_PHASH_MAX_DIST: int = 4    # Distancia de Hamming máxima entre dHash
+
     model_config = SettingsConfigDict(
         env_file=str(BASE_DIR / ".env"),
         env_file_encoding="utf-8",
@@ -1,8 +1,13 @@
 # --- En tu archivo /app/crud.py ---
 
-from sqlalchemy.orm import Session
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import bindparam, delete, func, literal, or_, select, update
+from sqlalchemy.orm import Session, aliased, joinedload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from . import models, schemas, security
-from typing import List, Optional
+from .paginacion import keyset
+from typing import Callable, Dict, List, Optional
 
 # -----------------------------------------------------
 # Funciones CRUD para Variedad (Biblioteca)
@@ -80,10 +85,20 @@ def create_coleccion_item(db: Session, item: schemas.ColeccionCreate, id_usuario
     db.refresh(db_item)
     return db_item
 
-def get_user_coleccion(db: Session, id_usuario: int, skip: int = 0, limit: int = 100):
-    """Obtiene una lista paginada de la colección de un usuario."""
-    return db.query(models.Coleccion)\
-             .filter(models.Coleccion.id_usuario == id_usuario)\
+# Columnas de orden de cada listado paginado (ver app/paginacion.py). Cada una
+# tiene su índice compuesto en models.py.
+ORDEN_COLECCION = (models.Coleccion.fecha_captura, models.Coleccion.id_coleccion)
+ORDEN_PUBLICACIONES = (models.Publicacion.fecha_publicacion, models.Publicacion.id_publicacion)
+ORDEN_COMENTARIOS = (models.Comentario.fecha_comentario, models.Comentario.id_comentario)
+ORDEN_FAVORITOS = (models.Variedad.id_variedad,)
+
+def get_user_coleccion(db: Session, id_usuario: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
+    """
+    Obtiene una lista paginada de la colección de un usuario (la más reciente primero).
+    Con `cursor` empieza justo después de la última fila de la página anterior.
+    """
+    query = db.query(models.Coleccion).filter(models.Coleccion.id_usuario == id_usuario)
+    return keyset(query, ORDEN_COLECCION, cursor, descendente=True)\
              .offset(skip)\
              .limit(limit)\
              .all()
@@ -129,6 +144,44 @@ def update_coleccion_item(
     db.refresh(db_item)
     return db_item
 
+# --- Subidas pendientes de confirmar (ver models.SubidaPendiente) ---
+
+def crear_subida_pendiente(db: Session, id_usuario: int, file_id: str, path_foto: str, expira: datetime) -> int:
+    """Apunta una foto subida a ImageKit que espera a /coleccion/confirmar. Devuelve su id."""
+    subida = models.SubidaPendiente(id_usuario=id_usuario, file_id=file_id, path_foto=path_foto, expira=expira)
+    db.add(subida)
+    db.commit()
+    return subida.id_subida
+
+def quitar_subida_pendiente(db: Session, id_subida: int, id_usuario: int) -> bool:
+    """
+    Borra la subida pendiente SIN hacer commit: así sale en la misma transacción
+    que el item de la colección que la confirma. False si ya no está (caducó y
+    se limpió, o ya se confirmó).
+    """
+    return db.query(models.SubidaPendiente).filter(
+        models.SubidaPendiente.id_subida == id_subida,
+        models.SubidaPendiente.id_usuario == id_usuario,
+    ).delete(synchronize_session=False) > 0
+
+def retirar_subidas_caducadas(db: Session, ahora: Optional[datetime] = None) -> List[tuple]:
+    """
+    Borra las subidas pendientes caducadas y devuelve sus (id_usuario, file_id,
+    path_foto, expira) para borrar las fotos de ImageKit. El DELETE ... RETURNING
+    reparte las filas: si dos workers limpian a la vez, cada foto le toca a uno.
+    """
+    p = models.SubidaPendiente
+    sentencia = delete(p)\
+             .where(p.expira < (ahora or datetime.now(timezone.utc)))\
+             .returning(p.id_usuario, p.file_id, p.path_foto, p.expira)
+    try:
+        filas = [tuple(fila) for fila in db.execute(sentencia).all()]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return filas
+
 # -----------------------------------------------------
 # Funciones CRUD para Usuario (NUEVAS)
 # -----------------------------------------------------
@@ -223,13 +276,64 @@ def delete_publicacion(db: Session, db_publicacion: models.Publicacion):
     db.commit()
     return db_publicacion
 
-def get_publicaciones(db: Session, skip: int = 0, limit: int = 100):
-    """Obtiene una lista paginada de todas las publicaciones del foro."""
-    return db.query(models.Publicacion)\
-             .order_by(models.Publicacion.fecha_publicacion.desc())\
+def _con_relaciones_foro(query):
+    """
+    Carga de una vez el autor (en el mismo JOIN) y las variedades (un SELECT
+    ... IN para toda la página) que serializa schemas.Publicacion. Los
+    comentarios van aparte, recortados: ver _comentarios_destacados.
+    """
+    return query.options(
+        joinedload(models.Publicacion.autor),
+        selectinload(models.Publicacion.variedades),
+    )
+
+def _comentarios_destacados(
+    db: Session, publicaciones: List[models.Publicacion], n: int, max_profundidad: int, max_respuestas: int
+):
+    """
+    Deja en 'comentarios' de cada publicación solo sus `n` primeros comentarios
+    principales, con el hilo recortado igual que get_comentarios_publicacion.
+    El resto se pide a /comentarios/publicacion/{id}: cargarlos todos hacía que
+    una publicación con miles de comentarios inflara la página entera del feed.
+
+    Son dos consultas para toda la página: los primeros comentarios de cada
+    publicación (un LIMIT por publicación) y el árbol (ver _arbol_comentarios).
+    """
+    ids_publicacion = [pub.id_publicacion for pub in publicaciones]
+    ids = []
+    if ids_publicacion and n > 0:
+        c = models.Comentario
+        primeros = aliased(c)
+        de_su_publicacion = select(primeros.id_comentario)\
+             .where(primeros.id_publicacion == c.id_publicacion, primeros.id_padre.is_(None))\
+             .order_by(primeros.fecha_comentario, primeros.id_comentario)\
+             .limit(n)
+        ids = [id_comentario for (id_comentario,) in db.query(c.id_comentario)\
+             .filter(c.id_publicacion.in_(ids_publicacion), c.id_padre.is_(None))\
+             .filter(c.id_comentario.in_(de_su_publicacion))\
+             .order_by(c.id_publicacion, *ORDEN_COMENTARIOS)\
+             .all()]
+    por_publicacion = defaultdict(list)
+    for comentario in _arbol_comentarios(db, ids, max_profundidad, max_respuestas):
+        por_publicacion[comentario.id_publicacion].append(comentario)
+    for pub in publicaciones:
+        set_committed_value(pub, "comentarios", por_publicacion[pub.id_publicacion])
+    return publicaciones
+
+def get_publicaciones(
+    db: Session, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+    comentarios: int = 3, max_profundidad: int = 2, max_respuestas: int = 3,
+):
+    """
+    Obtiene una lista paginada de todas las publicaciones del foro, cada una
+    con sus `comentarios` primeros comentarios (ver _comentarios_destacados).
+    """
+    query = _con_relaciones_foro(db.query(models.Publicacion))
+    publicaciones = keyset(query, ORDEN_PUBLICACIONES, cursor, descendente=True)\
              .offset(skip)\
              .limit(limit)\
              .all()
+    return _comentarios_destacados(db, publicaciones, comentarios, max_profundidad, max_respuestas)
 
 def like_publicacion(db: Session, id_publicacion: int):
     """Incrementa en 1 los likes de una publicación."""
@@ -249,14 +353,31 @@ def unlike_publicacion(db: Session, id_publicacion: int):
         db.refresh(db_publicacion)
     return db_publicacion
 
-def get_user_publicaciones(db: Session, id_usuario: int, skip: int = 0, limit: int = 100):
+def get_user_publicaciones(
+    db: Session, id_usuario: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+    comentarios: int = 3, max_profundidad: int = 2, max_respuestas: int = 3,
+):
     """Obtiene una lista paginada de las publicaciones de un usuario específico."""
-    return db.query(models.Publicacion)\
-             .filter(models.Publicacion.id_usuario == id_usuario)\
-             .order_by(models.Publicacion.fecha_publicacion.desc())\
+    query = _con_relaciones_foro(db.query(models.Publicacion))\
+             .filter(models.Publicacion.id_usuario == id_usuario)
+    publicaciones = keyset(query, ORDEN_PUBLICACIONES, cursor, descendente=True)\
              .offset(skip)\
              .limit(limit)\
              .all()
+    return _comentarios_destacados(db, publicaciones, comentarios, max_profundidad, max_respuestas)
+
+def get_votos_usuario_publicaciones(db: Session, id_usuario: int, ids_publicacion: List[int]) -> Dict[int, bool]:
+    """
+    Votos del usuario sobre un conjunto de publicaciones, en una sola consulta.
+    Devuelve {id_publicacion: es_like}; las publicaciones sin voto no aparecen.
+    """
+    if not ids_publicacion:
+        return {}
+    filas = db.query(models.VotoPublicacion.id_publicacion, models.VotoPublicacion.es_like).filter(
+        models.VotoPublicacion.id_usuario == id_usuario,
+        models.VotoPublicacion.id_publicacion.in_(ids_publicacion)
+    ).all()
+    return {id_publicacion: es_like for id_publicacion, es_like in filas}
 
 # --- CRUD PARA COMENTARIOS ---
 
@@ -272,20 +393,93 @@ def create_comentario(db: Session, comentario: schemas.ComentarioCreate, id_usua
     db.refresh(db_comentario)
     return db_comentario
 
-def get_comentarios_publicacion(db: Session, id_publicacion: int, skip: int = 0, limit: int = 100):
+def get_comentarios_publicacion(
+    db: Session,
+    id_publicacion: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    id_padre: Optional[int] = None,
+    max_profundidad: int = 5,
+    max_respuestas: int = 20,
+):
     """
-    Obtiene solo los comentarios PRINCIPALES (donde id_padre es NULL).
-    Gracias a la relación 'hijos' en el modelo y schema, SQLAlchemy y Pydantic
-    cargarán las respuestas anidadas automáticamente.
+    Obtiene una página de comentarios PRINCIPALES (id_padre NULL, o las
+    respuestas de `id_padre` si se indica) con sus hilos ya montados en 'hijos':
+    como mucho `max_profundidad` niveles y `max_respuestas` respuestas por
+    comentario. Cada comentario lleva 'num_respuestas' y 'hay_mas_respuestas'
+    para que el cliente pida el resto (con id_padre) cuando lo necesite.
+
+    Son dos consultas sea cual sea el tamaño del hilo: la página de comentarios
+    y el árbol entero (ver _arbol_comentarios).
     """
-    return db.query(models.Comentario)\
+    query = db.query(models.Comentario.id_comentario)\
              .filter(models.Comentario.id_publicacion == id_publicacion)\
-             .filter(models.Comentario.id_padre == None)\
-             .order_by(models.Comentario.fecha_comentario.asc())\
+             .filter(models.Comentario.id_padre == id_padre)
+    ids = [id_comentario for (id_comentario,) in keyset(query, ORDEN_COMENTARIOS, cursor)\
              .offset(skip)\
              .limit(limit)\
+             .all()]
+    return _arbol_comentarios(db, ids, max_profundidad, max_respuestas)
+
+def _arbol_comentarios(db: Session, ids: List[int], max_profundidad: int, max_respuestas: int):
+    """
+    Carga los comentarios `ids` y sus respuestas con un CTE recursivo y monta
+    el árbol en memoria en una pasada.
+    Sin esto, cada nivel de 'hijos' es una consulta por comentario al serializar.
+    """
+    if not ids:
+        return []
+    c = models.Comentario
+    respuesta = aliased(c)
+    hermana = aliased(c)
+
+    # Desde los comentarios pedidos, bajando nivel a nivel. En cada paso solo
+    # entran las primeras `max_respuestas` respuestas de cada padre alcanzado:
+    # la subconsulta con LIMIT se evalúa por padre (como un JOIN LATERAL, que
+    # SQLite no tiene) y recorre el índice (id_publicacion, id_padre, fecha, id)
+    arbol = select(c.id_comentario, c.id_publicacion, literal(0).label("profundidad"))\
+             .where(c.id_comentario.in_(ids))\
+             .cte("arbol", recursive=True)
+    primeras = select(hermana.id_comentario)\
+             .where(hermana.id_publicacion == arbol.c.id_publicacion, hermana.id_padre == arbol.c.id_comentario)\
+             .order_by(hermana.fecha_comentario, hermana.id_comentario)\
+             .limit(max_respuestas)\
+             .correlate(arbol)
+    arbol = arbol.union_all(
+        select(respuesta.id_comentario, respuesta.id_publicacion, arbol.c.profundidad + 1)
+        .join(respuesta, respuesta.id_comentario.in_(primeras))
+        .where(arbol.c.profundidad < max_profundidad)
+    )
+
+    # Respuestas directas de cada comentario alcanzado (no de toda la publicación)
+    total = aliased(c)
+    num_respuestas = select(func.count())\
+             .where(total.id_publicacion == c.id_publicacion, total.id_padre == c.id_comentario)\
+             .correlate(c)\
+             .scalar_subquery()
+
+    # Por nivel y fecha: cada respuesta llega después de su padre y en orden
+    filas = db.query(c, num_respuestas)\
+             .join(arbol, arbol.c.id_comentario == c.id_comentario)\
+             .options(joinedload(c.autor))\
+             .order_by(arbol.c.profundidad, *ORDEN_COMENTARIOS)\
              .all()
 
+    pedidos = set(ids)
+    hijos = defaultdict(list)
+    for comentario, _ in filas:
+        if comentario.id_comentario not in pedidos:
+            hijos[comentario.id_padre].append(comentario)
+    por_id = {}
+    for comentario, num_respuestas in filas:
+        set_committed_value(comentario, "hijos", hijos[comentario.id_comentario])
+        # Atributos dinámicos, como 'is_liked' en las publicaciones
+        comentario.num_respuestas = num_respuestas
+        comentario.hay_mas_respuestas = num_respuestas > len(comentario.hijos)
+        por_id[comentario.id_comentario] = comentario
+    return [por_id[i] for i in ids if i in por_id]
+
 def delete_comentario(db: Session, id_comentario: int, id_usuario: int):
     """Elimina un comentario si pertenece al usuario."""
     db_comentario = db.query(models.Comentario).filter(
@@ -323,95 +517,255 @@ def toggle_favorito(db: Session, id_usuario: int, id_variedad: int):
         db.commit()
         return "añadido a" # Pequeña corrección en el return string
 
-def get_user_favoritos(db: Session, id_usuario: int, skip: int = 0, limit: int = 100):
+def get_user_favoritos(db: Session, id_usuario: int, skip: int = 0, limit: int = 100, cursor: Optional[str] = None):
     """Obtiene una lista paginada de las variedades favoritas de un usuario."""
     user = get_user(db, id_usuario)
     if not user:
         return []
 
-    return db.query(models.Variedad)\
+    query = db.query(models.Variedad)\
              .join(models.favoritos_assoc)\
-             .filter(models.favoritos_assoc.c.id_usuario == id_usuario)\
+             .filter(models.favoritos_assoc.c.id_usuario == id_usuario)
+    return keyset(query, ORDEN_FAVORITOS, cursor)\
              .offset(skip)\
              .limit(limit)\
              .all()
 
-def _actualizar_contador_likes(db: Session, modelo_voto, modelo_padre, id_campo_fk, id_valor_fk, columna_likes_padre):
+def _insertar_si_no_existe(db: Session, modelo, valores: dict):
     """
-    Función interna: Cuenta cuántos 'True' hay en la tabla de votos
-    y actualiza la columna 'likes' del objeto padre (Publicacion o Comentario).
+    INSERT ... ON CONFLICT DO NOTHING (PostgreSQL y SQLite). Devuelve True si
+    insertó la fila y False si ya existía.
     """
-    # 1. Contar likes reales (es_like = True)
-    filtro = {id_campo_fk: id_valor_fk, "es_like": True}
-    total_likes = db.query(modelo_voto).filter_by(**filtro).count()
-    
-    # Si quisieras restar los dislikes (Score), descomenta esto:
-    # total_dislikes = db.query(modelo_voto).filter_by({id_campo_fk: id_valor_fk, "es_like": False}).count()
-    # score_final = total_likes - total_dislikes
-    
-    # 2. Actualizar el padre
-    # Usamos db.query().update() para ser eficientes
-    db.query(modelo_padre).filter(
-        getattr(modelo_padre, id_campo_fk) == id_valor_fk
-    ).update({columna_likes_padre: total_likes})
-    
-    db.commit()
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    sentencia = insert(modelo).values(**valores).on_conflict_do_nothing().returning(modelo.id_voto)
+    return db.execute(sentencia).first() is not None
+
+def _sumar_contadores(db: Session, modelo_padre, id_campo_fk, id_valor_fk, likes: int, dislikes: int):
+    """UPDATE ... SET likes = likes + :d: suma sobre el valor actual de la fila, sin contar votos."""
+    if not likes and not dislikes:
+        return
+    db.query(modelo_padre).filter(getattr(modelo_padre, id_campo_fk) == id_valor_fk).update(
+        {
+            modelo_padre.likes: func.coalesce(modelo_padre.likes, 0) + likes,
+            modelo_padre.dislikes: func.coalesce(modelo_padre.dislikes, 0) + dislikes,
+        },
+        synchronize_session=False,
+    )
 
-# --- LOGICA VOTOS (3 ESTADOS) ---
-def gestionar_voto(db: Session, modelo_voto, modelo_padre, id_usuario: int, id_campo_fk, id_valor_fk, es_like: Optional[bool]):
+def _delta(es_like: Optional[bool], signo: int):
+    """(likes, dislikes) que suma (+1) o resta (-1) un voto."""
+    if es_like is None:
+        return 0, 0
+    return (signo, 0) if es_like else (0, signo)
+
+def _cambiar_voto(db: Session, modelo_voto, id_usuario: int, id_campo_fk, id_valor_fk, es_like: Optional[bool]):
     """
-    1. Gestiona el voto (Crear, Borrar o Actualizar).
-    2. Recalcula el contador del padre.
+    Aplica el voto con una sentencia que dice qué había antes, para saber cuánto
+    cambian los contadores sin volver a contar. Devuelve (estado, likes, dislikes).
     """
-    filtro = {
-        "id_usuario": id_usuario,
-        id_campo_fk: id_valor_fk
-    }
-    
-    # 1. Buscar voto existente
-    voto_existente = db.query(modelo_voto).filter_by(**filtro).first()
-    estado = ""
+    filtro = (modelo_voto.id_usuario == id_usuario, getattr(modelo_voto, id_campo_fk) == id_valor_fk)
 
     # CASO A: Quitar voto (Neutro)
     if es_like is None:
-        if voto_existente:
-            db.delete(voto_existente)
-            estado = "voto_eliminado"
-        else:
-            estado = "sin_cambios"
-
-    # CASO B: Dar Like o Dislike
-    elif voto_existente:
-        # Actualizar si cambia
-        if voto_existente.es_like != es_like:
-            voto_existente.es_like = es_like
-            estado = "voto_actualizado"
-        else:
-            estado = "sin_cambios"
-    else:
-        # Crear nuevo
-        nuevo_voto = modelo_voto(es_like=es_like, **filtro)
-        db.add(nuevo_voto)
-        estado = "voto_creado"
-    
-    db.commit()
+        borrado = db.execute(
+            delete(modelo_voto).where(*filtro).returning(modelo_voto.es_like)
+        ).first()
+        if borrado is None:
+            return "sin_cambios", 0, 0
+        return ("voto_eliminado", *_delta(borrado.es_like, -1))
+
+    # CASO B: Cambiar de Like a Dislike (o al revés)
+    actualizado = db.execute(
+        update(modelo_voto).where(*filtro, modelo_voto.es_like != es_like)
+        .values(es_like=es_like).returning(modelo_voto.id_voto)
+    ).first()
+    if actualizado is not None:
+        likes, dislikes = _delta(es_like, 1)
+        return "voto_actualizado", likes - dislikes, dislikes - likes
 
-    # 2. IMPORTANTE: Sincronizar el contador en la tabla padre
-    # Solo recalculamos si hubo cambios para ahorrar recursos
-    if estado != "sin_cambios":
-        _actualizar_contador_likes(
-            db, 
-            modelo_voto=modelo_voto, 
-            modelo_padre=modelo_padre, 
-            id_campo_fk=id_campo_fk, 
-            id_valor_fk=id_valor_fk, 
-            columna_likes_padre="likes" # Nombre de la columna en Publicacion/Comentario
-        )
-    
+    # CASO C: Voto nuevo. Si ya existía (con el mismo valor, o lo acaba de crear
+    # otra petición del mismo usuario) no se toca nada
+    if _insertar_si_no_existe(db, modelo_voto, {"es_like": es_like, "id_usuario": id_usuario, id_campo_fk: id_valor_fk}):
+        return ("voto_creado", *_delta(es_like, 1))
+    return "sin_cambios", 0, 0
+
+# --- LOGICA VOTOS (3 ESTADOS) ---
+def gestionar_voto(
+    db: Session, modelo_voto, modelo_padre, id_usuario: int, id_campo_fk, id_valor_fk, es_like: Optional[bool],
+    registrar_pendiente: Optional[Callable[[int], None]] = None,
+):
+    """
+    1. Gestiona el voto (Crear, Borrar o Actualizar).
+    2. Suma la diferencia a los contadores del padre.
+
+    Todo en una transacción y sin contar los votos: cuesta lo mismo en un post
+    con 10 votos que en uno con 100.000, y dos votos simultáneos no se pisan
+    porque cada UPDATE suma sobre el valor actual de la fila.
+
+    Con `registrar_pendiente` el voto se guarda igual, pero la diferencia no
+    toca la fila del padre: se guarda en ContadoresPendientes (en la misma
+    transacción) y se le pasa su id a esa función, que la sumará más tarde con
+    aplicar_pendientes (ver services/votos_service.AcumuladorVotos).
+    """
+    id_pendiente = None
+    try:
+        estado, likes, dislikes = _cambiar_voto(db, modelo_voto, id_usuario, id_campo_fk, id_valor_fk, es_like)
+        if registrar_pendiente is None:
+            _sumar_contadores(db, modelo_padre, id_campo_fk, id_valor_fk, likes, dislikes)
+        elif likes or dislikes:
+            pendiente = models.ContadorPendiente(likes=likes, dislikes=dislikes, **{id_campo_fk: id_valor_fk})
+            db.add(pendiente)
+            db.flush()
+            id_pendiente = pendiente.id_pendiente
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if id_pendiente is not None:
+        registrar_pendiente(id_pendiente)
     return estado
 
+# Tabla padre de cada columna de ContadoresPendientes
+_PADRES_PENDIENTES = (("id_publicacion", models.Publicacion), ("id_comentario", models.Comentario))
+
+def aplicar_pendientes(db: Session, ids: Optional[List[int]] = None, anteriores_a: Optional[datetime] = None) -> int:
+    """
+    Suma a los contadores las diferencias pendientes `ids` (o las escritas antes
+    de `anteriores_a`) y las borra, en una transacción. El DELETE ... RETURNING
+    decide qué filas aplica cada uno: si dos procesos intentan aplicar la misma,
+    solo uno la recibe. Devuelve cuántos contadores ha actualizado.
+    """
+    p = models.ContadorPendiente
+    sentencia = delete(p).returning(p.id_publicacion, p.id_comentario, p.likes, p.dislikes)
+    if ids is not None:
+        sentencia = sentencia.where(p.id_pendiente.in_(ids))
+    if anteriores_a is not None:
+        sentencia = sentencia.where(p.fecha < anteriores_a)
+    try:
+        sumas = defaultdict(lambda: [0, 0])
+        for fila in db.execute(sentencia).all():
+            for id_campo_fk, _ in _PADRES_PENDIENTES:
+                if getattr(fila, id_campo_fk) is not None:
+                    suma = sumas[(id_campo_fk, getattr(fila, id_campo_fk))]
+                    suma[0] += fila.likes
+                    suma[1] += fila.dislikes
+        actualizados = 0
+        for id_campo_fk, modelo_padre in _PADRES_PENDIENTES:
+            filas = [
+                {"b_id": id_valor, "b_likes": likes, "b_dislikes": dislikes}
+                for (campo, id_valor), (likes, dislikes) in sumas.items()
+                if campo == id_campo_fk and (likes or dislikes)
+            ]
+            if filas:
+                # Un UPDATE (executemany) por tabla para todas sus filas
+                db.connection().execute(
+                    update(modelo_padre)
+                    .where(getattr(modelo_padre, id_campo_fk) == bindparam("b_id"))
+                    .values(
+                        likes=func.coalesce(modelo_padre.likes, 0) + bindparam("b_likes"),
+                        dislikes=func.coalesce(modelo_padre.dislikes, 0) + bindparam("b_dislikes"),
+                    ),
+                    filas,
+                )
+                actualizados += len(filas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return actualizados
+
+def _recuento(db: Session, modelo_voto, id_campo_fk, id_valor_fk):
+    """
+    (likes, dislikes) que debería tener el contador: los votos menos lo que aún
+    está pendiente de sumar. Las dos partes en la misma sentencia, para que
+    vengan de la misma foto de la base.
+    """
+    p = models.ContadorPendiente
+    pendiente = lambda columna: select(func.coalesce(func.sum(columna), 0))\
+        .where(getattr(p, id_campo_fk) == id_valor_fk).scalar_subquery()
+    likes, dislikes = db.query(
+        func.count().filter(modelo_voto.es_like == True) - pendiente(p.likes),
+        func.count().filter(modelo_voto.es_like == False) - pendiente(p.dislikes),
+    ).filter(getattr(modelo_voto, id_campo_fk) == id_valor_fk).one()
+    return likes, dislikes
+
+def _descuadrados(db: Session, modelo_voto, modelo_padre, id_campo_fk) -> List[int]:
+    """Ids cuyos contadores no coinciden con los votos (lectura sin bloqueos, solo candidatos)."""
+    votos = lambda valor: select(func.count()).where(
+        getattr(modelo_voto, id_campo_fk) == getattr(modelo_padre, id_campo_fk),
+        modelo_voto.es_like == valor,
+    ).scalar_subquery()
+    p = models.ContadorPendiente
+    pendiente = lambda columna: select(func.coalesce(func.sum(columna), 0)).where(
+        getattr(p, id_campo_fk) == getattr(modelo_padre, id_campo_fk)
+    ).scalar_subquery()
+    return [
+        id_valor for (id_valor,) in db.query(getattr(modelo_padre, id_campo_fk)).filter(or_(
+            func.coalesce(modelo_padre.likes, -1) != votos(True) - pendiente(p.likes),
+            func.coalesce(modelo_padre.dislikes, -1) != votos(False) - pendiente(p.dislikes),
+        )).all()
+    ]
+
+def _corregir(db: Session, modelo_voto, modelo_padre, id_campo_fk, id_valor_fk) -> bool:
+    """
+    Corrige una fila en su propia transacción. Primero se bloquea la fila del
+    padre (los votos que suman a la vez esperan) y después se cuenta, en una
+    sentencia nueva que ya ve los votos confirmados mientras esperábamos el
+    bloqueo: así no se escribe un recuento viejo encima de un voto reciente.
+    """
+    try:
+        padre = db.query(modelo_padre.likes, modelo_padre.dislikes)\
+                  .filter(getattr(modelo_padre, id_campo_fk) == id_valor_fk)\
+                  .with_for_update()\
+                  .first()
+        if padre is None:
+            db.rollback()
+            return False
+        likes, dislikes = _recuento(db, modelo_voto, id_campo_fk, id_valor_fk)
+        if (padre.likes, padre.dislikes) == (likes, dislikes):
+            db.rollback()
+            return False
+        db.query(modelo_padre).filter(getattr(modelo_padre, id_campo_fk) == id_valor_fk)\
+          .update({modelo_padre.likes: likes, modelo_padre.dislikes: dislikes}, synchronize_session=False)
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        raise
+
+def reconciliar_contadores(db: Session, antiguedad_huerfanos_s: float = 300) -> int:
+    """
+    Recalcula likes/dislikes de publicaciones y comentarios desde las tablas de
+    votos y corrige solo las filas que no cuadran (p. ej. tras borrar votos a
+    mano). Devuelve cuántas filas ha corregido.
+
+    Lo que está en ContadoresPendientes no cuenta como descuadre: lo sumará el
+    worker que lo escribió. Solo las diferencias de más de
+    `antiguedad_huerfanos_s` (de un worker que murió sin vaciar) se aplican aquí.
+
+    Recorre todos los votos: se lanza desde un único proceso (ver
+    app/reconciliar_votos.py), no desde cada worker.
+    """
+    aplicar_pendientes(db, anteriores_a=datetime.now(timezone.utc) - timedelta(seconds=antiguedad_huerfanos_s))
+    corregidas = 0
+    for modelo_voto, modelo_padre, id_campo_fk in (
+        (models.VotoPublicacion, models.Publicacion, "id_publicacion"),
+        (models.VotoComentario, models.Comentario, "id_comentario"),
+    ):
+        candidatos = _descuadrados(db, modelo_voto, modelo_padre, id_campo_fk)
+        db.rollback()  # Termina la transacción de lectura antes de bloquear filas
+        for id_valor_fk in candidatos:
+            corregidas += _corregir(db, modelo_voto, modelo_padre, id_campo_fk, id_valor_fk)
+    return corregidas
+
 # Wrappers
-def votar_publicacion(db: Session, id_usuario: int, id_publicacion: int, es_like: Optional[bool]):
+def votar_publicacion(
+    db: Session, id_usuario: int, id_publicacion: int, es_like: Optional[bool],
+    registrar_pendiente: Optional[Callable[[int], None]] = None,
+):
     return gestionar_voto(
         db=db,
         modelo_voto=models.VotoPublicacion,
@@ -419,10 +773,14 @@ def votar_publicacion(db: Session, id_usuario: int, id_publicacion: int, es_like
         id_usuario=id_usuario,
         id_campo_fk="id_publicacion",
         id_valor_fk=id_publicacion,
-        es_like=es_like
+        es_like=es_like,
+        registrar_pendiente=registrar_pendiente
     )
 
-def votar_comentario(db: Session, id_usuario: int, id_comentario: int, es_like: Optional[bool]):
+def votar_comentario(
+    db: Session, id_usuario: int, id_comentario: int, es_like: Optional[bool],
+    registrar_pendiente: Optional[Callable[[int], None]] = None,
+):
     return gestionar_voto(
         db=db,
         modelo_voto=models.VotoComentario,
@@ -430,5 +788,6 @@ def votar_comentario(db: Session, id_usuario: int, id_comentario: int, es_like:
         id_usuario=id_usuario,
         id_campo_fk="id_comentario",
         id_valor_fk=id_comentario,
-        es_like=es_like
+        es_like=es_like,
+        registrar_pendiente=registrar_pendiente
     )
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+Backends de inferencia para CPU.
+
+Todos los backends se sirven a través de `ultralytics.YOLO`, que sabe cargar
+tanto el `.pt` original como sus exportaciones (ONNX Runtime, OpenVINO IR).
+Así `model.predict`, `model.names` y los `Results` son los mismos para todos
+y la respuesta `{"variedad", "confianza"}` no cambia al cambiar de backend.
+
+Uso por línea de comandos (desde backend/):
+    python -m app.ia.backends export onnx
+    python -m app.ia.backends benchmark pytorch onnx onnx_int8 openvino
+"""
+import os
+import time
+
+PYTORCH = "pytorch"
+ONNX = "onnx"
+ONNX_INT8 = "onnx_int8"
+OPENVINO = "openvino"
+
+BACKENDS = (PYTORCH, ONNX, ONNX_INT8, OPENVINO)
+
+# Tamaño de entrada con el que se exportan los modelos estáticos
+EXPORT_IMGSZ = 640
+
+
+def ruta_backend(pt_path: str, backend: str) -> str:
+    """Ruta de los pesos para un backend (exista o no todavía)."""
+    base, _ = os.path.splitext(pt_path)
+    if backend == PYTORCH:
+        return pt_path
+    if backend == ONNX:
+        return base + ".onnx"
+    if backend == ONNX_INT8:
+        return base + "_int8.onnx"
+    if backend == OPENVINO:
+        # Ultralytics exporta OpenVINO como un directorio <nombre>_openvino_model/
+        return base + "_openvino_model"
+    raise ValueError(f"Backend desconocido: {backend}. Opciones: {', '.join(BACKENDS)}")
+
+
+def exportar(pt_path: str, backend: str, imgsz: int = EXPORT_IMGSZ) -> str:
+    """
+    Exporta `best2.pt` al formato del backend si aún no existe y devuelve su ruta.
+    Las exportaciones usan ejes dinámicos para poder servir lotes (micro-batching).
+    """
+    destino = ruta_backend(pt_path, backend)
+    if backend == PYTORCH or os.path.exists(destino):
+        return destino
+
+    from ultralytics import YOLO
+
+    print(f"Exportando {pt_path} a {backend}...")
+    inicio = time.perf_counter()
+
+    if backend == ONNX:
+        YOLO(pt_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True)
+
+    elif backend == ONNX_INT8:
+        # Cuantización dinámica INT8 de los pesos sobre el ONNX en FP32
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        onnx_fp32 = exportar(pt_path, ONNX, imgsz=imgsz)
+        quantize_dynamic(onnx_fp32, destino, weight_type=QuantType.QUInt8)
+
+    elif backend == OPENVINO:
+        YOLO(pt_path).export(format="openvino", imgsz=imgsz, dynamic=True)
+
+    print(f"Exportado a {destino} en {(time.perf_counter() - inicio):.1f} s")
+    return destino
+
+
+def cargar_modelo(pt_path: str, backend: str = PYTORCH):
+    """Devuelve un `YOLO` listo para `predict` con el backend pedido (exportando si hace falta)."""
+    from ultralytics import YOLO
+
+    ruta = exportar(pt_path, backend)
+    if backend == PYTORCH:
+        return YOLO(ruta)
+    # Los modelos exportados no guardan la tarea de forma fiable: la indicamos
+    return YOLO(ruta, task="detect")
+
+
+def benchmark(pt_path: str, backends=BACKENDS, repeticiones: int = 20, imgsz: int = EXPORT_IMGSZ) -> list:
+    """Latencia media por backend sobre una imagen sintética, y mejora frente a PyTorch."""
+    from PIL import Image
+
+    imagen = Image.new("RGB", (imgsz, imgsz), (90, 120, 60))
+    filas = []
+    for backend in backends:
+        try:
+            model = cargar_modelo(pt_path, backend)
+        except Exception as e:
+            filas.append({"backend": backend, "error": str(e)})
+            continue
+
+        # Warm-up
+        for _ in range(3):
+            model.predict(imagen, save=False, verbose=False)
+
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            model.predict(imagen, save=False, verbose=False)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        tiempos.sort()
+        filas.append({
+            "backend": backend,
+            "media_ms": round(sum(tiempos) / len(tiempos), 2),
+            "p50_ms": round(tiempos[len(tiempos) // 2], 2),
+        })
+
+    base = next((f["media_ms"] for f in filas if f["backend"] == PYTORCH and "media_ms" in f), None)
+    for fila in filas:
+        if base and "media_ms" in fila:
+            fila["mejora_vs_pytorch"] = round(base / fila["media_ms"], 2)
+    return filas
+
+
+if __name__ == "__main__":
+    import argparse
+    from .model_loader import MODEL_PATH
+
+    parser = argparse.ArgumentParser(description="Exportación y benchmark de backends de VitIA")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_export = sub.add_parser("export", help="Exportar best2.pt a otro backend")
+    p_export.add_argument("backends", nargs="+", choices=BACKENDS)
+
+    p_bench = sub.add_parser("benchmark", help="Latencia media por backend")
+    p_bench.add_argument("backends", nargs="*", default=list(BACKENDS))
+    p_bench.add_argument("--repeticiones", type=int, default=20)
+
+    args = parser.parse_args()
+    if args.comando == "export":
+        for b in args.backends:
+            print(exportar(MODEL_PATH, b))
+    else:
+        for fila in benchmark(MODEL_PATH, args.backends, repeticiones=args.repeticiones):
+            print(fila)
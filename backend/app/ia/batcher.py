@@ -0,0 +1,183 @@
+import asyncio
+import functools
+import itertools
+import time
+from typing import Any, Callable, List, Optional
+
+from .executor import CARRIL_GRATIS, CARRIL_PREMIUM, PlazoAgotado
+
+# Orden de la cola: primero premium, después gratis (y FIFO dentro de cada carril)
+_PRIORIDAD = {CARRIL_PREMIUM: 0, CARRIL_GRATIS: 1}
+
+
+class MicroBatcher:
+    """
+    Agrupa peticiones concurrentes de inferencia en lotes.
+
+    Cada petición llama a `submit(imagen)` y espera su resultado. Un worker
+    en segundo plano recoge imágenes de la cola hasta llenar `max_batch_size`
+    o hasta que pasan `max_wait_ms` desde la primera, ejecuta UNA llamada a
+    `predict_fn(lista_de_imagenes)` y devuelve a cada petición su resultado.
+
+    Si se pasa un `executor` (InferenceExecutor), los lotes se ejecutan en su
+    pool dedicado y cada petición pasa por su control de admisión. Se lanzan
+    hasta `executor.max_workers` lotes a la vez; con todos los hilos ocupados
+    el worker no recoge más, y lo que llega mientras tanto forma el lote
+    siguiente. Sin executor, un lote detrás de otro.
+
+    La cola es de prioridad por carril, así que los lotes se llenan antes con
+    peticiones premium. Las peticiones con `limite` (instante de
+    `time.monotonic()`) que lo superan esperando se descartan con PlazoAgotado
+    antes de llegar al modelo.
+
+    Si las peticiones piden distinta resolución (`imgsz`), el lote se divide:
+    cada llamada a `predict_fn(imagenes, imgsz=...)` usa una sola resolución.
+    """
+
+    def __init__(self, predict_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 8, max_wait_ms: float = 10.0, executor=None):
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000
+
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._secuencia = itertools.count()
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._huecos: Optional[asyncio.Semaphore] = None  # Lotes que pueden ejecutarse a la vez
+        self._en_curso = set()  # Tareas de los lotes lanzados (referencia para que no se pierdan)
+
+    @property
+    def concurrencia(self) -> int:
+        return self.executor.max_workers if self.executor is not None else 1
+
+    def _ensure_worker(self):
+        """Arranca el worker en el event loop actual (uno por loop)."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.PriorityQueue()
+            self._huecos = asyncio.Semaphore(self.concurrencia)
+            self._worker = loop.create_task(self._run())
+
+    async def submit(
+        self,
+        image: Any,
+        carril: str = CARRIL_GRATIS,
+        limite: Optional[float] = None,
+        imgsz: Optional[int] = None,
+        admitida: bool = False,
+    ) -> Any:
+        """
+        Encola una imagen y espera el resultado de SU inferencia. Con
+        `admitida=True` la plaza ya la reservó quien llama (`executor.admitir(n=...)`
+        para varias imágenes a la vez) y también la libera él.
+        """
+        self._ensure_worker()
+        admitir = self.executor is not None and not admitida
+        if admitir:
+            # Lanza InferenciaSaturada si la cola está llena o no llegaría a tiempo
+            plazo_s = None if limite is None else limite - time.monotonic()
+            self.executor.admitir(carril, plazo_s, self.max_batch_size)
+        try:
+            future = self._loop.create_future()
+            await self._queue.put((_PRIORIDAD.get(carril, 1), next(self._secuencia), image, future, limite, imgsz))
+            return await future
+        finally:
+            if admitir:
+                self.executor.liberar(carril)
+
+    def _vigente(self, item) -> bool:
+        """False si la petición ya no espera resultado (cancelada o fuera de plazo)."""
+        _, _, _, future, limite, _ = item
+        if future.done():
+            return False
+        if limite is not None and time.monotonic() > limite:
+            future.set_exception(PlazoAgotado("Plazo agotado esperando en la cola de inferencia"))
+            if self.executor is not None:
+                self.executor.descartar_por_plazo()
+            return False
+        return True
+
+    async def _collect_batch(self) -> list:
+        # Bloqueamos hasta que llegue la primera petición vigente
+        item = await self._queue.get()
+        while not self._vigente(item):
+            item = await self._queue.get()
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait_s
+
+        # Esperamos a más peticiones hasta llenar el lote o agotar el tiempo
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if self._vigente(item):
+                batch.append(item)
+        return batch
+
+    async def _inferir(self, batch: list, imgsz: Optional[int]):
+        images = [item[2] for item in batch]
+        fn = self.predict_fn if imgsz is None else functools.partial(self.predict_fn, imgsz=imgsz)
+        try:
+            # La inferencia es bloqueante: la sacamos del event loop
+            if self.executor is not None:
+                results = await self.executor.run(fn, images)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(None, fn, images)
+            results = list(results)
+            if len(results) != len(batch):
+                # Sin un resultado por imagen no sabemos cuál es de quién: falla todo
+                # el lote (con zip, los futures sobrantes se quedarían esperando)
+                raise RuntimeError(f"El modelo devolvió {len(results)} resultados para {len(batch)} imágenes")
+        except Exception as e:
+            for item in batch:
+                if not item[3].done():
+                    item[3].set_exception(e)
+            return
+
+        for item, result in zip(batch, results):
+            if not item[3].done():
+                item[3].set_result(result)
+
+    async def _lanzar(self, grupo: list, imgsz: Optional[int]):
+        try:
+            await self._inferir(grupo, imgsz)
+        finally:
+            self._huecos.release()
+
+    async def _run(self):
+        while True:
+            # Esperamos a que haya un hilo libre ANTES de formar el lote
+            await self._huecos.acquire()
+            try:
+                batch = await self._collect_batch()
+            except BaseException:
+                self._huecos.release()
+                raise
+            # Una llamada al modelo por resolución (normalmente solo hay una)
+            grupos = {}
+            for item in batch:
+                grupos.setdefault(item[5], []).append(item)
+            for i, (imgsz, grupo) in enumerate(grupos.items()):
+                if i > 0:
+                    await self._huecos.acquire()
+                tarea = asyncio.create_task(self._lanzar(grupo, imgsz))
+                self._en_curso.add(tarea)
+                tarea.add_done_callback(self._en_curso.discard)
+
+    async def close(self):
+        """Detiene el worker (al apagar la aplicación) y espera a los lotes en curso."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+        if self._en_curso:
+            await asyncio.gather(*self._en_curso, return_exceptions=True)
@@ -0,0 +1,167 @@
+"""
+Benchmark de modos de servicio multi-worker (local / preload / sidecar).
+
+Para cada modo arranca gunicorn (y el sidecar si toca), lanza carga contra
+/ia/predict con las muestras de validación y mide:
+- throughput (img/s) y p50/p95 de latencia HTTP,
+- RSS y PSS de cada proceso (leídos de /proc/<pid>/smaps_rollup; solo Linux).
+  El PSS reparte las páginas compartidas entre los procesos que las usan, así
+  que la suma de PSS es la memoria real que ocupa el despliegue.
+
+Uso (desde backend/):
+    python -m app.ia.bench_serving --modos local preload sidecar --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from .benchmark import cargar_muestras, percentiles
+
+
+def _memoria(pid: int) -> dict:
+    valores = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r") as f:
+            for linea in f:
+                partes = linea.split()
+                if partes and partes[0] in ("Rss:", "Pss:"):
+                    valores[partes[0][:-1].lower() + "_mb"] = round(int(partes[1]) / 1024, 1)
+    except OSError:
+        pass
+    return valores
+
+
+def _hijos(pid: int) -> list:
+    hijos = []
+    try:
+        for tid in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{tid}/children", "r") as f:
+                hijos.extend(int(x) for x in f.read().split())
+    except OSError:
+        pass
+    return hijos
+
+
+def _esperar_http(url: str, timeout_s: float = 120):
+    import httpx
+
+    limite = time.monotonic() + timeout_s
+    while time.monotonic() < limite:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} no respondió en {timeout_s} s")
+
+
+async def _carga(url: str, muestras: list, peticiones: int, concurrencia: int) -> dict:
+    import httpx
+
+    latencias = []
+    errores = 0
+    siguiente = iter(range(peticiones))
+
+    async with httpx.AsyncClient(timeout=60) as client:
+        async def cliente():
+            nonlocal errores
+            for i in siguiente:
+                # Añadimos un byte para que cada petición sea única y no acierte en la caché
+                datos = muestras[i % len(muestras)] + i.to_bytes(4, "big")
+                inicio = time.perf_counter()
+                r = await client.post(url, files={"file": (f"{i}.jpg", datos, "image/jpeg")})
+                latencias.append((time.perf_counter() - inicio) * 1000)
+                if r.status_code != 200:
+                    errores += 1
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    return {
+        "peticiones": peticiones,
+        "errores": errores,
+        "throughput_rps": round(peticiones / duracion, 2),
+        "latencia": percentiles(latencias),
+    }
+
+
+def medir_modo(modo: str, workers: int, puerto: int, muestras: list, peticiones: int, concurrencia: int) -> dict:
+    env = dict(os.environ, IA_SERVING_MODE=modo, VITIA_WORKERS=str(workers), VITIA_BIND=f"127.0.0.1:{puerto}")
+    procesos = []
+    try:
+        sidecar = None
+        if modo == "sidecar":
+            sidecar = subprocess.Popen([sys.executable, "-m", "app.ia.sidecar"], env=env)
+            procesos.append(sidecar)
+            # Esperamos a que el sidecar cree su socket
+            from ..config import settings
+            limite = time.monotonic() + 120
+            while not os.path.exists(settings.IA_SIDECAR_SOCKET) and time.monotonic() < limite:
+                time.sleep(0.5)
+
+        maestro = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"], env=env
+        )
+        procesos.append(maestro)
+        base = f"http://127.0.0.1:{puerto}"
+        _esperar_http(base + "/")
+
+        # Calentamos (en modo local cada worker carga aquí su modelo)
+        asyncio.run(_carga(base + "/ia/predict", muestras, workers * 4, workers))
+        resultado = asyncio.run(_carga(base + "/ia/predict", muestras, peticiones, concurrencia))
+
+        memoria = {"maestro": _memoria(maestro.pid), "workers": [_memoria(p) for p in _hijos(maestro.pid)]}
+        if sidecar is not None:
+            memoria["sidecar"] = _memoria(sidecar.pid)
+        todos = [memoria["maestro"], *memoria["workers"]] + ([memoria["sidecar"]] if sidecar else [])
+        memoria["pss_total_mb"] = round(sum(m.get("pss_mb", 0) for m in todos), 1)
+        memoria["rss_medio_worker_mb"] = round(
+            sum(m.get("rss_mb", 0) for m in memoria["workers"]) / max(1, len(memoria["workers"])), 1
+        )
+        return {"modo": modo, "workers": workers, **resultado, "memoria": memoria}
+    finally:
+        for p in reversed(procesos):
+            p.send_signal(signal.SIGTERM)
+            try:
+                p.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de modos de servicio multi-worker")
+    parser.add_argument("--modos", nargs="+", default=["local", "preload", "sidecar"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--salida", default="benchmark_serving.json")
+    args = parser.parse_args(argv)
+
+    muestras = cargar_muestras()
+    if not muestras:
+        raise SystemExit("No hay muestras en app/tests/samples")
+
+    filas = []
+    for modo in args.modos:
+        fila = medir_modo(modo, args.workers, args.puerto, muestras, args.peticiones, args.concurrencia)
+        print(
+            f"{modo:<8} {fila['throughput_rps']:>7.2f} img/s | p95 {fila['latencia'].get('p95_ms')} ms | "
+            f"RSS/worker {fila['memoria']['rss_medio_worker_mb']} MB | PSS total {fila['memoria']['pss_total_mb']} MB"
+        )
+        filas.append(fila)
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(filas, f, indent=2)
+    print(f"\nResultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+"""
+Benchmark de inferencia de VitIA.
+
+Reproduce el camino de /ia/predict (decodificación -> micro-batching ->
+post-proceso) con las muestras de `app/tests/datasets.py`, barriendo niveles
+de concurrencia y tamaños de lote. Por cada combinación mide throughput y
+p50/p95/p99 de cada etapa, y guarda todo en JSON para comparar ejecuciones
+entre versiones del modelo y backends.
+
+Con `--postproceso` no carga el modelo: compara solo la agregación de cajas
+(el bucle por caja de antes frente al group-by vectorizado) con N cajas
+aleatorias por imagen.
+
+Uso (desde backend/):
+    python -m app.ia.benchmark --concurrencia 1,4,8 --lotes 1,4,8 --salida bench.json
+    python -m app.ia.benchmark --backend onnx --peticiones 200
+    python -m app.ia.benchmark --postproceso 100,1000,20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .batcher import MicroBatcher
+from .decode import decodificar
+from .executor import InferenceExecutor
+from .postproceso import agregar_por_clase, tensores_de_resultados
+
+ETAPAS = ("decode", "inferencia", "postproceso", "total")
+
+
+def percentiles(valores) -> dict:
+    if not valores:
+        return {"n": 0}
+    arr = np.asarray(valores, dtype=np.float64)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "n": int(arr.size),
+        "media_ms": round(float(arr.mean()), 2),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(arr.max()), 2),
+    }
+
+
+def cargar_muestras(datasets=None) -> list:
+    """Bytes de las fotos de los DATASETS de validación (las que existan en disco)."""
+    from app.tests.datasets import DATASETS, SAMPLES_DIR
+
+    muestras = []
+    for ds_name, items in DATASETS.items():
+        if datasets and ds_name not in datasets:
+            continue
+        for fname, _, _ in items:
+            ruta = os.path.join(SAMPLES_DIR, fname)
+            if os.path.exists(ruta):
+                with open(ruta, "rb") as f:
+                    muestras.append(f.read())
+    return muestras
+
+
+async def _ejecutar(model, muestras, concurrencia, lote, peticiones, max_wait_ms, workers) -> dict:
+    """Una combinación (concurrencia, tamaño de lote) del barrido."""
+    executor = InferenceExecutor(max_workers=workers, max_queue=max(concurrencia * 2, 1))
+    batcher = MicroBatcher(
+        lambda imgs: list(model.predict(imgs, save=False, verbose=False)),
+        max_batch_size=lote,
+        max_wait_ms=max_wait_ms,
+        executor=executor,
+    )
+    tiempos = {etapa: [] for etapa in ETAPAS}
+    siguiente = iter(range(peticiones))
+
+    async def cliente():
+        for i in siguiente:
+            datos = muestras[i % len(muestras)]
+            t0 = time.perf_counter()
+            image = await asyncio.to_thread(decodificar, datos)
+            t1 = time.perf_counter()
+            result = await batcher.submit(image)
+            t2 = time.perf_counter()
+            cls, conf = tensores_de_resultados([result])
+            agregar_por_clase(cls, conf, model.names)
+            t3 = time.perf_counter()
+            tiempos["decode"].append((t1 - t0) * 1000)
+            tiempos["inferencia"].append((t2 - t1) * 1000)
+            tiempos["postproceso"].append((t3 - t2) * 1000)
+            tiempos["total"].append((t3 - t0) * 1000)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+
+    await batcher.close()
+    executor.shutdown()
+    return {
+        "concurrencia": concurrencia,
+        "lote": lote,
+        "peticiones": peticiones,
+        "duracion_s": round(duracion, 3),
+        "throughput_rps": round(peticiones / duracion, 2) if duracion else 0.0,
+        "etapas": {etapa: percentiles(tiempos[etapa]) for etapa in ETAPAS},
+        "executor": executor.stats(),
+    }
+
+
+def ejecutar_benchmark(
+    model,
+    muestras,
+    niveles_concurrencia=(1, 2, 4, 8),
+    lotes=(1, 4, 8),
+    peticiones=100,
+    warmup=5,
+    max_wait_ms=10.0,
+    workers=1,
+    meta=None,
+) -> dict:
+    if not muestras:
+        raise ValueError("No hay muestras para el benchmark (¿existe app/tests/samples?)")
+
+    # Warm-up: primeras inferencias (carga perezosa, cachés de torch/ORT...)
+    for i in range(warmup):
+        model.predict(decodificar(muestras[i % len(muestras)]), save=False, verbose=False)
+
+    ejecuciones = []
+    for lote in lotes:
+        for concurrencia in niveles_concurrencia:
+            fila = asyncio.run(_ejecutar(model, muestras, concurrencia, lote, peticiones, max_wait_ms, workers))
+            print(
+                f"lote={lote:<3} concurrencia={concurrencia:<3} "
+                f"{fila['throughput_rps']:>7.2f} img/s | total p50={fila['etapas']['total']['p50_ms']} ms "
+                f"p95={fila['etapas']['total']['p95_ms']} ms p99={fila['etapas']['total']['p99_ms']} ms"
+            )
+            ejecuciones.append(fila)
+
+    return {
+        "meta": {
+            "fecha": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "muestras": len(muestras),
+            "warmup": warmup,
+            "max_wait_ms": max_wait_ms,
+            "workers": workers,
+            **(meta or {}),
+        },
+        "ejecuciones": ejecuciones,
+    }
+
+
+# --- Post-proceso: bucle por caja frente a group-by vectorizado ---
+
+class _Caja:
+    """Una caja como las de ultralytics: cls y conf son escalares tipo tensor."""
+
+    def __init__(self, cls, conf):
+        self.cls = np.array(cls)
+        self.conf = np.array(conf, dtype=np.float32)
+
+
+class _Cajas(list):
+    @property
+    def cls(self):
+        return np.array([c.cls for c in self])
+
+    @property
+    def conf(self):
+        return np.array([c.conf for c in self], dtype=np.float32)
+
+
+class _Resultado:
+    def __init__(self, cajas):
+        self.boxes = _Cajas(cajas)
+
+
+def resultados_aleatorios(n_cajas: int, n_clases: int, seed: int = 0) -> list:
+    rng = np.random.default_rng(seed)
+    clases = rng.integers(0, n_clases, n_cajas)
+    confs = rng.uniform(0.05, 0.99, n_cajas)
+    return [_Resultado([_Caja(c, f) for c, f in zip(clases, confs)])]
+
+
+def agregacion_por_caja(results, names) -> list:
+    """Implementación anterior de /ia/predict (bucle por caja), como referencia."""
+    class_confidences = {}
+    for r in results:
+        for box in r.boxes:
+            cls_id = int(box.cls)
+            conf = float(box.conf)
+            class_confidences.setdefault(names[cls_id], []).append(conf)
+    averaged = [{"variedad": cls, "confianza": round((sum(c) / len(c)) * 100, 2)}
+                for cls, c in class_confidences.items()]
+    averaged.sort(key=lambda x: x["confianza"], reverse=True)
+    return averaged
+
+
+def medir_postproceso(n_cajas: int, repeticiones: int = 5, n_clases: int = 20) -> dict:
+    """Milisegundos por imagen de cada agregación con `n_cajas` cajas (la mejor de `repeticiones`)."""
+    names = {i: f"clase_{i}" for i in range(n_clases)}
+    results = resultados_aleatorios(n_cajas, n_clases)
+    # Los tensores ya salen del modelo: el coste a comparar es solo la agregación
+    cls, conf = tensores_de_resultados(results)
+
+    def cronometrar(fn):
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            salida = fn()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return min(tiempos), salida
+
+    bucle_ms, esperado = cronometrar(lambda: agregacion_por_caja(results, names))
+    vector_ms, obtenido = cronometrar(lambda: agregar_por_clase(cls, conf, names))
+    if obtenido != esperado:
+        raise RuntimeError("La agregación vectorizada no coincide con el bucle por caja")
+    return {
+        "cajas": n_cajas,
+        "bucle_ms": round(bucle_ms, 3),
+        "vectorizada_ms": round(vector_ms, 3),
+        "mejora_x": round(bucle_ms / vector_ms, 1) if vector_ms else None,
+    }
+
+
+def benchmark_postproceso(tamanos, repeticiones: int = 5) -> dict:
+    filas = []
+    for n_cajas in tamanos:
+        fila = medir_postproceso(n_cajas, repeticiones)
+        print(
+            f"cajas={n_cajas:<7} bucle: {fila['bucle_ms']:>9.3f} ms | "
+            f"vectorizada: {fila['vectorizada_ms']:>7.3f} ms (x{fila['mejora_x']})"
+        )
+        filas.append(fila)
+    return {
+        "meta": {
+            "fecha": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "repeticiones": repeticiones,
+        },
+        "postproceso": filas,
+    }
+
+
+def _lista_enteros(texto: str):
+    return [int(x) for x in texto.split(",") if x.strip()]
+
+
+def main(argv=None):
+    from . import backends
+    from .model_loader import MODEL_PATH, ModelRegistry
+
+    parser = argparse.ArgumentParser(description="Benchmark de inferencia de VitIA")
+    parser.add_argument("--backend", default=backends.PYTORCH, choices=backends.BACKENDS)
+    parser.add_argument("--concurrencia", type=_lista_enteros, default=[1, 2, 4, 8])
+    parser.add_argument("--lotes", type=_lista_enteros, default=[1, 4, 8])
+    parser.add_argument("--peticiones", type=int, default=100, help="Peticiones por combinación")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=1, help="Hilos del pool de inferencia")
+    parser.add_argument("--datasets", nargs="*", help="Limitar a estos DATASETS")
+    parser.add_argument("--salida", default="benchmark_inferencia.json")
+    parser.add_argument(
+        "--postproceso", type=_lista_enteros, metavar="N[,N...]",
+        help="Solo la agregación de cajas, con N cajas por imagen (no carga el modelo)",
+    )
+    parser.add_argument("--repeticiones", type=int, default=5, help="Repeticiones de --postproceso")
+    args = parser.parse_args(argv)
+
+    if args.postproceso:
+        informe = benchmark_postproceso(args.postproceso, args.repeticiones)
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(informe, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados guardados en {args.salida}")
+        return
+
+    registro = ModelRegistry(MODEL_PATH, backend=args.backend)
+    model = registro.get()
+    muestras = cargar_muestras(args.datasets)
+
+    informe = ejecutar_benchmark(
+        model,
+        muestras,
+        niveles_concurrencia=args.concurrencia,
+        lotes=args.lotes,
+        peticiones=args.peticiones,
+        warmup=args.warmup,
+        max_wait_ms=args.max_wait_ms,
+        workers=args.workers,
+        meta={
+            "backend": args.backend,
+            "version_modelo": registro.version,
+            "tiempo_carga_ms": registro.tiempo_carga_ms,
+        },
+    )
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
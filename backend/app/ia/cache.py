@@ -0,0 +1,268 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+def hash_bytes(data: bytes) -> str:
+    """Clave exacta: SHA-256 de los bytes tal cual llegan del cliente."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_perceptual(image) -> int:
+    """
+    dHash de 64 bits: compara cada píxel con su vecino en una miniatura 9x8 en grises.
+    Dos fotos casi iguales (recompresión, pequeño reescalado) dan hashes a muy poca
+    distancia de Hamming.
+    """
+    from PIL import Image
+
+    gris = image.convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixeles = list(gris.getdata())
+    valor = 0
+    for fila in range(8):
+        for col in range(8):
+            izq = pixeles[fila * 9 + col]
+            der = pixeles[fila * 9 + col + 1]
+            valor = (valor << 1) | (1 if izq > der else 0)
+    return valor
+
+
+def distancia_hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class PredictionCache:
+    """
+    Caché de predicciones por contenido de la imagen.
+
+    - Memoria: LRU acotada a `max_entries` con caducidad `ttl_s`.
+    - Disco (opcional): un JSON por imagen en `disk_dir/<version_modelo>/`,
+      acotado a `disk_max_entries` ficheros (se borran primero los caducados
+      y después los usados hace más tiempo).
+    - Perceptual (opcional): si no hay acierto exacto, busca una imagen con
+      dHash a distancia <= `phash_max_dist`.
+
+    Todas las entradas pertenecen a una versión del modelo: si la versión
+    cambia, la memoria se vacía y el disco se lee de otro subdirectorio.
+
+    El disco nunca se toca con el lock cogido. Desde el event loop hay que usar
+    `aget`/`aset`, que hacen la lectura y la escritura en un hilo.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_s: float = 3600,
+        disk_dir: Optional[str] = None,
+        disk_max_entries: int = 10000,
+        phash: bool = False,
+        phash_max_dist: int = 4,
+    ):
+        self.max_entries = max(1, max_entries)
+        self.ttl_s = ttl_s
+        self.disk_dir = disk_dir
+        self.disk_max_entries = max(1, disk_max_entries)
+        self.phash = phash
+        self.phash_max_dist = phash_max_dist
+
+        self.version: Optional[str] = None
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[str, tuple]" = OrderedDict()  # clave -> (expira, valor, phash)
+        # El disco se recorta cada tanto (no en cada escritura) y de uno en uno
+        self._recortando = threading.Lock()
+        self._escrituras_disco = 0
+        self._cada_recorte = max(1, self.disk_max_entries // 10)
+
+        self.hits = 0
+        self.hits_disco = 0
+        self.hits_perceptual = 0
+        self.misses = 0
+
+    # --- Versión del modelo ---
+
+    def _comprobar_version(self, version: str):
+        if version != self.version:
+            self._entradas.clear()
+            self.version = version
+
+    def invalidar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    # --- Disco ---
+
+    def _ruta_disco(self, clave: str, version: str) -> Optional[str]:
+        if not self.disk_dir or not version:
+            return None
+        return os.path.join(self.disk_dir, version.replace(os.sep, "_"), clave + ".json")
+
+    def _leer_disco(self, clave: str, version: str):
+        ruta = self._ruta_disco(clave, version)
+        if not ruta or not os.path.exists(ruta):
+            return None
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if time.time() - data.get("creado", 0) > self.ttl_s:
+                return None
+            # La fecha del fichero marca el último uso: el recorte empieza por las más antiguas
+            os.utime(ruta)
+        except (OSError, ValueError):
+            return None
+        return data["valor"]
+
+    def _escribir_disco(self, clave: str, valor, version: str):
+        ruta = self._ruta_disco(clave, version)
+        if not ruta:
+            return
+        try:
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            tmp = ruta + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"creado": time.time(), "valor": valor}, f)
+            os.replace(tmp, ruta)
+        except OSError as e:
+            print(f"No se pudo escribir la caché en disco: {e}")
+            return
+        with self._lock:
+            self._escrituras_disco += 1
+            recortar = self._escrituras_disco % self._cada_recorte == 0
+        if recortar:
+            self.recortar_disco()
+
+    def recortar_disco(self) -> int:
+        """
+        Borra del disco las entradas caducadas y, si aún hay más de
+        `disk_max_entries`, las usadas hace más tiempo (incluidas las de
+        versiones retiradas del modelo). Devuelve cuántas ha borrado.
+        """
+        if not self.disk_dir or not self._recortando.acquire(blocking=False):
+            return 0
+        try:
+            ficheros = []
+            for raiz, _, nombres in os.walk(self.disk_dir):
+                for nombre in nombres:
+                    if not nombre.endswith(".json"):
+                        continue
+                    ruta = os.path.join(raiz, nombre)
+                    try:
+                        ficheros.append((os.stat(ruta).st_mtime, ruta))
+                    except OSError:
+                        continue
+            ficheros.sort()
+            caducado = time.time() - self.ttl_s
+            sobran = len(ficheros) - self.disk_max_entries
+            borradas = 0
+            for i, (usado, ruta) in enumerate(ficheros):
+                if i >= sobran and usado >= caducado:
+                    break
+                try:
+                    os.remove(ruta)
+                    borradas += 1
+                except OSError:
+                    continue
+            return borradas
+        finally:
+            self._recortando.release()
+
+    # --- API ---
+
+    def _guardar_memoria(self, clave: str, valor, phash_valor: Optional[int]):
+        self._entradas[clave] = (time.monotonic() + self.ttl_s, valor, phash_valor)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entries:
+            self._entradas.popitem(last=False)
+
+    def _get_memoria(self, clave: str, version: str):
+        with self._lock:
+            self._comprobar_version(version)
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                expira, valor, _ = entrada
+                if expira >= time.monotonic():
+                    self._entradas.move_to_end(clave)
+                    self.hits += 1
+                    return valor
+                del self._entradas[clave]
+            return None
+
+    def _get_disco(self, clave: str, version: str):
+        valor = self._leer_disco(clave, version)
+        if valor is None:
+            return None
+        with self._lock:
+            # Solo se sube a memoria si la versión no ha cambiado mientras leíamos
+            if version == self.version:
+                self._guardar_memoria(clave, valor, None)
+            self.hits += 1
+            self.hits_disco += 1
+        return valor
+
+    def get(self, clave: str, version: str):
+        """Busca por clave exacta (memoria y después disco). None si no hay acierto."""
+        valor = self._get_memoria(clave, version)
+        if valor is None and self.disk_dir:
+            valor = self._get_disco(clave, version)
+        return valor
+
+    async def aget(self, clave: str, version: str):
+        """Como `get`, pero la lectura de disco va en un hilo y no bloquea el event loop."""
+        valor = self._get_memoria(clave, version)
+        if valor is None and self.disk_dir:
+            valor = await asyncio.to_thread(self._get_disco, clave, version)
+        return valor
+
+    def get_perceptual(self, phash_valor: int, version: str):
+        """Busca una imagen casi idéntica por dHash. None si no hay acierto."""
+        if not self.phash:
+            return None
+        with self._lock:
+            self._comprobar_version(version)
+            ahora = time.monotonic()
+            for clave, (expira, valor, otro) in reversed(self._entradas.items()):
+                if otro is None or expira < ahora:
+                    continue
+                if distancia_hamming(phash_valor, otro) <= self.phash_max_dist:
+                    self._entradas.move_to_end(clave)
+                    self.hits += 1
+                    self.hits_perceptual += 1
+                    return valor
+            return None
+
+    def registrar_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _set_memoria(self, clave: str, valor, version: str, phash_valor: Optional[int]):
+        with self._lock:
+            self._comprobar_version(version)
+            self._guardar_memoria(clave, valor, phash_valor)
+
+    def set(self, clave: str, valor, version: str, phash_valor: Optional[int] = None):
+        self._set_memoria(clave, valor, version, phash_valor)
+        self._escribir_disco(clave, valor, version)
+
+    async def aset(self, clave: str, valor, version: str, phash_valor: Optional[int] = None):
+        """Como `set`, pero la escritura en disco va en un hilo."""
+        self._set_memoria(clave, valor, version, phash_valor)
+        if self.disk_dir:
+            await asyncio.to_thread(self._escribir_disco, clave, valor, version)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "version_modelo": self.version,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entries,
+                "hits": self.hits,
+                "hits_disco": self.hits_disco,
+                "hits_perceptual": self.hits_perceptual,
+                "misses": self.misses,
+                "ratio_hit": round(self.hits / total, 4) if total else 0.0,
+            }
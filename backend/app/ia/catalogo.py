@@ -0,0 +1,133 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+from ..config import settings
+
+
+def normalizar_nombre(nombre: str) -> str:
+    """'  merlot  noir' y 'Merlot Noir' son la misma variedad."""
+    return " ".join(nombre.split()).casefold()
+
+
+def _resumen(variedad) -> dict:
+    links = variedad.links_imagenes or []
+    return {
+        "id_variedad": variedad.id_variedad,
+        "nombre": variedad.nombre,
+        "color": variedad.color,
+        "imagen": links[0] if links else None,
+    }
+
+
+class CatalogoVariedades:
+    """
+    Índice en memoria de la biblioteca de variedades para resolver las
+    predicciones sin consultar la base de datos: clase del modelo
+    (`model.names`) -> `Variedad.id_variedad` + un resumen de la ficha.
+
+    Se carga la primera vez que hace falta (o al arrancar) y se invalida al
+    crear, editar o borrar variedades (desde las rutas de la biblioteca). Cada worker tiene el suyo, así que
+    además caduca cada `ttl_s` para ver los cambios hechos en otros workers.
+    """
+
+    def __init__(self, ttl_s: float = 300):
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._por_nombre: Dict[str, dict] = {}  # nombre normalizado -> resumen
+        self._por_id: Dict[int, dict] = {}
+        self._por_clase: Dict[int, Optional[dict]] = {}  # clase del modelo -> resumen
+        self._por_nombre_clase: Dict[str, Optional[dict]] = {}  # names[clase] -> resumen
+        self._version_clases = None
+        self._cargado_en: Optional[float] = None
+        self.cargas = 0
+
+    @property
+    def vigente(self) -> bool:
+        cargado_en = self._cargado_en
+        return cargado_en is not None and time.monotonic() - cargado_en < self.ttl_s
+
+    def invalidar(self):
+        self._cargado_en = None
+
+    def cargar(self, db):
+        """Lee toda la biblioteca (una consulta) y rehace el índice."""
+        from .. import models
+
+        variedades = db.query(models.Variedad).all()
+        por_id = {v.id_variedad: _resumen(v) for v in variedades}
+        por_nombre = {normalizar_nombre(r["nombre"]): r for r in por_id.values()}
+        with self._lock:
+            self._por_id, self._por_nombre = por_id, por_nombre
+            # Las clases se vuelven a enlazar con los nombres nuevos; hasta
+            # entonces no puede quedar ninguna apuntando a una variedad borrada
+            self._por_clase, self._por_nombre_clase = {}, {}
+            self._version_clases = None
+            self._cargado_en = time.monotonic()
+            self.cargas += 1
+
+    def asegurar(self, db):
+        """Carga el índice si no está cargado o ha caducado."""
+        if not self.vigente:
+            self.cargar(db)
+
+    def agregar(self, variedad):
+        """Añade una variedad recién creada sin recargar todo."""
+        resumen = _resumen(variedad)
+        with self._lock:
+            self._por_id[resumen["id_variedad"]] = resumen
+            self._por_nombre[normalizar_nombre(resumen["nombre"])] = resumen
+            self._version_clases = None
+
+    def enlazar(self, names: Dict[int, str], version: str):
+        """Índice clase -> variedad para los `names` de una versión del modelo."""
+        if version == self._version_clases:
+            return
+        with self._lock:
+            self._por_clase = {
+                int(clase): self._por_nombre.get(normalizar_nombre(nombre)) for clase, nombre in names.items()
+            }
+            self._por_nombre_clase = {names[clase]: r for clase, r in self._por_clase.items()}
+            self._version_clases = version
+        sin_variedad = [names[c] for c, r in self._por_clase.items() if r is None]
+        if sin_variedad:
+            print(f"Model classes without a Variedad record: {sin_variedad}")
+
+    # --- Consultas (sin base de datos) ---
+
+    def por_clase(self, clase: int) -> Optional[dict]:
+        return self._por_clase.get(clase)
+
+    def por_nombre(self, nombre: str) -> Optional[dict]:
+        resumen = self._por_nombre_clase.get(nombre)
+        if resumen is None:
+            resumen = self._por_nombre.get(normalizar_nombre(nombre))
+        return resumen
+
+    def por_id(self, id_variedad: int) -> Optional[dict]:
+        return self._por_id.get(id_variedad)
+
+    def anotar(self, predicciones: List[dict]) -> List[dict]:
+        """Añade `id_variedad` y `resumen` a cada predicción (None si no está en la biblioteca)."""
+        anotadas = []
+        for pred in predicciones:
+            resumen = self.por_nombre(pred["variedad"])
+            anotadas.append({
+                **pred,
+                "id_variedad": resumen["id_variedad"] if resumen else None,
+                "resumen": resumen,
+            })
+        return anotadas
+
+    def stats(self) -> dict:
+        return {
+            "variedades": len(self._por_id),
+            "clases_enlazadas": sum(1 for r in self._por_clase.values() if r is not None),
+            "clases": len(self._por_clase),
+            "vigente": self.vigente,
+            "cargas": self.cargas,
+        }
+
+
+# Catálogo único del proceso
+catalogo = CatalogoVariedades(ttl_s=settings.IA_CATALOGO_TTL_S)
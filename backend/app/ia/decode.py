@@ -0,0 +1,60 @@
+import io
+
+from PIL import Image, ImageOps
+
+# Tamaño de los trozos al leer la subida (1 MB)
+CHUNK_SIZE = 1024 * 1024
+
+
+class ImagenDemasiadoGrande(ValueError):
+    """La subida supera el límite de bytes o de píxeles (se traduce a un 413)."""
+
+
+async def leer_limitado(file, max_bytes: int) -> bytes:
+    """
+    Lee un UploadFile por trozos y corta en cuanto supera `max_bytes`,
+    sin llegar a cargar en memoria una subida gigante entera.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise ImagenDemasiadoGrande(f"File too large ({file.size} bytes). Max: {max_bytes}")
+
+    partes = []
+    total = 0
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise ImagenDemasiadoGrande(f"File too large (> {max_bytes} bytes)")
+        partes.append(chunk)
+    return b"".join(partes)
+
+
+def decodificar(image_bytes: bytes, max_lado: int = 1280, max_pixeles: int = 60_000_000) -> Image.Image:
+    """
+    Decodifica directamente cerca de la resolución de entrada del modelo.
+
+    1. Lee solo la cabecera y rechaza imágenes con más de `max_pixeles`
+       (evita "bombas" de descompresión) antes de tocar los píxeles.
+    2. En JPEG usa el modo draft: libjpeg decodifica a 1/2, 1/4 u 1/8 de escala,
+       así una foto de 48 MP nunca se expande entera en memoria.
+    3. Aplica la orientación EXIF (las fotos de móvil vienen giradas).
+    4. Reduce con thumbnail hasta que el lado mayor sea `max_lado`.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+
+    ancho, alto = image.size
+    if ancho * alto > max_pixeles:
+        raise ImagenDemasiadoGrande(f"Image too large ({ancho}x{alto} px). Max: {max_pixeles} px")
+
+    if image.format == "JPEG":
+        # draft elige la mayor reducción que deja la imagen >= max_lado
+        image.draft("RGB", (max_lado, max_lado))
+
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("RGB")
+
+    if max(image.size) > max_lado:
+        image.thumbnail((max_lado, max_lado), Image.Resampling.BILINEAR)
+    return image
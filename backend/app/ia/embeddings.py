@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+from .postproceso import _a_numpy
+
+
+class EmbeddingsNoDisponibles(RuntimeError):
+    """El modelo en servicio no permite extraer embeddings (p. ej. ONNX/OpenVINO)."""
+
+
+def normalizar(vectores: np.ndarray) -> np.ndarray:
+    """Normaliza por filas (norma L2 = 1): la similitud coseno pasa a ser un producto escalar."""
+    normas = np.linalg.norm(vectores, axis=1, keepdims=True)
+    return (vectores / np.maximum(normas, 1e-12)).astype(np.float32)
+
+
+def extraer_embeddings(model, images) -> np.ndarray:
+    """
+    Un vector por imagen sacado del backbone de YOLO: `model.embed` devuelve
+    la salida promediada de la penúltima capa (antes de la cabeza de detección).
+    """
+    if not hasattr(model, "embed"):
+        raise EmbeddingsNoDisponibles("El modelo no expone embed()")
+    try:
+        vectores = model.embed(images, verbose=False)
+    except (NotImplementedError, AttributeError, TypeError) as e:
+        raise EmbeddingsNoDisponibles(str(e))
+    return normalizar(np.stack([_a_numpy(v).reshape(-1) for v in vectores]).astype(np.float32))
+
+
+class IndiceVectorial:
+    """
+    Índice en memoria de vectores normalizados (similitud = producto escalar).
+
+    - Fuerza bruta: una multiplicación matriz-vector con NumPy; con decenas de
+      miles de fotos tarda pocos milisegundos y es exacta.
+    - IVF (aproximado) a partir de `min_ann` vectores: k-means reparte los
+      vectores en ~sqrt(n) listas y cada búsqueda solo compara con las
+      `nprobe` listas de centroides más cercanos a la consulta.
+
+    Admite altas y bajas incrementales. Cada vector lleva metadatos (dict) y,
+    aparte, `id_usuario` e `id_variedad` como arrays para filtrar sin bucles.
+
+    El k-means no corre dentro de `agregar`: este solo dice si toca (re)entrenar
+    y `entrenar` hace el trabajo sin el lock (las búsquedas siguen atendiéndose).
+    Desde el event loop, `entrenar` va en un hilo.
+    """
+
+    def __init__(self, min_ann: int = 20000, nprobe: int = 8, semilla: int = 0):
+        self.min_ann = min_ann
+        self.nprobe = nprobe
+        self._rng = np.random.default_rng(semilla)
+        self._lock = threading.Lock()
+
+        self._n = 0
+        self._vectores: Optional[np.ndarray] = None  # (capacidad, dim)
+        self._activo = np.zeros(0, dtype=bool)
+        self._id_usuario = np.zeros(0, dtype=np.int64)  # -1 = foto de referencia
+        self._id_variedad = np.zeros(0, dtype=np.int64)
+        self.metadatos: List[Optional[dict]] = []
+        self._posicion = {}  # clave -> fila
+
+        # IVF
+        self._centroides: Optional[np.ndarray] = None
+        self._lista = np.zeros(0, dtype=np.int32)
+        self._n_entrenado = 0
+        self._entrenando = False
+
+    def __len__(self) -> int:
+        return int(self._activo[: self._n].sum())
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._vectores is None else self._vectores.shape[1]
+
+    @property
+    def usa_ann(self) -> bool:
+        return self._centroides is not None
+
+    # --- Altas y bajas ---
+
+    def _reservar(self, extra: int, dim: int):
+        capacidad = 0 if self._vectores is None else self._vectores.shape[0]
+        if self._n + extra <= capacidad:
+            return
+        nueva = max(1024, 2 * capacidad, self._n + extra)
+        vectores = np.zeros((nueva, dim), dtype=np.float32)
+        if self._vectores is not None:
+            vectores[: self._n] = self._vectores[: self._n]
+        self._vectores = vectores
+        for nombre, dtype in (("_activo", bool), ("_id_usuario", np.int64), ("_id_variedad", np.int64), ("_lista", np.int32)):
+            viejo = getattr(self, nombre)
+            nuevo = np.zeros(nueva, dtype=dtype)
+            nuevo[: len(viejo)] = viejo
+            setattr(self, nombre, nuevo)
+
+    def agregar(self, vectores: np.ndarray, metadatos: List[dict]) -> bool:
+        """
+        Añade vectores (ya normalizados). Cada dict de metadatos debe tener
+        `clave` (única), `id_variedad` y, si es un avistamiento, `id_usuario`.
+        Una clave repetida sustituye a la anterior.
+
+        Devuelve True si toca (re)entrenar el IVF: al cruzar `min_ann` y cada
+        vez que el índice dobla su tamaño (ver `entrenar`).
+        """
+        vectores = np.asarray(vectores, dtype=np.float32)
+        if len(vectores) == 0:
+            return False
+        with self._lock:
+            for meta in metadatos:
+                self._eliminar(meta["clave"])
+            self._reservar(len(vectores), vectores.shape[1])
+            inicio, fin = self._n, self._n + len(vectores)
+            self._vectores[inicio:fin] = vectores
+            self._activo[inicio:fin] = True
+            self._id_usuario[inicio:fin] = [m.get("id_usuario") or -1 for m in metadatos]
+            self._id_variedad[inicio:fin] = [m.get("id_variedad") or -1 for m in metadatos]
+            for fila, meta in enumerate(metadatos, start=inicio):
+                self._posicion[meta["clave"]] = fila
+            self.metadatos.extend(metadatos)
+            self._n = fin
+
+            if self._centroides is not None:
+                self._lista[inicio:fin] = self._asignar(vectores, self._centroides)
+            return self._toca_entrenar() and not self._entrenando
+
+    def _eliminar(self, clave) -> bool:
+        fila = self._posicion.pop(clave, None)
+        if fila is None:
+            return False
+        self._activo[fila] = False
+        self.metadatos[fila] = None
+        return True
+
+    def eliminar(self, clave) -> bool:
+        with self._lock:
+            return self._eliminar(clave)
+
+    # --- IVF ---
+
+    @staticmethod
+    def _asignar(vectores: np.ndarray, centroides: np.ndarray) -> np.ndarray:
+        return np.argmax(vectores @ centroides.T, axis=1).astype(np.int32)
+
+    def _toca_entrenar(self) -> bool:
+        return self._n >= self.min_ann and self._n >= 2 * self._n_entrenado
+
+    def _kmeans(self, datos: np.ndarray, iteraciones: int) -> np.ndarray:
+        """k-means esférico: centroides normalizados de ~sqrt(n) listas."""
+        n_listas = max(1, int(np.sqrt(len(datos))))
+        centroides = datos[self._rng.choice(len(datos), n_listas, replace=False)]
+        for _ in range(iteraciones):
+            asignacion = np.argmax(datos @ centroides.T, axis=1)
+            sumas = np.zeros_like(centroides)
+            np.add.at(sumas, asignacion, datos)
+            vacios = ~np.bincount(asignacion, minlength=n_listas).astype(bool)
+            sumas[vacios] = centroides[vacios]
+            centroides = normalizar(sumas)
+        return centroides
+
+    def entrenar(self, iteraciones: int = 10) -> bool:
+        """
+        (Re)entrena el IVF si toca. El k-means y la asignación de listas corren
+        sin el lock sobre las filas que había al empezar (las filas ya escritas
+        no cambian: las altas van al final y las bajas solo tocan `_activo`);
+        con el lock solo se instalan los centroides y se asignan las filas
+        añadidas mientras tanto. Devuelve True si ha entrenado.
+        """
+        with self._lock:
+            if self._entrenando or not self._toca_entrenar():
+                return False
+            self._entrenando = True
+            n, vectores = self._n, self._vectores
+            activos = self._activo[:n].copy()
+        try:
+            centroides = self._kmeans(vectores[:n][activos], iteraciones)
+            lista = self._asignar(vectores[:n], centroides)
+            with self._lock:
+                self._centroides = centroides
+                self._lista[:n] = lista
+                if self._n > n:
+                    self._lista[n:self._n] = self._asignar(self._vectores[n:self._n], centroides)
+                self._n_entrenado = n
+            return True
+        finally:
+            with self._lock:
+                self._entrenando = False
+
+    # --- Búsqueda ---
+
+    def buscar(self, vector: np.ndarray, k: int = 10, id_usuario_visible: Optional[int] = None, exacta: bool = False):
+        """
+        Los `k` vectores más parecidos a `vector`: lista de (similitud, metadatos).
+        Con `id_usuario_visible` solo se devuelven fotos de referencia y
+        avistamientos de ese usuario.
+        """
+        vector = normalizar(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            if self._n == 0:
+                return []
+            mascara = self._activo[: self._n].copy()
+            if id_usuario_visible is not None:
+                usuarios = self._id_usuario[: self._n]
+                mascara &= (usuarios == -1) | (usuarios == id_usuario_visible)
+            if self._centroides is not None and not exacta:
+                cercanas = np.argsort(self._centroides @ vector)[::-1][: self.nprobe]
+                mascara &= np.isin(self._lista[: self._n], cercanas)
+            filas = np.flatnonzero(mascara)
+            if len(filas) == 0:
+                return []
+            similitudes = self._vectores[filas] @ vector
+            k = min(k, len(filas))
+            mejores = np.argpartition(-similitudes, k - 1)[:k]
+            mejores = mejores[np.argsort(-similitudes[mejores], kind="stable")]
+            return [(float(similitudes[i]), self.metadatos[filas[i]]) for i in mejores]
+
+    # --- Persistencia ---
+
+    def guardar(self, ruta: str, version: str):
+        """Escribe en un temporal y lo renombra: un fallo a mitad no deja un fichero a medias."""
+        with self._lock:
+            filas = np.flatnonzero(self._activo[: self._n])
+            vectores = self._vectores[filas] if len(filas) else np.zeros((0, 0), dtype=np.float32)
+            metadatos = json.dumps([self.metadatos[i] for i in filas])
+        tmp = ruta + ".tmp"
+        try:
+            # Con un fichero abierto np.savez no añade ".npz" al nombre
+            with open(tmp, "wb") as f:
+                np.savez(f, vectores=vectores, metadatos=metadatos, version=version)
+            os.replace(tmp, ruta)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    @classmethod
+    def cargar(cls, ruta: str, **kwargs):
+        """Devuelve (indice, version_del_modelo) de un fichero creado con `guardar`."""
+        with np.load(ruta, allow_pickle=False) as datos:
+            indice = cls(**kwargs)
+            indice.agregar(datos["vectores"], json.loads(str(datos["metadatos"])))
+            version = str(datos["version"])
+        indice.entrenar()
+        return indice, version
@@ -0,0 +1,162 @@
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Carriles de admisión: los usuarios premium no esperan detrás de los gratuitos
+CARRIL_PREMIUM = "premium"
+CARRIL_GRATIS = "gratis"
+CARRILES = (CARRIL_PREMIUM, CARRIL_GRATIS)
+
+
+class InferenciaSaturada(Exception):
+    """
+    Se lanza cuando la cola de inferencia está llena o la petición no llegaría
+    a tiempo (se traduce a un 503 con `Retry-After`).
+    """
+
+    def __init__(self, mensaje: str, retry_after_s: int = 1):
+        super().__init__(mensaje)
+        self.retry_after_s = max(1, int(retry_after_s))
+
+
+class PlazoAgotado(InferenciaSaturada):
+    """La petición superó su plazo mientras esperaba en la cola (no llegó a inferirse)."""
+
+
+class InferenceExecutor:
+    """
+    Pool de hilos dedicado a la inferencia, separado del event loop de uvicorn
+    y del executor por defecto (que usan las rutas síncronas de FastAPI).
+
+    - `max_workers`: hilos que ejecutan model.predict en paralelo.
+    - `max_queue`: peticiones admitidas a la vez (en espera + ejecutándose).
+      Si se supera, `admitir()` lanza InferenciaSaturada.
+    - `reserva_premium`: plazas de `max_queue` que solo puede ocupar el carril
+      premium, para que un pico de usuarios gratuitos no lo deje fuera.
+
+    Además, `admitir()` rechaza de entrada las peticiones que no podrían
+    cumplir su plazo según la cola que tienen delante y el tiempo medio de un
+    lote: mejor un 503 inmediato que gastar CPU en una respuesta que llegará tarde.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 64, reserva_premium: int = 0):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(1, max_queue)
+        self.reserva_premium = min(max(0, reserva_premium), self.max_queue - 1)
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ia-inferencia")
+
+        self._lock = threading.Lock()
+        self._pendientes = {carril: 0 for carril in CARRILES}
+        self._rechazadas = {carril: 0 for carril in CARRILES}
+        self._descartadas_plazo = 0
+        self._en_ejecucion = 0
+        self._tareas = 0
+        self._espera_total_ms = 0.0
+        self._espera_max_ms = 0.0
+        self._espera_ultima_ms = 0.0
+        self._servicio_medio_ms: Optional[float] = None  # Media móvil de la duración de un lote
+
+    @property
+    def pendientes(self) -> int:
+        """Peticiones admitidas que aún no tienen resultado (todas los carriles)."""
+        return sum(self._pendientes.values())
+
+    # --- Control de admisión (por petición) ---
+
+    def _espera_estimada_ms(self, carril: str, lote: int, n: int = 1) -> float:
+        """Tiempo hasta que se infieran `n` peticiones nuevas de `carril` (llamar con el lock)."""
+        if not self._servicio_medio_ms:
+            return 0.0
+        delante = self._pendientes[CARRIL_PREMIUM]
+        if carril == CARRIL_GRATIS:
+            delante += self._pendientes[CARRIL_GRATIS]
+        # Lotes por delante + el suyo, que el batcher reparte entre los `max_workers` hilos
+        lotes = math.ceil((delante + n) / max(1, lote))
+        return math.ceil(lotes / self.max_workers) * self._servicio_medio_ms
+
+    def admitir(self, carril: str = CARRIL_GRATIS, plazo_s: Optional[float] = None, lote: int = 1, n: int = 1):
+        """
+        Reserva `n` plazas de `carril` (todas o ninguna): una petición de varias
+        imágenes se admite entera o se rechaza entera, sin inferir la mitad.
+        """
+        n = max(1, n)
+        with self._lock:
+            total = sum(self._pendientes.values())
+            limite = self.max_queue if carril == CARRIL_PREMIUM else self.max_queue - self.reserva_premium
+            if total + n > self.max_queue or (carril != CARRIL_PREMIUM and self._pendientes[carril] + n > limite):
+                self._rechazadas[carril] += 1
+                raise InferenciaSaturada(f"Cola de inferencia llena ({total}/{self.max_queue})")
+
+            if plazo_s is not None:
+                espera_ms = self._espera_estimada_ms(carril, lote, n)
+                if espera_ms > plazo_s * 1000:
+                    self._rechazadas[carril] += 1
+                    raise InferenciaSaturada(
+                        f"La inferencia no terminaría a tiempo (espera estimada {espera_ms:.0f} ms)",
+                        retry_after_s=math.ceil((espera_ms - plazo_s * 1000) / 1000),
+                    )
+            self._pendientes[carril] += n
+
+    def liberar(self, carril: str = CARRIL_GRATIS, n: int = 1):
+        with self._lock:
+            self._pendientes[carril] = max(0, self._pendientes[carril] - n)
+
+    def descartar_por_plazo(self):
+        with self._lock:
+            self._descartadas_plazo += 1
+
+    # --- Ejecución ---
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Ejecuta `fn(*args)` en el pool y mide cuánto esperó en la cola."""
+        encolada = time.perf_counter()
+
+        def _tarea():
+            inicio = time.perf_counter()
+            espera_ms = (inicio - encolada) * 1000
+            with self._lock:
+                self._tareas += 1
+                self._en_ejecucion += 1
+                self._espera_total_ms += espera_ms
+                self._espera_ultima_ms = espera_ms
+                self._espera_max_ms = max(self._espera_max_ms, espera_ms)
+            try:
+                return fn(*args)
+            finally:
+                servicio_ms = (time.perf_counter() - inicio) * 1000
+                with self._lock:
+                    self._en_ejecucion -= 1
+                    if self._servicio_medio_ms is None:
+                        self._servicio_medio_ms = servicio_ms
+                    else:
+                        self._servicio_medio_ms = 0.8 * self._servicio_medio_ms + 0.2 * servicio_ms
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, _tarea)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "cola_maxima": self.max_queue,
+                "reserva_premium": self.reserva_premium,
+                "pendientes": sum(self._pendientes.values()),
+                "pendientes_premium": self._pendientes[CARRIL_PREMIUM],
+                "pendientes_gratis": self._pendientes[CARRIL_GRATIS],
+                "en_ejecucion": self._en_ejecucion,
+                "rechazadas": sum(self._rechazadas.values()),
+                "rechazadas_premium": self._rechazadas[CARRIL_PREMIUM],
+                "rechazadas_gratis": self._rechazadas[CARRIL_GRATIS],
+                "descartadas_plazo": self._descartadas_plazo,
+                "tareas": self._tareas,
+                "servicio_medio_ms": round(self._servicio_medio_ms or 0.0, 2),
+                "espera_media_ms": round(self._espera_total_ms / self._tareas, 2) if self._tareas else 0.0,
+                "espera_ultima_ms": round(self._espera_ultima_ms, 2),
+                "espera_max_ms": round(self._espera_max_ms, 2),
+            }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,326 @@
-from ultralytics import YOLO
+import asyncio
+import hashlib
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from . import backends
+from ..config import settings
 
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "best2.pt")
 
-print(f"Loading YOLO model from {MODEL_PATH}...")
-# load once
-model = YOLO(MODEL_PATH)
 
-print("YOLO model loaded.")
+def version_de(path: str, backend: str = backends.PYTORCH) -> str:
+    """Identifica unos pesos + backend: cambia si se sustituye el fichero."""
+    try:
+        st = os.stat(path)
+        firma = f"{st.st_size}-{int(st.st_mtime)}"
+    except OSError:
+        firma = "sin-pesos"
+    nombre = os.path.splitext(os.path.basename(path))[0]
+    return f"{nombre}-{hashlib.sha1(firma.encode()).hexdigest()[:8]}-{backend}"
+
+
+class ModeloCargado:
+    """Una versión del modelo en memoria y cuántas inferencias la están usando."""
+
+    def __init__(self, model, version: str, path: str):
+        self.model = model
+        self.version = version
+        self.path = path
+        self.en_vuelo = 0
+        self.retirado = False
+        self.cargado_en = time.time()
+
+
+class ModelRegistry:
+    """
+    Carga perezosa y versionada del modelo YOLO.
+
+    Ni ultralytics ni los pesos se cargan al importar este módulo: se cargan
+    la primera vez que alguien llama a `get()` o durante el `warmup()`
+    explícito. Así los procesos que no sirven /ia (tests, Alembic, scripts)
+    arrancan rápido y no ocupan cientos de MB.
+
+    `backend` elige cómo se sirve el modelo (ver app/ia/backends.py).
+    Con `serving_mode="sidecar"` no se cargan pesos en este proceso: se usa un
+    `ModeloRemoto` que infiere en el sidecar compartido (ver app/ia/sidecar.py).
+
+    Cambio en caliente: `cambiar()` carga y calienta otra versión sin tocar la
+    que está en servicio y después las intercambia de forma atómica. Las
+    inferencias en curso terminan con la versión que adquirieron; la antigua
+    se libera cuando acaba la última. Con `models_dir` se sirve el `.pt` más
+    reciente de ese directorio y `vigilar()` detecta los nuevos.
+    """
+
+    NO_CARGADO = "no_cargado"
+    CARGANDO = "cargando"
+    LISTO = "listo"
+    ERROR = "error"
+
+    def __init__(
+        self,
+        path: str,
+        backend: str = backends.PYTORCH,
+        serving_mode: str = "local",
+        models_dir: Optional[str] = None,
+    ):
+        self.path = path
+        self.backend = backend
+        self.serving_mode = serving_mode
+        self.models_dir = models_dir
+        self._actual: Optional[ModeloCargado] = None
+        self._retirados = []
+        self._lock = threading.Lock()
+        self._cambio_lock = threading.Lock()  # Un solo cambio de versión a la vez
+        self.estado = self.NO_CARGADO
+        self.tiempo_carga_ms = None
+        self.tiempo_warmup_ms = None
+        self.error = None
+        self.cambiando = False
+        self.cambios = []  # Historial de cambios de versión (los últimos 10)
+        self._version_fallida = None
+
+    @property
+    def listo(self) -> bool:
+        return self.estado == self.LISTO
+
+    @property
+    def version(self) -> str:
+        """Versión en servicio (o la que se cargará si aún no hay ninguna)."""
+        actual = self._actual
+        if actual is not None:
+            return getattr(actual.model, "version_remota", None) or actual.version
+        return version_de(self.candidato() or self.path, self.backend)
+
+    def candidato(self) -> Optional[str]:
+        """Pesos que deberían estar en servicio: el .pt más reciente de `models_dir`, o `path`."""
+        if not self.models_dir:
+            return self.path
+        try:
+            pesos = [
+                os.path.join(self.models_dir, f)
+                for f in os.listdir(self.models_dir)
+                if f.endswith(".pt")
+            ]
+        except OSError:
+            return None
+        return max(pesos, key=os.path.getmtime) if pesos else None
+
+    def get(self):
+        """Devuelve el modelo en servicio, cargándolo la primera vez (thread-safe)."""
+        actual = self._actual
+        if actual is not None:
+            return actual.model
+
+        with self._lock:
+            if self._actual is None:
+                self._load()
+        return self._actual.model
+
+    def _cargar(self, path: str):
+        if self.serving_mode == "sidecar":
+            from .sidecar import ModeloRemoto
+
+            print(f"Connecting to inference sidecar at {settings.IA_SIDECAR_SOCKET}...")
+            return ModeloRemoto(settings.IA_SIDECAR_SOCKET)
+
+        print(f"Loading YOLO model from {path} (backend: {self.backend})...")
+        if settings.IA_TORCH_THREADS:
+            # Con varios workers por nodo, evita que cada uno use todos los núcleos
+            import torch
+            torch.set_num_threads(settings.IA_TORCH_THREADS)
+        return backends.cargar_modelo(path, self.backend)
+
+    def _load(self):
+        self.estado = self.CARGANDO
+        path = self.candidato() or self.path
+        inicio = time.perf_counter()
+        try:
+            model = self._cargar(path)
+        except Exception as e:
+            self.estado = self.ERROR
+            self.error = str(e)
+            raise
+        self._actual = ModeloCargado(model, version_de(path, self.backend), path)
+        self.tiempo_carga_ms = round((time.perf_counter() - inicio) * 1000, 2)
+        self.error = None
+        self.estado = self.LISTO
+        print(f"YOLO model loaded in {self.tiempo_carga_ms} ms.")
+
+    @staticmethod
+    def _calentar(model) -> float:
+        from PIL import Image
+
+        inicio = time.perf_counter()
+        model.predict(Image.new("RGB", (64, 64)), save=False, verbose=False)
+        return round((time.perf_counter() - inicio) * 1000, 2)
+
+    def warmup(self):
+        """Carga el modelo y hace una inferencia en vacío para calentar."""
+        model = self.get()
+        self.tiempo_warmup_ms = self._calentar(model)
+        return model
+
+    # --- Versiones en servicio ---
+
+    @contextmanager
+    def adquirir(self):
+        """Reserva la versión en servicio mientras dura una inferencia."""
+        self.get()
+        with self._lock:
+            entrada = self._actual
+            entrada.en_vuelo += 1
+        try:
+            yield entrada
+        finally:
+            with self._lock:
+                entrada.en_vuelo -= 1
+                if entrada.retirado and entrada.en_vuelo == 0:
+                    self._liberar(entrada)
+
+    def predict(self, images, imgsz: Optional[int] = None):
+        """Inferencia con la versión en servicio; cada resultado lleva su `version_modelo`."""
+        opciones = {"imgsz": imgsz} if imgsz else {}
+        with self.adquirir() as entrada:
+            results = list(entrada.model.predict(images, save=False, verbose=False, **opciones))
+        for r in results:
+            # Los resultados del sidecar ya traen la versión con la que se infirieron
+            if not getattr(r, "version_modelo", None):
+                r.version_modelo = entrada.version
+        return results
+
+    def embed(self, images):
+        """Embeddings normalizados (uno por imagen) con la versión en servicio: (vectores, version)."""
+        from .embeddings import EmbeddingsNoDisponibles, extraer_embeddings
+
+        # Los modelos exportados (ONNX/OpenVINO) no dan acceso a las capas intermedias
+        if self.serving_mode != "sidecar" and self.backend != backends.PYTORCH:
+            raise EmbeddingsNoDisponibles(f"El backend {self.backend} no permite extraer embeddings")
+        with self.adquirir() as entrada:
+            vectores = extraer_embeddings(entrada.model, images)
+            version = getattr(entrada.model, "version_remota", None) or entrada.version
+        return vectores, version
+
+    def _liberar(self, entrada: ModeloCargado):
+        # Llamar con self._lock adquirido
+        if entrada in self._retirados:
+            self._retirados.remove(entrada)
+        entrada.model = None
+        print(f"Model version {entrada.version} retired.")
+
+    def cambiar(self, path: Optional[str] = None) -> dict:
+        """
+        Pone en servicio los pesos de `path` (por defecto, el candidato) sin
+        cortar el servicio: carga + warm-up fuera del lock y cambio atómico.
+        Si la carga falla, la versión actual sigue en servicio.
+        """
+        if self.serving_mode == "sidecar":
+            raise RuntimeError("En modo sidecar el modelo se cambia en el proceso sidecar")
+        path = path or self.candidato() or self.path
+
+        with self._cambio_lock:
+            self.cambiando = True
+            version = version_de(path, self.backend)
+            inicio = time.perf_counter()
+            try:
+                model = self._cargar(path)
+                tiempo_warmup_ms = self._calentar(model)
+            except Exception as e:
+                self._version_fallida = version
+                self.error = f"No se pudo cargar {version}: {e}"
+                print(self.error)
+                raise
+            finally:
+                self.cambiando = False
+            tiempo_carga_ms = round((time.perf_counter() - inicio) * 1000, 2)
+
+            nueva = ModeloCargado(model, version, path)
+            with self._lock:
+                anterior, self._actual = self._actual, nueva
+                if anterior is not None:
+                    anterior.retirado = True
+                    if anterior.en_vuelo == 0:
+                        self._liberar(anterior)
+                    else:
+                        self._retirados.append(anterior)
+                self.estado = self.LISTO
+                self.error = None
+                self.tiempo_carga_ms = tiempo_carga_ms
+                self.tiempo_warmup_ms = tiempo_warmup_ms
+
+            cambio = {
+                "version": version,
+                "anterior": anterior.version if anterior is not None else None,
+                "tiempo_carga_ms": tiempo_carga_ms,
+                "fecha": time.time(),
+            }
+            self.cambios = (self.cambios + [cambio])[-10:]
+            print(f"Model version {version} in service (previous: {cambio['anterior']}).")
+            return cambio
+
+    def pendiente(self) -> Optional[str]:
+        """Ruta de unos pesos nuevos que aún no están en servicio (o None)."""
+        if self._actual is None or self.cambiando or self.serving_mode == "sidecar":
+            return None
+        path = self.candidato()
+        if not path:
+            return None
+        version = version_de(path, self.backend)
+        if version in (self._actual.version, self._version_fallida):
+            return None
+        return path
+
+    async def vigilar(self, intervalo_s: float):
+        """Comprueba cada `intervalo_s` si hay pesos nuevos y los pone en servicio."""
+        while True:
+            await asyncio.sleep(intervalo_s)
+            try:
+                path = await asyncio.to_thread(self.pendiente)
+                if path:
+                    await asyncio.to_thread(self.cambiar, path)
+            except Exception as e:
+                print(f"Error cambiando de versión del modelo: {e}")
+
+    def info(self) -> dict:
+        actual = self._actual
+        return {
+            "estado": self.estado,
+            "ruta": actual.path if actual is not None else self.path,
+            "directorio": self.models_dir,
+            "backend": self.backend,
+            "modo": self.serving_mode,
+            "version": self.version,
+            "en_vuelo": actual.en_vuelo if actual is not None else 0,
+            "retiradas_pendientes": [
+                {"version": r.version, "en_vuelo": r.en_vuelo} for r in self._retirados
+            ],
+            "cambiando": self.cambiando,
+            "cambios": self.cambios,
+            "tiempo_carga_ms": self.tiempo_carga_ms,
+            "tiempo_warmup_ms": self.tiempo_warmup_ms,
+            "error": self.error,
+        }
+
+
+# Registro único del proceso
+registry = ModelRegistry(
+    MODEL_PATH,
+    backend=settings.IA_BACKEND,
+    serving_mode=settings.IA_SERVING_MODE,
+    models_dir=settings.IA_MODELS_DIR,
+)
+
+
+def get_model():
+    return registry.get()
+
+
+def __getattr__(name):
+    # Compatibilidad: `from app.ia.model_loader import model` sigue funcionando,
+    # pero ahora la carga ocurre en ese momento y no al importar el módulo.
+    if name == "model":
+        return registry.get()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,91 @@
+from typing import List, Optional
+
+import numpy as np
+
+
+def _a_numpy(valores) -> np.ndarray:
+    """Tensores de torch (CPU/GPU), arrays o listas -> array 1D de NumPy."""
+    if hasattr(valores, "cpu"):
+        valores = valores.cpu()
+    if hasattr(valores, "numpy"):
+        valores = valores.numpy()
+    return np.asarray(valores).ravel()
+
+
+def tensores_de_resultados(results):
+    """Concatena los tensores `cls` y `conf` de todas las cajas de los Results."""
+    clases = [_a_numpy(r.boxes.cls) for r in results if r.boxes is not None]
+    confs = [_a_numpy(r.boxes.conf) for r in results if r.boxes is not None]
+    if not clases:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(clases).astype(np.int64), np.concatenate(confs).astype(np.float64)
+
+
+def agregar_por_clase(cls, conf, names) -> List[dict]:
+    """
+    Media de confianza por clase (en %), ordenada de mayor a menor.
+
+    Trabaja sobre los tensores completos: un group-by con `np.bincount`
+    sustituye al bucle `for box in r.boxes` (int()/float() por caja).
+    """
+    cls = _a_numpy(cls).astype(np.int64)
+    conf = _a_numpy(conf).astype(np.float64)
+    if cls.size == 0:
+        return []
+
+    sumas = np.bincount(cls, weights=conf)
+    cuentas = np.bincount(cls)
+    presentes = np.flatnonzero(cuentas)
+    medias = sumas[presentes] / cuentas[presentes]
+
+    # Orden descendente por confianza (estable: empates por id de clase)
+    orden = np.argsort(-medias, kind="stable")
+    return [
+        {"variedad": names[int(presentes[i])], "confianza": round(float(medias[i]) * 100, 2)}
+        for i in orden
+    ]
+
+
+def filtrar(predicciones: List[dict], top_k: Optional[int] = None, min_confianza: float = 0.0) -> List[dict]:
+    """Aplica en servidor el mínimo de confianza (en %) y el top-k pedidos por el cliente."""
+    if min_confianza:
+        predicciones = [p for p in predicciones if p["confianza"] >= min_confianza]
+    if top_k is not None:
+        predicciones = predicciones[:top_k]
+    return predicciones
+
+
+def consenso(predicciones_por_imagen: List[List[dict]]) -> List[dict]:
+    """
+    Consenso por variedad entre varias fotos de la misma planta.
+
+    Recibe, por imagen, la lista `[{"variedad", "confianza"}, ...]` ordenada
+    (la que devuelve /ia/predict) y devuelve por variedad:
+    - `votos`: en cuántas imágenes fue la predicción principal.
+    - `apariciones`: en cuántas imágenes se detectó.
+    - `confianza_media`: media de su confianza en las imágenes donde aparece.
+    - `puntuacion`: suma de confianzas / nº total de imágenes (las imágenes
+      donde no aparece cuentan como 0). Es el criterio de ordenación.
+    """
+    total = len(predicciones_por_imagen)
+    acumulado = {}
+    for predicciones in predicciones_por_imagen:
+        for i, pred in enumerate(predicciones):
+            datos = acumulado.setdefault(pred["variedad"], {"votos": 0, "apariciones": 0, "suma": 0.0})
+            datos["apariciones"] += 1
+            datos["suma"] += pred["confianza"]
+            if i == 0:
+                datos["votos"] += 1
+
+    resultado = [
+        {
+            "variedad": variedad,
+            "votos": datos["votos"],
+            "apariciones": datos["apariciones"],
+            "confianza_media": round(datos["suma"] / datos["apariciones"], 2),
+            "puntuacion": round(datos["suma"] / total, 2) if total else 0.0,
+        }
+        for variedad, datos in acumulado.items()
+    ]
+    resultado.sort(key=lambda x: (x["puntuacion"], x["votos"]), reverse=True)
+    return resultado
@@ -0,0 +1,189 @@
+import asyncio
+import io
+import itertools
+import os
+import tempfile
+import time
+from typing import Awaitable, Callable, Iterable, Iterator, List, Optional
+
+from PIL import Image, ImageSequence
+
+from .decode import ImagenDemasiadoGrande
+from .executor import InferenciaSaturada
+from .postproceso import consenso
+
+
+class VideoNoSoportado(ValueError):
+    """No se puede decodificar el vídeo en este servidor (se traduce a un 415)."""
+
+
+def _reducir(image: Image.Image, max_lado: int) -> Image.Image:
+    image = image.convert("RGB")
+    if max(image.size) > max_lado:
+        image.thumbnail((max_lado, max_lado), Image.Resampling.BILINEAR)
+    return image
+
+
+def _muestreo(total: int, max_frames: int) -> int:
+    """Cada cuántos frames nos quedamos con uno para repartir `max_frames` por todo el vídeo."""
+    return max(1, total // max_frames) if total > 0 else 1
+
+
+def _comprobar_pixeles(ancho: int, alto: int, max_pixeles: int):
+    # Mismo límite que decodificar() para una foto: un fichero pequeño puede declarar un lienzo enorme
+    if ancho * alto > max_pixeles:
+        raise ImagenDemasiadoGrande(f"Image too large ({ancho}x{alto} px). Max: {max_pixeles} px")
+
+
+def frames_de_animacion(
+    image_bytes: bytes, max_frames: int, max_lado: int = 1280, max_pixeles: int = 60_000_000
+) -> Iterator[Image.Image]:
+    """
+    Frames de un GIF/WebP/APNG animado (o la propia imagen si solo tiene uno).
+    El tamaño del lienzo se comprueba al llamarla, antes de decodificar nada.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    _comprobar_pixeles(*image.size, max_pixeles)
+    return _frames(image, max_frames, max_lado)
+
+
+def _frames(image: Image.Image, max_frames: int, max_lado: int) -> Iterator[Image.Image]:
+    paso = _muestreo(getattr(image, "n_frames", 1), max_frames)
+    for frame in itertools.islice(ImageSequence.Iterator(image), 0, None, paso):
+        if max_frames <= 0:
+            return
+        max_frames -= 1
+        yield _reducir(frame.copy(), max_lado)
+
+
+def frames_de_video(
+    video_bytes: bytes, max_frames: int, max_lado: int = 1280, max_pixeles: int = 60_000_000
+) -> Iterator[Image.Image]:
+    """
+    Frames de un vídeo corto, repartidos uniformemente (como mucho `max_frames`).
+
+    Se decodifican a medida que se piden: si la identificación para pronto,
+    el resto del vídeo no llega a decodificarse. Los frames que se saltan solo
+    se leen (`grab`), sin convertirlos a imagen. Usa OpenCV, que ya viene con
+    ultralytics.
+
+    El fichero temporal se borra al cerrar el generador: quien pare antes de
+    agotarlo debe llamar a `close()` (lo hace `identificar_rafaga`).
+    """
+    try:
+        import cv2
+    except ImportError:
+        raise VideoNoSoportado("OpenCV no está instalado: no se pueden decodificar vídeos")
+
+    # OpenCV solo abre vídeos desde un fichero
+    fd, ruta = tempfile.mkstemp(suffix=".video")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(video_bytes)
+        captura = cv2.VideoCapture(ruta)
+        if not captura.isOpened():
+            raise VideoNoSoportado("No se pudo abrir el vídeo")
+        try:
+            _comprobar_pixeles(
+                int(captura.get(cv2.CAP_PROP_FRAME_WIDTH)), int(captura.get(cv2.CAP_PROP_FRAME_HEIGHT)), max_pixeles
+            )
+            paso = _muestreo(int(captura.get(cv2.CAP_PROP_FRAME_COUNT)), max_frames)
+            for indice in itertools.count():
+                if max_frames <= 0 or not captura.grab():
+                    return
+                if indice % paso:
+                    continue
+                ok, frame = captura.retrieve()
+                if not ok:
+                    return
+                max_frames -= 1
+                yield _reducir(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)), max_lado)
+        finally:
+            captura.release()
+    finally:
+        os.unlink(ruta)
+
+
+async def identificar_rafaga(
+    frames: Iterable,
+    inferir: Callable[[object, Optional[float]], Awaitable[List[dict]]],
+    lote: int = 8,
+    umbral: float = 80.0,
+    min_frames: int = 2,
+    plazo_s: Optional[float] = None,
+) -> dict:
+    """
+    Identifica una ráfaga por lotes de `lote` frames y para en cuanto la
+    variedad principal del consenso alcanza `umbral` (puntuación en %, ver
+    `consenso`) con al menos `min_frames` frames válidos.
+
+    `frames` se consume de forma perezosa (en un hilo, por si decodificar es
+    caro) e `inferir(frame, limite)` devuelve las predicciones de un frame.
+    `limite` (time.monotonic) se calcula para cada tanda con `plazo_s`: los
+    frames de una tanda se infieren juntos, así que comparten plazo, y una
+    ráfaga larga no agota el plazo de sus últimos frames en la cola.
+
+    Un frame que falla con ValueError (p. ej. imagen corrupta) se cuenta como
+    error y no corta la ráfaga. Si la inferencia se satura (InferenciaSaturada)
+    se para y se devuelve el consenso de lo procesado hasta entonces, con el
+    motivo en `interrumpida`; sin ningún frame válido, la excepción se propaga.
+    Cualquier otra excepción se propaga.
+
+    Al terminar, con o sin error, cierra `frames` si es un generador: así un
+    vídeo que para pronto borra su fichero temporal al momento.
+    """
+    iterador = iter(frames)
+    try:
+        return await _identificar_rafaga(iterador, inferir, lote, umbral, min_frames, plazo_s)
+    finally:
+        cerrar = getattr(iterador, "close", None)
+        if cerrar is not None:
+            cerrar()
+
+
+async def _identificar_rafaga(iterador, inferir, lote, umbral, min_frames, plazo_s) -> dict:
+    validas = []
+    errores = []
+    procesados = 0
+    resultado = []
+    umbral_alcanzado = False
+    interrumpida = None
+
+    while True:
+        tanda = await asyncio.to_thread(lambda: list(itertools.islice(iterador, lote)))
+        if not tanda:
+            break
+        limite = None if plazo_s is None else time.monotonic() + plazo_s
+        respuestas = await asyncio.gather(*(inferir(frame, limite) for frame in tanda), return_exceptions=True)
+        saturada = None
+        for i, respuesta in enumerate(respuestas, start=procesados):
+            if isinstance(respuesta, ValueError):
+                errores.append({"frame": i, "error": str(respuesta)})
+            elif isinstance(respuesta, InferenciaSaturada):
+                saturada = saturada or respuesta
+            elif isinstance(respuesta, BaseException):
+                raise respuesta
+            else:
+                validas.append(respuesta)
+        procesados += len(tanda)
+
+        if saturada is not None:
+            if not validas:
+                raise saturada
+            interrumpida = str(saturada)
+            resultado = consenso(validas)
+            break
+
+        resultado = consenso(validas)
+        if len(validas) >= min_frames and resultado and resultado[0]["puntuacion"] >= umbral:
+            umbral_alcanzado = True
+            break
+
+    return {
+        "consenso": resultado,
+        "frames_procesados": procesados,
+        "frames_validos": len(validas),
+        "umbral_alcanzado": umbral_alcanzado,
+        "errores": errores,
+        "interrumpida": interrumpida,
+    }
@@ -0,0 +1,320 @@
+"""
+Regresión de precisión y latencia del modelo de VitIA.
+
+Hace lo mismo que `app/tests/test_identificacion.py` (cada muestra normal, con
+poco brillo y girada 45°), pero repartido entre varios procesos y comparado
+con una baseline versionada en el repositorio:
+
+- Cada proceso carga el modelo una vez y limita los hilos de torch a su parte
+  de la CPU. Una tarea es una muestra: se decodifica una vez y se infieren
+  sus tres variantes.
+- Las muestras decodificadas se guardan en caché (`.npy` en `--cache`), así que
+  las siguientes ejecuciones no vuelven a decodificar los JPEG grandes.
+- Los resultados se acumulan en `--resultados` (JSON) con la clave
+  `<version_modelo>@<backend>`.
+- Sale con código 1 si la precisión de alguna variante baja más de
+  `--tolerancia-precision` puntos, o si el p95 sube más de
+  `--tolerancia-p95` (%), respecto a `--baseline`.
+- Sale con código 2 si no hay nada con qué comparar (sin muestras o sin
+  baseline para el backend): en CI, una regresión sin datos no es un "todo
+  bien". Con `--permitir-sin-baseline` solo avisa y sale con 0.
+
+Uso (desde backend/):
+    python -m app.ia.regresion --procesos 4
+    python -m app.ia.regresion --backend onnx --procesos 4
+    python -m app.ia.regresion --actualizar-baseline   # tras revisar los números
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from typing import Callable, List, Optional
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+from .benchmark import percentiles
+from .postproceso import _a_numpy
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "regresion_baseline.json")
+
+NORMAL = "normal"
+BRILLO = "brillo"
+ROTACION = "rotacion"
+VARIANTES = (NORMAL, BRILLO, ROTACION)
+
+# Confianza mínima de las variantes alteradas (la de NORMAL viene en DATASETS)
+MIN_CONF_ALTERADA = 0.40
+
+
+def variante(image: Image.Image, nombre: str) -> Image.Image:
+    if nombre == BRILLO:
+        return ImageEnhance.Brightness(image).enhance(0.5)
+    if nombre == ROTACION:
+        return image.rotate(45, expand=True)
+    return image
+
+
+def tareas_de_datasets(datasets=None, max_muestras: Optional[int] = None) -> List[dict]:
+    """Una tarea por muestra de `app/tests/datasets.py` que exista en disco."""
+    from app.tests.datasets import DATASETS, SAMPLES_DIR
+
+    tareas = []
+    for ds_name, items in DATASETS.items():
+        if datasets and ds_name not in datasets:
+            continue
+        for fname, clase, min_conf in items:
+            ruta = os.path.join(SAMPLES_DIR, fname)
+            if os.path.exists(ruta):
+                tareas.append({"dataset": ds_name, "archivo": fname, "ruta": ruta, "clase": clase, "min_conf": min_conf})
+    return tareas[:max_muestras] if max_muestras else tareas
+
+
+# --- Caché de muestras decodificadas ---
+
+def _ruta_cache(ruta: str, cache_dir: str) -> str:
+    st = os.stat(ruta)
+    firma = f"{os.path.abspath(ruta)}-{st.st_size}-{int(st.st_mtime)}"
+    return os.path.join(cache_dir, hashlib.sha1(firma.encode()).hexdigest() + ".npy")
+
+
+def cargar_muestra(ruta: str, cache_dir: Optional[str] = None) -> Image.Image:
+    """La muestra en RGB; con `cache_dir` la decodificación se hace una sola vez."""
+    if not cache_dir:
+        return Image.open(ruta).convert("RGB")
+    destino = _ruta_cache(ruta, cache_dir)
+    if os.path.exists(destino):
+        return Image.fromarray(np.load(destino))
+    image = Image.open(ruta).convert("RGB")
+    os.makedirs(cache_dir, exist_ok=True)
+    # Escritura atómica: otro proceso puede estar cacheando la misma muestra
+    temporal = f"{destino}.{os.getpid()}.tmp.npy"
+    np.save(temporal, np.asarray(image))
+    os.replace(temporal, destino)
+    return image
+
+
+# --- Procesos de inferencia ---
+
+_modelo = None
+
+
+def cargar_yolo(backend: str, model_path: str):
+    from . import backends
+
+    return backends.cargar_modelo(model_path, backend)
+
+
+def _iniciar_proceso(cargador: Callable, backend: str, model_path: str, hilos: Optional[int]):
+    global _modelo
+    if hilos:
+        try:
+            import torch
+            torch.set_num_threads(hilos)
+        except ImportError:
+            pass
+    _modelo = cargador(backend, model_path)
+    # Warm-up: la primera inferencia de cada proceso no cuenta en la latencia
+    _modelo.predict(Image.new("RGB", (64, 64)), save=False, verbose=False)
+
+
+def _top1(results, names):
+    mejor, mejor_conf = None, 0.0
+    for r in results:
+        if r.boxes is None:
+            continue
+        for cls, conf in zip(_a_numpy(r.boxes.cls), _a_numpy(r.boxes.conf)):
+            if float(conf) > mejor_conf:
+                mejor, mejor_conf = names[int(cls)], float(conf)
+    return mejor, mejor_conf
+
+
+def evaluar_muestra(tarea: dict, cache_dir: Optional[str] = None, modelo=None) -> List[dict]:
+    """Infiere las variantes de una muestra (en el proceso actual)."""
+    modelo = modelo or _modelo
+    image = cargar_muestra(tarea["ruta"], cache_dir)
+    filas = []
+    for nombre in VARIANTES:
+        entrada = variante(image, nombre)
+        inicio = time.perf_counter()
+        results = modelo.predict(entrada, save=False, verbose=False)
+        ms = (time.perf_counter() - inicio) * 1000
+        detectada, conf = _top1(results, modelo.names)
+        min_conf = tarea["min_conf"] if nombre == NORMAL else MIN_CONF_ALTERADA
+        filas.append({
+            "dataset": tarea["dataset"],
+            "archivo": tarea["archivo"],
+            "variante": nombre,
+            "esperada": tarea["clase"],
+            "detectada": detectada,
+            "conf": round(conf, 4),
+            "ms": round(ms, 2),
+            "acierto": detectada == tarea["clase"] and conf >= min_conf,
+        })
+    return filas
+
+
+def ejecutar(
+    tareas: List[dict],
+    backend: str,
+    model_path: str,
+    procesos: int = 2,
+    cache_dir: Optional[str] = None,
+    cargador: Callable = cargar_yolo,
+) -> List[dict]:
+    """
+    Evalúa todas las tareas en `procesos` procesos (0 = en este proceso).
+    Los procesos se crean con `spawn`: el padre no importa torch y los hijos
+    no heredan sus pools de hilos.
+    """
+    if procesos <= 0:
+        modelo = cargador(backend, model_path)
+        return [fila for tarea in tareas for fila in evaluar_muestra(tarea, cache_dir, modelo)]
+
+    hilos = max(1, (os.cpu_count() or 1) // procesos)
+    with ProcessPoolExecutor(
+        max_workers=procesos,
+        mp_context=get_context("spawn"),
+        initializer=_iniciar_proceso,
+        initargs=(cargador, backend, model_path, hilos),
+    ) as pool:
+        futuros = [pool.submit(evaluar_muestra, tarea, cache_dir) for tarea in tareas]
+        return [fila for futuro in futuros for fila in futuro.result()]
+
+
+# --- Métricas y comparación ---
+
+def metricas(filas: List[dict]) -> dict:
+    """Precisión (%) y latencias por variante."""
+    resumen = {}
+    for nombre in VARIANTES:
+        de_variante = [f for f in filas if f["variante"] == nombre]
+        if not de_variante:
+            continue
+        resumen[nombre] = {
+            "precision": round(100 * sum(f["acierto"] for f in de_variante) / len(de_variante), 2),
+            **percentiles([f["ms"] for f in de_variante]),
+        }
+    return resumen
+
+
+def comparar(actual: dict, baseline: dict, tolerancia_precision: float = 2.0, tolerancia_p95: float = 25.0) -> List[str]:
+    """
+    Regresiones de `actual` frente a `baseline` (ambos salida de `metricas`):
+    precisión más de `tolerancia_precision` puntos por debajo, o p95 más de
+    `tolerancia_p95` % por encima. Lista vacía = sin regresiones.
+    """
+    regresiones = []
+    for nombre, base in baseline.items():
+        nuevo = actual.get(nombre)
+        if nuevo is None:
+            regresiones.append(f"{nombre}: sin resultados")
+            continue
+        if nuevo["precision"] < base["precision"] - tolerancia_precision:
+            regresiones.append(
+                f"{nombre}: precisión {nuevo['precision']}% < baseline {base['precision']}% "
+                f"(tolerancia {tolerancia_precision} puntos)"
+            )
+        limite_p95 = base["p95_ms"] * (1 + tolerancia_p95 / 100)
+        if nuevo["p95_ms"] > limite_p95:
+            regresiones.append(
+                f"{nombre}: p95 {nuevo['p95_ms']} ms > {round(limite_p95, 2)} ms "
+                f"(baseline {base['p95_ms']} ms + {tolerancia_p95}%)"
+            )
+    return regresiones
+
+
+def _leer_json(ruta: str) -> dict:
+    if not os.path.exists(ruta):
+        return {}
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _escribir_json(ruta: str, datos: dict):
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(datos, f, indent=2, ensure_ascii=False)
+
+
+def main(argv=None) -> int:
+    from . import backends
+    from .model_loader import MODEL_PATH, version_de
+
+    parser = argparse.ArgumentParser(description="Regresión de precisión y latencia de VitIA")
+    parser.add_argument("--backend", default=backends.PYTORCH, choices=backends.BACKENDS)
+    parser.add_argument("--pesos", default=MODEL_PATH)
+    parser.add_argument("--procesos", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--datasets", nargs="*", help="Limitar a estos DATASETS")
+    parser.add_argument("--max-muestras", type=int, help="Solo las N primeras muestras (prueba rápida)")
+    parser.add_argument("--cache", default=os.path.join(os.path.expanduser("~"), ".cache", "vitia", "muestras"))
+    parser.add_argument("--resultados", default="resultados_regresion.json")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerancia-precision", type=float, default=2.0, help="Puntos de precisión")
+    parser.add_argument("--tolerancia-p95", type=float, default=25.0, help="% sobre el p95 de la baseline")
+    parser.add_argument("--actualizar-baseline", action="store_true")
+    parser.add_argument(
+        "--permitir-sin-baseline", action="store_true", help="Salir con 0 (solo avisar) si no hay baseline"
+    )
+    args = parser.parse_args(argv)
+
+    tareas = tareas_de_datasets(args.datasets, args.max_muestras)
+    if not tareas:
+        print("No hay muestras (¿existe app/tests/samples?)")
+        return 2
+
+    version = version_de(args.pesos, args.backend)
+    inicio = time.perf_counter()
+    filas = ejecutar(tareas, args.backend, backends.ruta_backend(args.pesos, args.backend), args.procesos, args.cache)
+    duracion = round(time.perf_counter() - inicio, 2)
+
+    resumen = metricas(filas)
+    entrada = {
+        "meta": {
+            "fecha": datetime.now(timezone.utc).isoformat(),
+            "version_modelo": version,
+            "backend": args.backend,
+            "procesos": args.procesos,
+            "cpus": os.cpu_count(),
+            "plataforma": platform.platform(),
+            "muestras": len(tareas),
+            "duracion_s": duracion,
+        },
+        "metricas": resumen,
+        "resultados": filas,
+    }
+    resultados = _leer_json(args.resultados)
+    resultados[f"{version}@{args.backend}"] = entrada
+    _escribir_json(args.resultados, resultados)
+
+    for nombre, m in resumen.items():
+        print(f"{nombre:<9} precisión={m['precision']:>6}%  p50={m['p50_ms']} ms  p95={m['p95_ms']} ms")
+    print(f"{len(filas)} inferencias en {duracion} s con {args.procesos} procesos -> {args.resultados}")
+
+    baseline = _leer_json(args.baseline)
+    if args.actualizar_baseline:
+        baseline[args.backend] = {"meta": entrada["meta"], "metricas": resumen}
+        _escribir_json(args.baseline, baseline)
+        print(f"Baseline de {args.backend} actualizada en {args.baseline}")
+        return 0
+
+    base = baseline.get(args.backend)
+    if base is None:
+        print(f"No hay baseline para {args.backend}: genera una con --actualizar-baseline")
+        return 0 if args.permitir_sin_baseline else 2
+    if base["meta"].get("procesos") != args.procesos or base["meta"].get("cpus") != os.cpu_count():
+        print("Aviso: la baseline se midió con otros procesos/CPU; la latencia no es comparable del todo")
+
+    regresiones = comparar(resumen, base["metricas"], args.tolerancia_precision, args.tolerancia_p95)
+    for r in regresiones:
+        print(f"REGRESIÓN {r}")
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+
+# Modos que puede pedir el cliente en /ia/predict
+MODO_AUTO = "auto"          # La política decide según la carga
+MODO_RAPIDO = "fast"        # Siempre la resolución más baja
+MODO_PRECISO = "accurate"   # Siempre la resolución completa
+MODOS = (MODO_AUTO, MODO_RAPIDO, MODO_PRECISO)
+
+
+def parsear_niveles(texto: str) -> List[int]:
+    """'640,480,320' -> [640, 480, 320] (de mayor a menor, sin repetidos)."""
+    niveles = sorted({int(x) for x in texto.split(",") if x.strip()}, reverse=True)
+    if not niveles:
+        raise ValueError("Hace falta al menos una resolución")
+    return niveles
+
+
+class PoliticaResolucion:
+    """
+    Resolución de entrada (`imgsz`) de YOLO según la carga.
+
+    El coste de YOLO crece aproximadamente con el cuadrado de `imgsz`: bajar
+    de 640 a 480 casi divide por dos el forward. En modo `auto`:
+
+    - Si la cola supera `cola_alta` o el p95 de la inferencia supera
+      `p95_alto_ms`, baja un nivel.
+    - Si la cola baja de `cola_baja` y el p95 de `p95_bajo_ms`, sube un nivel.
+    - Entre dos cambios pasan al menos `enfriamiento_s` (histéresis), para no
+      oscilar con cada lote.
+    """
+
+    def __init__(
+        self,
+        niveles: List[int],
+        cola_alta: int = 16,
+        cola_baja: int = 4,
+        p95_alto_ms: float = 800,
+        p95_bajo_ms: float = 300,
+        enfriamiento_s: float = 5,
+        ventana: int = 200,
+        activa: bool = True,
+    ):
+        self.niveles = sorted(set(niveles), reverse=True)
+        self.cola_alta = cola_alta
+        self.cola_baja = cola_baja
+        self.p95_alto_ms = p95_alto_ms
+        self.p95_bajo_ms = p95_bajo_ms
+        self.enfriamiento_s = enfriamiento_s
+        self.activa = activa
+
+        self._lock = threading.Lock()
+        self._nivel = 0  # Índice en self.niveles (0 = resolución completa)
+        self._latencias = deque(maxlen=ventana)
+        self._ultimo_cambio = 0.0
+        self.degradaciones = 0
+        self.recuperaciones = 0
+
+    @property
+    def completa(self) -> int:
+        return self.niveles[0]
+
+    @property
+    def actual(self) -> int:
+        return self.niveles[self._nivel]
+
+    def observar(self, ms: float):
+        """Registra la latencia de una inferencia (cola + forward)."""
+        with self._lock:
+            self._latencias.append(ms)
+
+    def _p95(self) -> Optional[float]:
+        if not self._latencias:
+            return None
+        return float(np.percentile(np.fromiter(self._latencias, dtype=np.float64), 95))
+
+    def _reevaluar(self, profundidad: int):
+        # Llamar con self._lock adquirido
+        ahora = time.monotonic()
+        if not self.activa or ahora - self._ultimo_cambio < self.enfriamiento_s:
+            return
+        p95 = self._p95()
+        sobrecarga = profundidad >= self.cola_alta or (p95 is not None and p95 >= self.p95_alto_ms)
+        holgura = profundidad <= self.cola_baja and (p95 is None or p95 <= self.p95_bajo_ms)
+
+        if sobrecarga and self._nivel < len(self.niveles) - 1:
+            self._nivel += 1
+            self.degradaciones += 1
+        elif holgura and self._nivel > 0:
+            self._nivel -= 1
+            self.recuperaciones += 1
+        else:
+            return
+        self._ultimo_cambio = ahora
+        # Las latencias anteriores eran de otra resolución
+        self._latencias.clear()
+        print(f"IA: input resolution -> {self.actual} (queue: {profundidad}, p95: {p95})")
+
+    def elegir(self, modo: str = MODO_AUTO, profundidad: int = 0) -> int:
+        """Resolución para una petición en `modo` con `profundidad` peticiones en cola."""
+        if modo == MODO_PRECISO:
+            return self.completa
+        if modo == MODO_RAPIDO:
+            return self.niveles[-1]
+        with self._lock:
+            self._reevaluar(profundidad)
+            return self.actual
+
+    def aceptables(self, imgsz: int) -> List[int]:
+        """Resoluciones cuyas predicciones sirven para `imgsz` (las iguales o mayores)."""
+        return [n for n in self.niveles if n >= imgsz]
+
+    def stats(self) -> dict:
+        with self._lock:
+            p95 = self._p95()
+            return {
+                "activa": self.activa,
+                "niveles": self.niveles,
+                "actual": self.actual,
+                "p95_ms": round(p95, 2) if p95 is not None else None,
+                "degradaciones": self.degradaciones,
+                "recuperaciones": self.recuperaciones,
+            }
@@ -0,0 +1,275 @@
+"""
+Sidecar de inferencia: UN proceso con el modelo, compartido por todos los
+workers de la API a través de un socket Unix.
+
+    python -m app.ia.sidecar --socket $XDG_RUNTIME_DIR/vitia-ia.sock
+
+El socket solo lo pueden abrir el usuario del sidecar y su grupo (0660), y su
+directorio se crea con 0750 si no existe: no debe quedar en un /tmp
+compartido, donde cualquier usuario local podría pedir inferencias.
+
+Con `IA_SERVING_MODE=sidecar` los workers no cargan YOLO: el registro les
+entrega un `ModeloRemoto`, que tiene la misma interfaz que usamos de YOLO
+(`predict(...)`, `embed(...)` y `names`) y reenvía las imágenes al sidecar. Como el
+sidecar pasa todo por su propio MicroBatcher, las peticiones de distintos
+workers se agrupan en los mismos lotes.
+
+Protocolo (tramas con longitud de 4 bytes big-endian):
+    petición:  JSON {"op": "predict", "imagenes": [{"shape": [h, w, 3]}, ...], "imgsz": 640 | null}
+               + una trama binaria RGB uint8 por imagen
+               JSON {"op": "embed", "imagenes": [...]} + las mismas tramas RGB
+               JSON {"op": "info"}
+    respuesta: JSON {"resultados": [{"cls": [...], "conf": [...], "speed": {...}, "version": ...}]}
+               JSON {"vectores": [[...], ...], "version": ...}
+               JSON {"names": {...}, "version": ...}
+               JSON {"error": "...", "saturado": true | false, "retry_after_s": 1}
+
+Si el sidecar no responde o devuelve un error, el cliente lanza
+SidecarNoDisponible (una InferenciaSaturada), que las rutas traducen a un 503
+con Retry-After en vez de a un 500.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import threading
+
+import numpy as np
+
+from .executor import InferenciaSaturada
+
+_CABECERA = struct.Struct(">I")
+
+
+class SidecarNoDisponible(InferenciaSaturada):
+    """El sidecar de inferencia no responde, está saturado o devolvió un error."""
+
+
+# --- Tramas ---
+
+def _enviar(sock: socket.socket, payload: bytes):
+    sock.sendall(_CABECERA.pack(len(payload)) + payload)
+
+
+def _recibir_exacto(sock: socket.socket, n: int) -> bytes:
+    partes = bytearray()
+    while len(partes) < n:
+        chunk = sock.recv(n - len(partes))
+        if not chunk:
+            raise ConnectionError("El sidecar cerró la conexión")
+        partes.extend(chunk)
+    return bytes(partes)
+
+
+def _recibir(sock: socket.socket) -> bytes:
+    (n,) = _CABECERA.unpack(_recibir_exacto(sock, _CABECERA.size))
+    return _recibir_exacto(sock, n)
+
+
+async def _leer_trama(reader: asyncio.StreamReader) -> bytes:
+    (n,) = _CABECERA.unpack(await reader.readexactly(_CABECERA.size))
+    return await reader.readexactly(n)
+
+
+def _escribir_trama(writer: asyncio.StreamWriter, payload: bytes):
+    writer.write(_CABECERA.pack(len(payload)) + payload)
+
+
+# --- Cliente (en los workers de la API) ---
+
+class _CajasRemotas:
+    def __init__(self, cls, conf):
+        self.cls = np.asarray(cls, dtype=np.int64)
+        self.conf = np.asarray(conf, dtype=np.float32)
+
+
+class ResultadoRemoto:
+    """Lo mínimo de un `Results` de ultralytics que usa el post-proceso."""
+
+    def __init__(self, cls, conf, speed=None, names=None, version_modelo=None):
+        self.boxes = _CajasRemotas(cls, conf)
+        self.speed = speed or {}
+        self.names = names
+        self.version_modelo = version_modelo
+
+
+class ModeloRemoto:
+    """Proxy de YOLO que infiere en el sidecar. Una conexión por hilo."""
+
+    def __init__(self, socket_path: str, timeout_s: float = 30):
+        self.socket_path = socket_path
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+        self._actualizar_info()
+
+    def _actualizar_info(self):
+        info = self._llamar({"op": "info"})
+        self.names = {int(k): v for k, v in info["names"].items()}
+        self.version_remota = info.get("version")
+
+    def _conexion(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout_s)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _cerrar(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+        self._local.sock = None
+
+    def _llamar(self, cabecera: dict, binarios=()) -> dict:
+        try:
+            sock = self._conexion()
+            _enviar(sock, json.dumps(cabecera).encode("utf-8"))
+            for datos in binarios:
+                _enviar(sock, datos)
+            respuesta = json.loads(_recibir(sock))
+        except (OSError, ConnectionError) as e:
+            # Conexión rota (p. ej. reinicio del sidecar): la próxima llamada reconecta
+            self._cerrar()
+            raise SidecarNoDisponible(f"Sidecar de inferencia no disponible: {e}") from e
+        if "error" in respuesta:
+            raise SidecarNoDisponible(
+                f"Error en el sidecar de inferencia: {respuesta['error']}",
+                retry_after_s=respuesta.get("retry_after_s", 1),
+            )
+        return respuesta
+
+    def _llamar_con_imagenes(self, cabecera: dict, images) -> dict:
+        if not isinstance(images, (list, tuple)):
+            images = [images]
+        arrays = [np.ascontiguousarray(np.asarray(img.convert("RGB"), dtype=np.uint8)) for img in images]
+        cabecera["imagenes"] = [{"shape": list(a.shape)} for a in arrays]
+        return self._llamar(cabecera, [a.tobytes() for a in arrays])
+
+    def predict(self, images, save=False, verbose=False, imgsz=None, **kwargs):
+        respuesta = self._llamar_con_imagenes({"op": "predict", "imgsz": imgsz}, images)
+        resultados = respuesta["resultados"]
+        # El sidecar cambió de versión en caliente: refrescamos los nombres de clase
+        if any(r.get("version") not in (None, self.version_remota) for r in resultados):
+            self._actualizar_info()
+        return [
+            ResultadoRemoto(r["cls"], r["conf"], r.get("speed"), self.names, r.get("version"))
+            for r in resultados
+        ]
+
+    def embed(self, images, verbose=False, **kwargs):
+        respuesta = self._llamar_con_imagenes({"op": "embed"}, images)
+        if respuesta.get("version") not in (None, self.version_remota):
+            self._actualizar_info()
+        return [np.asarray(v, dtype=np.float32) for v in respuesta["vectores"]]
+
+
+# --- Servidor (el proceso sidecar) ---
+
+async def servir(socket_path: str, model=None):
+    """Arranca el sidecar. `model` permite inyectar otro modelo (por defecto, el del registro)."""
+    from PIL import Image
+
+    from ..config import settings
+    from .batcher import MicroBatcher
+    from .embeddings import extraer_embeddings
+    from .executor import InferenceExecutor
+    from .model_loader import registry
+    from .postproceso import tensores_de_resultados
+
+    vigilancia = None
+    if model is None:
+        # El sidecar es quien carga los pesos, aunque el .env diga IA_SERVING_MODE=sidecar
+        registry.serving_mode = "local"
+        registry.warmup()
+        predict_fn = registry.predict
+        modelo_actual = registry.get
+        embed_fn = registry.embed
+        if settings.IA_MODEL_WATCH_S > 0:
+            vigilancia = asyncio.create_task(registry.vigilar(settings.IA_MODEL_WATCH_S))
+    else:
+        predict_fn = lambda imgs, **opciones: list(model.predict(imgs, save=False, verbose=False, **opciones))
+        modelo_actual = lambda: model
+        embed_fn = lambda imgs: (extraer_embeddings(model, imgs), registry.version)
+    executor = InferenceExecutor(max_workers=settings.IA_EXECUTOR_WORKERS, max_queue=settings.IA_MAX_QUEUE)
+    batcher = MicroBatcher(
+        predict_fn,
+        max_batch_size=settings.IA_BATCH_MAX_SIZE,
+        max_wait_ms=settings.IA_BATCH_MAX_WAIT_MS,
+        executor=executor,
+    )
+
+    def _imagenes(cabecera: dict, binarios):
+        return [
+            Image.fromarray(np.frombuffer(datos, dtype=np.uint8).reshape(meta["shape"]), "RGB")
+            for meta, datos in zip(cabecera["imagenes"], binarios)
+        ]
+
+    async def atender(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                cabecera = json.loads(await _leer_trama(reader))
+                # Leemos todas las tramas de la petición antes de procesar, para
+                # no desincronizar el stream si una imagen falla
+                binarios = [await _leer_trama(reader) for _ in cabecera.get("imagenes", [])]
+                try:
+                    if cabecera["op"] == "info":
+                        respuesta = {"names": modelo_actual().names, "version": registry.version}
+                    elif cabecera["op"] == "embed":
+                        vectores, version = await executor.run(embed_fn, _imagenes(cabecera, binarios))
+                        respuesta = {"vectores": vectores.tolist(), "version": version}
+                    else:
+                        imagenes = _imagenes(cabecera, binarios)
+                        imgsz = cabecera.get("imgsz")
+                        resultados = await asyncio.gather(*(batcher.submit(img, imgsz=imgsz) for img in imagenes))
+                        respuesta = {"resultados": []}
+                        for r in resultados:
+                            cls, conf = tensores_de_resultados([r])
+                            respuesta["resultados"].append({
+                                "cls": cls.tolist(),
+                                "conf": conf.tolist(),
+                                "speed": getattr(r, "speed", None),
+                                "version": getattr(r, "version_modelo", None),
+                            })
+                except InferenciaSaturada as e:
+                    respuesta = {"error": str(e), "saturado": True, "retry_after_s": e.retry_after_s}
+                except Exception as e:
+                    respuesta = {"error": str(e), "saturado": False}
+                _escribir_trama(writer, json.dumps(respuesta).encode("utf-8"))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), mode=0o750, exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    # La umask cubre el hueco entre crear el socket y el chmod
+    umask = os.umask(0o117)
+    try:
+        server = await asyncio.start_unix_server(atender, path=socket_path)
+    finally:
+        os.umask(umask)
+    os.chmod(socket_path, 0o660)
+    print(f"Sidecar de inferencia escuchando en {socket_path} (modelo {registry.version})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if vigilancia is not None:
+            vigilancia.cancel()
+        await batcher.close()
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    from ..config import settings
+
+    parser = argparse.ArgumentParser(description="Sidecar de inferencia de VitIA")
+    parser.add_argument("--socket", default=settings.IA_SIDECAR_SOCKET)
+    args = parser.parse_args()
+    asyncio.run(servir(args.socket))
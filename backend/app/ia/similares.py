@@ -0,0 +1,394 @@
+import asyncio
+import functools
+import os
+import time
+import urllib.parse
+import urllib.request
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .embeddings import EmbeddingsNoDisponibles, IndiceVectorial
+from .executor import CARRIL_GRATIS, InferenciaSaturada
+
+
+class OrigenNoPermitido(ValueError):
+    """La URL no está bajo ninguno de los orígenes permitidos (p. ej. ImageKit)."""
+
+
+def permitida(url: str, origenes: Sequence[str]) -> bool:
+    """
+    True si `url` está bajo alguna de las URLs base de `origenes` (mismo
+    esquema https, mismo host y por debajo de su ruta). Las URLs de la base las
+    escriben los usuarios: sin esto, el servidor descargaría lo que le pidan,
+    incluidas direcciones internas.
+    """
+    partes = urllib.parse.urlsplit(url)
+    if partes.scheme != "https" or partes.username or partes.password or partes.port not in (None, 443):
+        return False
+    for origen in origenes:
+        base = urllib.parse.urlsplit(origen)
+        ruta = base.path.rstrip("/") + "/"
+        if partes.hostname == base.hostname and (partes.path + "/").startswith(ruta):
+            return True
+    return False
+
+
+class _RedireccionesPermitidas(urllib.request.HTTPRedirectHandler):
+    """Solo sigue redirecciones que se quedan dentro de los orígenes permitidos."""
+
+    def __init__(self, origenes: Sequence[str]):
+        self.origenes = origenes
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        if not permitida(newurl, self.origenes):
+            raise OrigenNoPermitido(f"Redirección a un origen no permitido: {newurl}")
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def descargar(
+    url: str, origenes: Sequence[str] = (), timeout_s: float = 10, max_bytes: int = 25 * 1024 * 1024
+) -> bytes:
+    """Descarga una foto (referencias de la biblioteca o fotos de ImageKit) si está bajo `origenes`."""
+    if not permitida(url, origenes):
+        raise OrigenNoPermitido(f"Origen no permitido: {url}")
+    opener = urllib.request.build_opener(_RedireccionesPermitidas(origenes))
+    with opener.open(url, timeout=timeout_s) as respuesta:
+        datos = respuesta.read(max_bytes + 1)
+    if len(datos) > max_bytes:
+        raise ValueError(f"La foto {url} supera {max_bytes} bytes")
+    return datos
+
+
+def meta_referencia(id_variedad: int, nombre: str, indice: int, url: str) -> dict:
+    return {
+        "clave": f"ref:{id_variedad}:{indice}",
+        "tipo": "referencia",
+        "id_variedad": id_variedad,
+        "variedad": nombre,
+        "url": url,
+    }
+
+
+def meta_avistamiento(item) -> dict:
+    """Metadatos de un item de `Coleccion` (leer antes de cerrar la sesión)."""
+    return {
+        "clave": f"col:{item.id_coleccion}",
+        "tipo": "avistamiento",
+        "id_coleccion": item.id_coleccion,
+        "id_usuario": item.id_usuario,
+        "id_variedad": item.id_variedad,
+        "variedad": item.variedad.nombre if item.variedad is not None else None,
+        "url": item.path_foto_usuario,
+    }
+
+
+def fotos_de_la_base(db) -> List[Tuple[str, dict]]:
+    """(url, metadatos) de todas las fotos de referencia y de todas las colecciones."""
+    from .. import models
+
+    fotos = []
+    variedades = db.query(models.Variedad.id_variedad, models.Variedad.nombre, models.Variedad.links_imagenes)
+    nombres = {}
+    for id_variedad, nombre, links in variedades:
+        nombres[id_variedad] = nombre
+        for i, url in enumerate(links or []):
+            fotos.append((url, meta_referencia(id_variedad, nombre, i, url)))
+    items = db.query(
+        models.Coleccion.id_coleccion,
+        models.Coleccion.id_usuario,
+        models.Coleccion.id_variedad,
+        models.Coleccion.path_foto_usuario,
+    )
+    for id_coleccion, id_usuario, id_variedad, url in items:
+        fotos.append((url, {
+            "clave": f"col:{id_coleccion}",
+            "tipo": "avistamiento",
+            "id_coleccion": id_coleccion,
+            "id_usuario": id_usuario,
+            "id_variedad": id_variedad,
+            "variedad": nombres.get(id_variedad),
+            "url": url,
+        }))
+    return fotos
+
+
+class IndiceSimilares:
+    """
+    Índice de embeddings de las fotos de referencia de la biblioteca
+    (`Variedad.links_imagenes`) y de las colecciones de los usuarios. Sirve para:
+
+    - "avistamientos parecidos": las fotos más cercanas a una foto nueva. Solo
+      se devuelven fotos de referencia y avistamientos del propio usuario;
+    - sugerir variedades cuando YOLO no detecta nada: los vecinos (de todos los
+      usuarios) se agrupan por variedad.
+
+    Los embeddings dependen de la versión del modelo: el índice guarda con qué
+    versión se construyó y `vigilar` lo reconstruye en segundo plano si cambia
+    (mientras tanto las búsquedas devuelven None). Los avistamientos nuevos se
+    añaden de uno en uno con `agregar`.
+
+    `embed_fn(imagenes, carril, limite)` pasa por el control de admisión de la
+    inferencia: la construcción va por el carril gratuito sin plazo y, si la
+    cola está llena, espera lo que indique el Retry-After y lo vuelve a intentar.
+    Solo se descargan fotos bajo `origenes` (ver `permitida`).
+    """
+
+    VACIO = "vacio"
+    CONSTRUYENDO = "construyendo"
+    LISTO = "listo"
+    NO_DISPONIBLE = "no_disponible"  # El backend no permite extraer embeddings
+    ERROR = "error"
+
+    def __init__(
+        self,
+        embed_fn: Callable[..., Awaitable[Tuple[np.ndarray, str]]],
+        version_fn: Callable[[], str],
+        decodificar_fn: Callable,
+        ruta: Optional[str] = None,
+        min_ann: int = 20000,
+        nprobe: int = 8,
+        descargar_fn: Optional[Callable[[str], bytes]] = None,
+        lote: int = 16,
+        concurrencia: int = 8,
+        origenes: Sequence[str] = (),
+    ):
+        self.embed_fn = embed_fn
+        self.version_fn = version_fn
+        self.decodificar_fn = decodificar_fn
+        self.descargar_fn = descargar_fn or functools.partial(descargar, origenes=tuple(origenes))
+        self.ruta = ruta
+        self.min_ann = min_ann
+        self.nprobe = nprobe
+        self.lote = lote
+        self.concurrencia = concurrencia
+
+        self.indice = IndiceVectorial(min_ann=min_ann, nprobe=nprobe)
+        self.version: Optional[str] = None
+        self.estado = self.VACIO
+        self.error = None
+        self.fallidas = 0
+        self.tiempo_construccion_ms = None
+        self._session_factory = None
+        self._pendientes = []  # Altas que llegan durante una construcción
+
+    @property
+    def listo(self) -> bool:
+        return self.estado == self.LISTO
+
+    @property
+    def activo(self) -> bool:
+        """Si merece la pena mandar altas (el índice existe o se está construyendo)."""
+        return self.estado in (self.LISTO, self.CONSTRUYENDO)
+
+    # --- Construcción ---
+
+    async def iniciar(self, session_factory):
+        """Carga el índice de disco si es de la versión en servicio; si no, lo construye."""
+        self._session_factory = session_factory
+        if self.ruta and os.path.exists(self.ruta):
+            try:
+                indice, version = await asyncio.to_thread(
+                    IndiceVectorial.cargar, self.ruta, min_ann=self.min_ann, nprobe=self.nprobe
+                )
+                if version == self.version_fn():
+                    self.indice, self.version, self.estado = indice, version, self.LISTO
+                    print(f"Similar-photo index loaded from {self.ruta} ({len(indice)} photos).")
+                    return
+            except Exception as e:
+                print(f"Error cargando el índice de similares: {e}")
+        await self.construir(session_factory)
+
+    async def _embeddings(self, fotos: List[Tuple[str, dict]], limitador: asyncio.Semaphore):
+        """Descarga, decodifica y extrae embeddings de un lote; se salta las fotos que fallan."""
+        async def _preparar(url):
+            async with limitador:
+                try:
+                    datos = await asyncio.to_thread(self.descargar_fn, url)
+                    return await asyncio.to_thread(self.decodificar_fn, datos)
+                except Exception as e:
+                    print(f"Similar-photo index: skipping {url}: {e}")
+                    return None
+
+        imagenes = await asyncio.gather(*(_preparar(url) for url, _ in fotos))
+        validas = [(img, meta) for img, (_, meta) in zip(imagenes, fotos) if img is not None]
+        self.fallidas += len(fotos) - len(validas)
+        if not validas:
+            return None, [], None
+        vectores, version = await self._embed_en_segundo_plano([img for img, _ in validas])
+        return vectores, [meta for _, meta in validas], version
+
+    async def _embed_en_segundo_plano(self, imagenes: list):
+        """Embeddings sin plazo por el carril gratuito; si la cola está llena, espera y reintenta."""
+        while True:
+            try:
+                return await self.embed_fn(imagenes, CARRIL_GRATIS, None)
+            except InferenciaSaturada as e:
+                await asyncio.sleep(e.retry_after_s)
+
+    async def construir(self, session_factory=None):
+        """Reconstruye el índice completo a partir de la base de datos."""
+        if self.estado == self.CONSTRUYENDO:
+            return
+        session_factory = session_factory or self._session_factory
+        self._session_factory = session_factory
+        self.estado = self.CONSTRUYENDO
+        self.fallidas = 0
+        inicio = time.perf_counter()
+        try:
+            db = session_factory()
+            try:
+                fotos = await asyncio.to_thread(fotos_de_la_base, db)
+            finally:
+                db.close()
+
+            nuevo = IndiceVectorial(min_ann=self.min_ann, nprobe=self.nprobe)
+            versiones = set()
+            limitador = asyncio.Semaphore(self.concurrencia)
+            for i in range(0, len(fotos), self.lote):
+                vectores, metas, version = await self._embeddings(fotos[i:i + self.lote], limitador)
+                if metas:
+                    nuevo.agregar(vectores, metas)
+                    versiones.add(version)
+            # El IVF se entrena una vez con todo (fuera del event loop), no a cada lote
+            await asyncio.to_thread(nuevo.entrenar)
+        except EmbeddingsNoDisponibles as e:
+            self.estado, self.error = self.NO_DISPONIBLE, str(e)
+            print(f"Similar-photo index not available: {e}")
+            return
+        except Exception as e:
+            self.estado, self.error = self.ERROR, str(e)
+            print(f"Error construyendo el índice de similares: {e}")
+            return
+
+        if len(versiones) > 1:
+            # El modelo cambió a mitad: los vectores no son comparables entre sí
+            self.estado = self.VACIO
+            print("Model version changed while building the similar-photo index; rebuilding.")
+            return await self.construir(session_factory)
+
+        self.indice = nuevo
+        self.version = versiones.pop() if versiones else self.version_fn()
+        self.error = None
+        self.estado = self.LISTO
+        self.tiempo_construccion_ms = round((time.perf_counter() - inicio) * 1000, 2)
+        print(
+            f"Similar-photo index built: {len(nuevo)} photos in {self.tiempo_construccion_ms} ms "
+            f"({self.fallidas} skipped)."
+        )
+
+        pendientes, self._pendientes = self._pendientes, []
+        for meta, image_bytes in pendientes:
+            await self.agregar(meta, image_bytes)
+        await asyncio.to_thread(self.guardar)
+
+    def guardar(self):
+        if self.ruta and self.listo:
+            try:
+                self.indice.guardar(self.ruta, self.version)
+            except Exception as e:
+                print(f"Error guardando el índice de similares: {e}")
+
+    def _vigente(self) -> bool:
+        """False si el índice no está listo o es de otra versión del modelo (lo rehace `vigilar`)."""
+        return self.listo and self.version == self.version_fn()
+
+    async def comprobar_version(self):
+        """Reconstruye el índice si el modelo en servicio ya no es el de sus vectores."""
+        if self.estado in (self.LISTO, self.VACIO) and self._session_factory is not None \
+                and self.version != self.version_fn():
+            await self.construir()
+
+    async def vigilar(self, intervalo_s: float):
+        """Comprueba cada `intervalo_s` si ha cambiado la versión del modelo."""
+        while True:
+            await asyncio.sleep(intervalo_s)
+            try:
+                await self.comprobar_version()
+            except Exception as e:
+                print(f"Error reconstruyendo el índice de similares: {e}")
+
+    # --- Altas y bajas ---
+
+    async def agregar(self, meta: dict, image_bytes: Optional[bytes] = None):
+        """Añade (o sustituye) una foto. Sin `image_bytes` se descarga de `meta['url']`."""
+        if self.estado == self.CONSTRUYENDO:
+            self._pendientes.append((meta, image_bytes))
+            return
+        if not self._vigente():
+            return
+        try:
+            if image_bytes is None:
+                image_bytes = await asyncio.to_thread(self.descargar_fn, meta["url"])
+            imagen = await asyncio.to_thread(self.decodificar_fn, image_bytes)
+            vectores, version = await self._embed_en_segundo_plano([imagen])
+        except Exception as e:
+            print(f"Error añadiendo {meta['clave']} al índice de similares: {e}")
+            return
+        if version == self.version and self.indice.agregar(vectores, [meta]):
+            await asyncio.to_thread(self.indice.entrenar)
+
+    def eliminar(self, clave: str):
+        self._pendientes = [(m, b) for m, b in self._pendientes if m["clave"] != clave]
+        self.indice.eliminar(clave)
+
+    # --- Consultas ---
+
+    def _variedades(self, vector: np.ndarray, k: int, vecinos: int) -> List[dict]:
+        """Los `vecinos` más cercanos agrupados por variedad (similitud = la del mejor vecino)."""
+        por_variedad = {}
+        for similitud, meta in self.indice.buscar(vector, vecinos):
+            if meta.get("id_variedad") is None:
+                continue
+            entrada = por_variedad.setdefault(
+                meta["id_variedad"],
+                {"id_variedad": meta["id_variedad"], "variedad": meta["variedad"], "similitud": similitud, "votos": 0},
+            )
+            entrada["votos"] += 1
+        resultado = sorted(por_variedad.values(), key=lambda v: (v["similitud"], v["votos"]), reverse=True)[:k]
+        for v in resultado:
+            v["similitud"] = round(v["similitud"] * 100, 2)
+        return resultado
+
+    async def buscar(
+        self,
+        imagen,
+        k: int = 10,
+        id_usuario: Optional[int] = None,
+        vecinos: int = 50,
+        carril: str = CARRIL_GRATIS,
+        limite: Optional[float] = None,
+    ) -> Optional[dict]:
+        """
+        Avistamientos parecidos y variedades más cercanas a `imagen` (PIL).
+        Devuelve None si el índice no está disponible. `carril` y `limite` van
+        al control de admisión (InferenciaSaturada si no hay sitio).
+        """
+        if not self._vigente():
+            return None
+        vectores, version = await self.embed_fn([imagen], carril, limite)
+        if version != self.version:
+            return None
+        # Anónimo: solo fotos de referencia
+        visible = id_usuario if id_usuario is not None else -1
+        avistamientos = [
+            {"similitud": round(s * 100, 2), **{c: v for c, v in meta.items() if c != "clave"}}
+            for s, meta in self.indice.buscar(vectores[0], k, id_usuario_visible=visible)
+        ]
+        return {
+            "avistamientos": avistamientos,
+            "variedades_cercanas": self._variedades(vectores[0], k, max(vecinos, k)),
+            "version_modelo": version,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "estado": self.estado,
+            "version": self.version,
+            "fotos": len(self.indice),
+            "ann": self.indice.usa_ann,
+            "fallidas": self.fallidas,
+            "pendientes": len(self._pendientes),
+            "tiempo_construccion_ms": self.tiempo_construccion_ms,
+            "error": self.error,
+        }
@@ -0,0 +1,99 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Límites de los buckets de los histogramas (ms)
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Cronometro:
+    """
+    Tiempos por etapa de UNA petición de identificación.
+
+        crono = Cronometro()
+        with crono.etapa("decode"):
+            ...
+        crono.server_timing()  # -> 'decode;dur=12.31'
+    """
+
+    def __init__(self):
+        self.etapas: Dict[str, float] = {}
+
+    @contextmanager
+    def etapa(self, nombre: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(nombre, (time.perf_counter() - inicio) * 1000)
+
+    def add(self, nombre: str, ms: float):
+        self.etapas[nombre] = self.etapas.get(nombre, 0.0) + ms
+
+    def as_dict(self) -> Dict[str, float]:
+        return {nombre: round(ms, 2) for nombre, ms in self.etapas.items()}
+
+    def server_timing(self) -> str:
+        """Valor de la cabecera `Server-Timing` (visible en las DevTools del navegador)."""
+        return ", ".join(f"{nombre};dur={ms:.2f}" for nombre, ms in self.etapas.items())
+
+
+class _Histograma:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observar(self, ms: float):
+        self.count += 1
+        self.sum += ms
+        for i, limite in enumerate(BUCKETS_MS):
+            if ms <= limite:
+                self.buckets[i] += 1
+
+
+class MetricasEtapas:
+    """Histogramas acumulados por etapa (formato Prometheus) para planificar capacidad."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas: Dict[str, _Histograma] = {}
+
+    def observar(self, crono: Cronometro):
+        with self._lock:
+            for nombre, ms in crono.etapas.items():
+                self._histogramas.setdefault(nombre, _Histograma()).observar(ms)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                nombre: {"count": h.count, "media_ms": round(h.sum / h.count, 2) if h.count else 0.0}
+                for nombre, h in self._histogramas.items()
+            }
+
+    def prometheus(self, nombre_metrica: str = "vitia_ia_etapa_duracion_ms") -> str:
+        lineas = [
+            f"# HELP {nombre_metrica} Duración de cada etapa de /ia/predict en milisegundos.",
+            f"# TYPE {nombre_metrica} histogram",
+        ]
+        with self._lock:
+            for etapa, h in sorted(self._histogramas.items()):
+                for limite, acumulado in zip(BUCKETS_MS, h.buckets):
+                    lineas.append(f'{nombre_metrica}_bucket{{etapa="{etapa}",le="{limite}"}} {acumulado}')
+                lineas.append(f'{nombre_metrica}_bucket{{etapa="{etapa}",le="+Inf"}} {h.count}')
+                lineas.append(f'{nombre_metrica}_sum{{etapa="{etapa}"}} {h.sum:.3f}')
+                lineas.append(f'{nombre_metrica}_count{{etapa="{etapa}"}} {h.count}')
+        return "\n".join(lineas) + "\n"
+
+
+def prometheus_valores(valores: dict, prefijo: str, tipos: Optional[dict] = None) -> str:
+    """Convierte un dict plano de números (stats del executor, caché...) a líneas Prometheus."""
+    lineas = []
+    for clave, valor in valores.items():
+        if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+            continue
+        nombre = f"{prefijo}_{clave}"
+        lineas.append(f"# TYPE {nombre} {(tipos or {}).get(clave, 'gauge')}")
+        lineas.append(f"{nombre} {valor}")
+    return "\n".join(lineas) + ("\n" if lineas else "")
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware # ⬅️ AÑADIR ESTA IMPORTACIÓN
 from .routes.routes_health import router as health_router
@@ -8,6 +9,8 @@ from .routes.routes_users import router as users_router
 from .routes.routes_publicacion import router as publicacion_router
 from .routes.routes_comentarios import router as comentario_router
 from .routes import ml_routes
+from .services import subidas_service, votos_service
+from .config import settings
 
 
 app = FastAPI(title="VitIA Backend")
@@ -40,6 +43,8 @@ app.add_middleware(
     allow_methods=["*"],
     # ⬅️ ASEGURA QUE ESTOS ENCABEZADOS ESTÉN EXPLÍCITAMENTE PERMITIDOS
     allow_headers=["*", "Authorization", "Content-Type", "access-control-allow-origin"],
+    # El navegador solo deja leer al frontend las cabeceras expuestas
+    expose_headers=["X-Next-Cursor"],
 )
 # ----------------------------------------------------
 # FIN DE CONFIGURACIÓN DE CORS
@@ -54,4 +59,61 @@ app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(publicacion_router)
 app.include_router(comentario_router)
-app.include_router(ml_routes.router)
\ No newline at end of file
+app.include_router(ml_routes.router)
+
+
+# Tareas de fondo de la IA (se cancelan al apagar)
+_tareas_ia = []
+
+
+@app.on_event("startup")
+async def startup_ia():
+    # Fase de warm-up explícita (en segundo plano, no retrasa el arranque)
+    if settings.IA_WARMUP_ON_STARTUP:
+        asyncio.create_task(ml_routes.warmup())
+    # Índice clase -> variedad (evita consultar la biblioteca en cada predicción)
+    asyncio.create_task(asyncio.to_thread(ml_routes.cargar_catalogo))
+    # Cambio de versión en caliente al aparecer pesos nuevos
+    if settings.IA_MODEL_WATCH_S > 0 and settings.IA_SERVING_MODE != "sidecar":
+        _tareas_ia.append(asyncio.create_task(ml_routes.vigilar_modelos()))
+    # Índice de fotos parecidas (descarga y procesa todas las fotos: opcional)
+    if settings.IA_SIMILARES:
+        _tareas_ia.append(asyncio.create_task(ml_routes.iniciar_similares()))
+
+
+@app.on_event("shutdown")
+async def shutdown_ia():
+    for tarea in _tareas_ia:
+        tarea.cancel()
+    # Conservamos las altas incrementales del índice de fotos parecidas
+    await asyncio.to_thread(ml_routes.similares.guardar)
+    # Paramos el planificador de lotes de inferencia
+    await ml_routes.batcher.close()
+    ml_routes.executor.shutdown()
+
+
+# La reconciliación de contadores de votos no arranca aquí: es un único proceso
+# para todo el despliegue (cron), ver app/reconciliar_votos.py
+@app.on_event("startup")
+async def startup_foro():
+    # Contadores de votos agrupados (ver AcumuladorVotos)
+    if settings.FORO_VOTOS_INTERVALO_MS > 0:
+        votos_service.acumulador.iniciar()
+
+
+@app.on_event("shutdown")
+async def shutdown_foro():
+    # Que no se pierdan los votos pendientes de sumar a los contadores
+    await votos_service.acumulador.detener()
+
+
+@app.on_event("startup")
+async def startup_coleccion():
+    # Fotos de /coleccion/identificar que nadie confirmó a tiempo
+    if settings.PENDING_UPLOAD_CLEANUP_S > 0:
+        subidas_service.limpieza.iniciar()
+
+
+@app.on_event("shutdown")
+async def shutdown_coleccion():
+    subidas_service.limpieza.detener()
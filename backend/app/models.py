@@ -1,7 +1,8 @@
 # --- En tu archivo /app/models.py ---
 
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Text, Float, Table, UniqueConstraint
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Text, Float, Table, UniqueConstraint, Index
 from sqlalchemy.orm import relationship, backref
+from datetime import datetime, timezone
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import JSONB  # Específico para PostgreSQL
 
@@ -50,6 +51,46 @@ class VotoComentario(Base):
     __table_args__ = (UniqueConstraint('id_usuario', 'id_comentario', name='unique_voto_com'),)
 
 
+# Diferencias de likes/dislikes ya votadas que aún no se han sumado al contador
+# del padre (ver services/votos_service.AcumuladorVotos). Se escriben en la misma
+# transacción que el voto y se borran en la misma que las suma al contador, así
+# que en cualquier momento: contador + pendientes = votos.
+class ContadorPendiente(Base):
+    __tablename__ = "ContadoresPendientes"
+
+    id_pendiente = Column(Integer, primary_key=True)
+    likes = Column(Integer, nullable=False, default=0)
+    dislikes = Column(Integer, nullable=False, default=0)
+    fecha = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(timezone.utc))
+
+    # Uno de los dos
+    id_publicacion = Column(Integer, ForeignKey("Publicaciones.id_publicacion", ondelete="CASCADE"), nullable=True)
+    id_comentario = Column(Integer, ForeignKey("Comentarios.id_comentario", ondelete="CASCADE"), nullable=True)
+
+    __table_args__ = (
+        Index("ix_pendientes_publicacion", "id_publicacion"),
+        Index("ix_pendientes_comentario", "id_comentario"),
+        Index("ix_pendientes_fecha", "fecha"),
+    )
+
+
+# Fotos ya subidas a ImageKit por /coleccion/identificar (guardar=False) que
+# esperan a /coleccion/confirmar. El token pendiente solo lleva id_subida: si
+# nadie confirma antes de `expira`, la limpieza borra la foto de ImageKit.
+class SubidaPendiente(Base):
+    __tablename__ = "SubidasPendientes"
+
+    id_subida = Column(Integer, primary_key=True)
+    id_usuario = Column(Integer, ForeignKey("Usuarios.id_usuario", ondelete="CASCADE"), nullable=False)
+    file_id = Column(String, nullable=False)  # Id de ImageKit, para borrarla
+    path_foto = Column(String, nullable=False)
+    expira = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index("ix_subidas_pendientes_expira", "expira"),
+    )
+
+
 # -----------------------------------------------------
 # Modelo: Usuarios
 # -----------------------------------------------------
@@ -127,6 +168,9 @@ class Coleccion(Base):
     propietario = relationship("Usuario", back_populates="coleccion")
     variedad = relationship("Variedad", back_populates="items_coleccion")
 
+    # Índice de la paginación por cursor de la colección (crud.ORDEN_COLECCION)
+    __table_args__ = (Index("ix_coleccion_usuario_fecha_id", "id_usuario", "fecha_captura", "id_coleccion"),)
+
 
 # -----------------------------------------------------
 # Modelo: Publicaciones (El Foro)
@@ -140,6 +184,7 @@ class Publicacion(Base):
     links_fotos = Column(JSONB) # Lista de fotos para el post
     fecha_publicacion = Column(DateTime(timezone=True), server_default=func.now())
     likes = Column(Integer, default=0)
+    dislikes = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Relación Many-to-Many: Una publicación puede tener muchas variedades etiquetadas
     variedades = relationship(
@@ -155,6 +200,12 @@ class Publicacion(Base):
     autor = relationship("Usuario", back_populates="publicaciones")
     comentarios = relationship("Comentario", back_populates="publicacion", cascade="all, delete-orphan")
 
+    # Índices de la paginación por cursor del feed y de "mis publicaciones"
+    __table_args__ = (
+        Index("ix_publicaciones_fecha_id", "fecha_publicacion", "id_publicacion"),
+        Index("ix_publicaciones_usuario_fecha_id", "id_usuario", "fecha_publicacion", "id_publicacion"),
+    )
+
 class Comentario(Base):
     __tablename__ = "Comentarios"
 
@@ -162,6 +213,7 @@ class Comentario(Base):
     texto = Column(Text, nullable=False)
     fecha_comentario = Column(DateTime(timezone=True), server_default=func.now())
     likes = Column(Integer, default=0)
+    dislikes = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Claves foráneas
     id_usuario = Column(Integer, ForeignKey("Usuarios.id_usuario", ondelete="CASCADE"), nullable=False)
@@ -178,4 +230,10 @@ class Comentario(Base):
     # y al padre: comentario.padre (el comentario al que respondes)
     hijos = relationship("Comentario", 
                         backref=backref('padre', remote_side=[id_comentario]),
-                        cascade="all, delete-orphan")
\ No newline at end of file
+                        cascade="all, delete-orphan")
+
+    # Índice de la paginación por cursor de los comentarios de una publicación
+    # (también sirve para buscar las respuestas de un comentario)
+    __table_args__ = (
+        Index("ix_comentarios_pub_padre_fecha_id", "id_publicacion", "id_padre", "fecha_comentario", "id_comentario"),
+    )
@@ -0,0 +1,88 @@
+# --- Paginación por cursor (keyset) ---
+"""
+En vez de OFFSET, cada página pide "lo que viene después de la última fila que
+vi" según las columnas de orden, p. ej. (fecha_publicacion, id_publicacion).
+Con un índice sobre esas columnas la página 1000 cuesta lo mismo que la
+primera, y si entran filas nuevas mientras el usuario hace scroll no se
+repiten ni se saltan elementos.
+
+El cursor que ve el cliente es opaco: los valores de la última fila en JSON
+codificado en base64. La id final hace de desempate cuando varias filas
+comparten fecha.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import tuple_
+
+# Cabecera con la que los endpoints devuelven el cursor de la página siguiente
+CABECERA_CURSOR = "X-Next-Cursor"
+
+
+class CursorInvalido(ValueError):
+    """El cursor no lo generó este servidor (o no es de este listado)."""
+
+
+def codificar(valores: Sequence) -> str:
+    datos = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    return base64.urlsafe_b64encode(json.dumps(datos).encode()).decode().rstrip("=")
+
+
+def decodificar(cursor: str, columnas: Sequence) -> List:
+    """Valores del cursor convertidos al tipo de cada columna."""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise CursorInvalido("Cursor inválido") from e
+    if not isinstance(datos, list) or len(datos) != len(columnas):
+        raise CursorInvalido("Cursor inválido")
+    try:
+        return [
+            datetime.fromisoformat(v) if columna.type.python_type is datetime else columna.type.python_type(v)
+            for columna, v in zip(columnas, datos)
+        ]
+    except (TypeError, ValueError) as e:
+        raise CursorInvalido("Cursor inválido") from e
+
+
+def keyset(query, columnas: Sequence, cursor: Optional[str] = None, descendente: bool = False):
+    """
+    Ordena `query` por `columnas` y, si hay cursor, se queda con las filas
+    posteriores a él. Todas las columnas van en el mismo sentido, así la
+    comparación es de tuplas y la resuelve el índice compuesto.
+    """
+    orden = [c.desc() if descendente else c.asc() for c in columnas]
+    query = query.order_by(*orden)
+    if cursor:
+        clave = tuple_(*columnas)
+        valores = tuple_(*decodificar(cursor, columnas))
+        query = query.filter(clave < valores if descendente else clave > valores)
+    return query
+
+
+def siguiente_cursor(items: Sequence, limit: int, columnas: Sequence) -> Optional[str]:
+    """Cursor de la página siguiente, o None si esta ya no venía llena."""
+    if not items or len(items) < limit:
+        return None
+    ultimo = items[-1]
+    return codificar([getattr(ultimo, c.key) for c in columnas])
+
+
+def paginar(response: Response, consulta: Callable[[], List], limit: int, columnas: Sequence) -> List:
+    """
+    Ejecuta `consulta` (que usa el cursor recibido) y deja el cursor de la
+    página siguiente en la cabecera `X-Next-Cursor`. El cuerpo sigue siendo la
+    lista de siempre, así los clientes que paginan con skip/limit no cambian.
+    """
+    try:
+        items = consulta()
+    except CursorInvalido as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    siguiente = siguiente_cursor(items, limit, columnas)
+    if siguiente:
+        response.headers[CABECERA_CURSOR] = siguiente
+    return items
@@ -0,0 +1,59 @@
+"""
+Reconciliación de los contadores de likes/dislikes con las tablas de votos.
+
+Recorre todos los votos, así que se lanza desde un solo sitio (un cron, p. ej.
+cada hora), no desde cada worker. En PostgreSQL toma un advisory lock: si ya
+hay otra reconciliación en marcha, esta termina sin hacer nada.
+
+Uso (desde backend/):
+    python -m app.reconciliar_votos
+"""
+import argparse
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from . import crud
+from .config import settings
+
+# Clave del advisory lock (cualquier entero fijo y propio de esta tarea)
+CLAVE_LOCK = 0x766F746F73  # "votos"
+
+
+def reconciliar(database_url: str, antiguedad_huerfanos_s: float = 300) -> int:
+    """Corrige los contadores descuadrados. Devuelve las filas corregidas, o -1 si ya había otra ejecución."""
+    engine = create_engine(database_url)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with engine.connect() as conexion:
+        if engine.dialect.name == "postgresql":
+            if not conexion.execute(text("SELECT pg_try_advisory_lock(:clave)"), {"clave": CLAVE_LOCK}).scalar():
+                return -1
+        try:
+            db = session_factory()
+            try:
+                return crud.reconciliar_contadores(db, antiguedad_huerfanos_s)
+            finally:
+                db.close()
+        finally:
+            if engine.dialect.name == "postgresql":
+                conexion.execute(text("SELECT pg_advisory_unlock(:clave)"), {"clave": CLAVE_LOCK})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcilia los contadores de votos del foro")
+    parser.add_argument("--database-url", default=settings.DATABASE_URL)
+    parser.add_argument(
+        "--huerfanos-s", type=float, default=300,
+        help="Aplicar las diferencias pendientes de más de estos segundos (su worker ya no las va a sumar)",
+    )
+    args = parser.parse_args(argv)
+
+    corregidas = reconciliar(args.database_url, args.huerfanos_s)
+    if corregidas < 0:
+        print("Ya hay otra reconciliación en marcha")
+    else:
+        print(f"Contadores corregidos: {corregidas}")
+
+
+if __name__ == "__main__":
+    main()
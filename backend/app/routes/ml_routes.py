@@ -1,46 +1,724 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from ..ia.model_loader import model
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Response, Header, Depends
+from fastapi.responses import PlainTextResponse
+from ..ia.model_loader import registry
+from ..ia.batcher import MicroBatcher
+from ..ia.executor import InferenceExecutor, InferenciaSaturada, CARRIL_GRATIS, CARRIL_PREMIUM
+from ..ia.cache import PredictionCache, hash_bytes, hash_perceptual
+from ..ia.postproceso import agregar_por_clase, consenso, filtrar, tensores_de_resultados
+from ..ia.decode import decodificar, leer_limitado, ImagenDemasiadoGrande
+from ..ia.timing import Cronometro, MetricasEtapas, prometheus_valores
+from ..ia.resolucion import PoliticaResolucion, parsear_niveles, MODO_AUTO, MODOS
+from ..ia.similares import IndiceSimilares
+from ..ia.catalogo import catalogo
+from ..ia.rafaga import VideoNoSoportado, frames_de_animacion, frames_de_video, identificar_rafaga
+from ..auth import get_current_user_optional
+from ..config import settings
+from ..database import get_db
+from .. import models
+from sqlalchemy.orm import Session
+import asyncio
+from contextlib import contextmanager
 import io
+import os
+import secrets
+import time
 from PIL import Image
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(prefix="/ia", tags=["ia"])
 
+
+def _predict_batch(images: List[Image.Image]):
+    """Una sola pasada de YOLO para todo el lote (un Results por imagen)."""
+    # La primera llamada carga el modelo (dentro del pool, no en el event loop).
+    # Todo el lote se infiere con la misma versión, aunque haya un cambio en medio.
+    return registry.predict(images)
+
+
+# Pool dedicado: model.predict nunca bloquea el event loop
+executor = InferenceExecutor(
+    max_workers=settings.IA_EXECUTOR_WORKERS,
+    max_queue=settings.IA_MAX_QUEUE,
+    reserva_premium=settings.IA_RESERVA_PREMIUM,
+)
+
+# Planificador compartido por todas las peticiones del worker
+batcher = MicroBatcher(
+    _predict_batch,
+    max_batch_size=settings.IA_BATCH_MAX_SIZE,
+    max_wait_ms=settings.IA_BATCH_MAX_WAIT_MS,
+    executor=executor,
+)
+
+# Caché de predicciones por contenido (reintentos y re-identificaciones)
+cache = PredictionCache(
+    max_entries=settings.IA_CACHE_MAX_ENTRIES,
+    ttl_s=settings.IA_CACHE_TTL_S,
+    disk_dir=settings.IA_CACHE_DIR,
+    disk_max_entries=settings.IA_CACHE_DISK_MAX_ENTRIES,
+    phash=settings.IA_CACHE_PHASH,
+    phash_max_dist=settings.IA_CACHE_PHASH_MAX_DIST,
+)
+
+# Histogramas de tiempos por etapa (expuestos en /ia/metrics)
+metricas = MetricasEtapas()
+
+# Resolución de entrada según la carga (modo 'auto') o el modo que pida el cliente
+politica = PoliticaResolucion(
+    parsear_niveles(settings.IA_IMGSZ_NIVELES),
+    cola_alta=settings.IA_RES_COLA_ALTA,
+    cola_baja=settings.IA_RES_COLA_BAJA,
+    p95_alto_ms=settings.IA_RES_P95_ALTO_MS,
+    p95_bajo_ms=settings.IA_RES_P95_BAJO_MS,
+    enfriamiento_s=settings.IA_RES_ENFRIAMIENTO_S,
+    activa=settings.IA_RES_ADAPTATIVA,
+)
+
+# Valores válidos del parámetro `modo`
+_PATRON_MODO = "^(auto|fast|accurate)$"
+
+
+def _agregar_predicciones(results) -> List[dict]:
+    """Media de confianza por clase (en %) ordenada de mayor a menor."""
+    # Los nombres de clase de la versión que hizo la inferencia, no de la actual
+    names = getattr(results[0], "names", None) if results else None
+    cls, conf = tensores_de_resultados(results)
+    return agregar_por_clase(cls, conf, names or registry.get().names)
+
+
+async def asegurar_catalogo(db: Session):
+    """Carga el índice clase -> variedad si hace falta (sin él, las predicciones van sin id)."""
+    if catalogo.vigente:
+        return
+    try:
+        await asyncio.to_thread(catalogo.cargar, db)
+    except Exception as e:
+        print(f"Error cargando el catálogo de variedades: {e}")
+
+
+def anotar(predicciones: List[dict]) -> List[dict]:
+    """Añade `id_variedad` y el resumen de la ficha a cada predicción (en memoria)."""
+    if registry.listo:
+        catalogo.enlazar(registry.get().names, registry.version)
+    return catalogo.anotar(predicciones)
+
+
+def _carril_y_plazo(usuario: Optional[models.Usuario], plazo_ms: Optional[float]):
+    """Carril y plazo (s) de una petición según el usuario."""
+    if usuario is not None and usuario.es_premium:
+        carril, plazo_defecto = CARRIL_PREMIUM, settings.IA_PLAZO_PREMIUM_MS
+    else:
+        carril, plazo_defecto = CARRIL_GRATIS, settings.IA_PLAZO_GRATIS_MS
+    # El cliente puede pedir un plazo más corto, nunca más largo que el de su carril
+    plazo = min(plazo_ms, plazo_defecto) if plazo_ms else plazo_defecto
+    return carril, plazo / 1000
+
+
+def _admision(usuario: Optional[models.Usuario], plazo_ms: Optional[float]):
+    """Carril y límite (time.monotonic) de una petición según el usuario."""
+    carril, plazo_s = _carril_y_plazo(usuario, plazo_ms)
+    return carril, time.monotonic() + plazo_s
+
+
+def _saturada(e: InferenciaSaturada) -> HTTPException:
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after_s)})
+
+
+@contextmanager
+def _reservar(carril: str, limite: float, n: int):
+    """
+    Admite `n` imágenes de una misma petición de golpe (todas o ninguna) y
+    libera sus plazas al terminar. Si no caben, 503 antes de inferir ninguna.
+    """
+    try:
+        executor.admitir(carril, limite - time.monotonic(), batcher.max_batch_size, n)
+    except InferenciaSaturada as e:
+        raise _saturada(e)
+    try:
+        yield
+    finally:
+        executor.liberar(carril, n)
+
+
+def comprobar_cabecera(image_bytes: bytes):
+    """Lanza una excepción si los bytes no son una imagen (solo lee la cabecera)."""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.size
+
+
+def _decodificar(image_bytes: bytes) -> Image.Image:
+    return decodificar(
+        image_bytes,
+        max_lado=settings.IA_DECODE_MAX_SIDE,
+        max_pixeles=settings.IA_MAX_PIXELS,
+    )
+
+
+async def _embed(images: List[Image.Image], carril: str = CARRIL_GRATIS, limite: Optional[float] = None):
+    """
+    Embeddings con la misma admisión que las predicciones: ocupan plazas de la
+    cola de su carril y se rechazan (InferenciaSaturada) si no caben o no
+    llegarían a tiempo.
+    """
+    plazo_s = None if limite is None else limite - time.monotonic()
+    executor.admitir(carril, plazo_s, batcher.max_batch_size, len(images))
+    try:
+        return await executor.run(registry.embed, images)
+    finally:
+        executor.liberar(carril, len(images))
+
+
+# Fotos parecidas y variedades más cercanas (ver app/ia/similares.py)
+similares = IndiceSimilares(
+    _embed,
+    lambda: registry.version,
+    _decodificar,
+    ruta=settings.IA_SIMILARES_PATH,
+    min_ann=settings.IA_ANN_MIN_VECTORES,
+    nprobe=settings.IA_ANN_NPROBE,
+    origenes=[o.strip() for o in (settings.IA_SIMILARES_ORIGENES or settings.IMAGEKIT_URL_ENDPOINT).split(",") if o.strip()],
+)
+
+
+async def leer_foto(file: UploadFile) -> bytes:
+    try:
+        return await leer_limitado(file, settings.IA_MAX_UPLOAD_BYTES)
+    except ImagenDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def _tiempos_inferencia(crono: Cronometro, result, total_ms: float):
+    """
+    Reparte el tiempo de `batcher.submit` en etapas. Ultralytics deja en
+    `result.speed` el preproceso, el forward y el NMS (ms por imagen); lo que
+    sobra es espera en la cola del batcher/executor.
+    """
+    speed = getattr(result, "speed", None) or {}
+    pre = speed.get("preprocess") or 0.0
+    inf = speed.get("inference") or 0.0
+    post = speed.get("postprocess") or 0.0
+    if not (pre or inf or post):
+        crono.add("inferencia", total_ms)
+        return
+    crono.add("cola", max(0.0, total_ms - pre - inf - post))
+    crono.add("preproceso", pre)
+    crono.add("inferencia", inf)
+    crono.add("nms", post)
+
+
+def _resultado(predicciones, cache_hit: bool, version: str, imgsz: int) -> dict:
+    return {"predicciones": predicciones, "cache_hit": cache_hit, "version_modelo": version, "resolucion": imgsz}
+
+
+async def _identificar(
+    image_bytes: bytes,
+    crono: Optional[Cronometro] = None,
+    carril: str = CARRIL_GRATIS,
+    limite: Optional[float] = None,
+    imgsz: Optional[int] = None,
+    admitida: bool = False,
+) -> dict:
+    """
+    Caché + decodificación + inferencia de una imagen.
+    Devuelve {predicciones, cache_hit, version_modelo, resolucion}. Lanza
+    HTTPException 400 si la imagen no es válida y 413 si supera el límite de píxeles.
+    Los tiempos de cada etapa se anotan en `crono` y en los histogramas globales.
+    `carril` y `limite` pasan al control de admisión (InferenciaSaturada si no
+    hay sitio o no llegaría a tiempo); con `admitida` la plaza ya está
+    reservada (ver `_reservar`). `imgsz` es la resolución de inferencia (por
+    defecto, la completa).
+    """
+    crono = crono if crono is not None else Cronometro()
+    imgsz = imgsz or politica.completa
+
+    # 1. Caché exacta: mismo fichero -> ni decodificamos ni inferimos.
+    # Vale una predicción hecha a esta resolución o a una mayor.
+    version = registry.version
+    with crono.etapa("cache"):
+        clave = hash_bytes(image_bytes)
+        for nivel in politica.aceptables(imgsz):
+            cached = await cache.aget(f"{clave}@{nivel}", version)
+            if cached is not None:
+                metricas.observar(crono)
+                return _resultado(cached, True, version, nivel)
+
+    # Decodificamos fuera del event loop (así varias imágenes se decodifican a la vez)
+    try:
+        with crono.etapa("decode"):
+            image = await asyncio.to_thread(_decodificar, image_bytes)
+    except ImagenDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    # 2. Caché perceptual (opcional): la misma foto recomprimida o reescalada.
+    # Solo guarda predicciones a resolución completa, así que valen para cualquier modo.
+    if cache.phash:
+        with crono.etapa("cache"):
+            phash = hash_perceptual(image)
+            cached = cache.get_perceptual(phash, version)
+        if cached is not None:
+            metricas.observar(crono)
+            return _resultado(cached, True, version, politica.completa)
+    else:
+        phash = None
+    cache.registrar_miss()
+
+    # Run inference (agrupada con otras peticiones concurrentes)
+    inicio = time.perf_counter()
+    result = await batcher.submit(image, carril, limite, imgsz, admitida)
+    inferencia_ms = (time.perf_counter() - inicio) * 1000
+    politica.observar(inferencia_ms)
+    _tiempos_inferencia(crono, result, inferencia_ms)
+
+    with crono.etapa("agregacion"):
+        predicciones = _agregar_predicciones([result])
+    version = getattr(result, "version_modelo", None) or version
+    # Si el modelo cambió mientras tanto, no guardamos un resultado de la versión retirada
+    if version == registry.version:
+        await cache.aset(f"{clave}@{imgsz}", predicciones, version, phash if imgsz == politica.completa else None)
+    metricas.observar(crono)
+    return _resultado(predicciones, False, version, imgsz)
+
+
+async def identificar(
+    image_bytes: bytes,
+    usuario: Optional[models.Usuario] = None,
+    modo: str = MODO_AUTO,
+    plazo_ms: Optional[float] = None,
+    crono: Optional[Cronometro] = None,
+) -> dict:
+    """
+    Identificación completa de una foto ya leída (admisión por carril, resolución
+    según `modo`, caché e inferencia) para otras rutas, p. ej. /coleccion/identificar.
+    Traduce la saturación a un 503 con Retry-After.
+    """
+    carril, limite = _admision(usuario, plazo_ms)
+    try:
+        imgsz = politica.elegir(modo, executor.pendientes)
+        return await _identificar(image_bytes, crono, carril, limite, imgsz)
+    except InferenciaSaturada as e:
+        raise _saturada(e)
+
+
+async def variedades_cercanas(
+    image_bytes: bytes, k: int = 3, carril: str = CARRIL_GRATIS, limite: Optional[float] = None,
+) -> Optional[List[dict]]:
+    """
+    Plan B cuando YOLO no detecta ninguna variedad: las variedades de las fotos
+    más parecidas del índice. None si el índice no está disponible o algo falla.
+    """
+    if not similares.listo:
+        return None
+    try:
+        image = await asyncio.to_thread(_decodificar, image_bytes)
+        encontrados = await similares.buscar(image, k, carril=carril, limite=limite)
+    except Exception as e:
+        print(f"Error buscando variedades cercanas: {e}")
+        return None
+    return encontrados["variedades_cercanas"] if encontrados else None
+
+
+def es_imagen(file: UploadFile) -> bool:
+    return (file.content_type or "").split("/")[0] == "image"
+
+
 @router.post("/predict")
-async def predict_image(file: UploadFile = File(...)):
+async def predict_image(
+    response: Response,
+    file: UploadFile = File(...),
+    top_k: Optional[int] = Query(None, ge=1, description="Devolver solo las k variedades más probables"),
+    min_confianza: float = Query(0.0, ge=0, le=100, description="Confianza mínima (%)"),
+    debug: bool = Query(False, description="Incluir los tiempos por etapa en la respuesta"),
+    plazo_ms: Optional[float] = Query(None, gt=0, description="Plazo máximo de la identificación (ms)"),
+    modo: str = Query(MODO_AUTO, pattern=_PATRON_MODO, description="auto | fast | accurate"),
+    usuario: Optional[models.Usuario] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db),
+):
     # Validación básica
-    if file.content_type.split("/")[0] != "image":
+    if not es_imagen(file):
         raise HTTPException(status_code=400, detail="File must be an image.")
 
-    # Leer bytes (no guardamos si no es necesario)
-    image_bytes = await file.read()
+    # El plazo cuenta desde que llega la petición (lectura y decodificación incluidas)
+    carril, limite = _admision(usuario, plazo_ms)
+    crono = Cronometro()
+
+    # Leer bytes con límite de tamaño (no guardamos si no es necesario)
+    with crono.etapa("lectura"):
+        image_bytes = await leer_foto(file)
+
+    try:
+        imgsz = politica.elegir(modo, executor.pendientes)
+        respuesta = await _identificar(image_bytes, crono, carril, limite, imgsz)
+    except InferenciaSaturada as e:
+        raise _saturada(e)
+
+    if not respuesta["predicciones"]:
+        with crono.etapa("similares"):
+            cercanas = await variedades_cercanas(image_bytes, carril=carril, limite=limite)
+        if cercanas is not None:
+            respuesta["variedades_cercanas"] = cercanas
+
+    await asegurar_catalogo(db)
+    response.headers["Server-Timing"] = crono.server_timing()
+    respuesta["predicciones"] = anotar(filtrar(respuesta["predicciones"], top_k, min_confianza))
+    respuesta["modo"] = modo
+    if debug:
+        respuesta["tiempos_ms"] = crono.as_dict()
+    return respuesta
+
+
+@router.post("/predict/batch")
+async def predict_batch(
+    response: Response,
+    files: List[UploadFile] = File(...),
+    top_k: Optional[int] = Query(None, ge=1, description="Devolver solo las k variedades más probables"),
+    min_confianza: float = Query(0.0, ge=0, le=100, description="Confianza mínima (%)"),
+    debug: bool = Query(False, description="Incluir los tiempos por etapa en la respuesta"),
+    plazo_ms: Optional[float] = Query(None, gt=0, description="Plazo máximo de la identificación (ms)"),
+    modo: str = Query(MODO_AUTO, pattern=_PATRON_MODO, description="auto | fast | accurate"),
+    usuario: Optional[models.Usuario] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db),
+):
+    """
+    Identifica N fotos (p. ej. de la misma planta) en una sola petición multipart.
+    Las imágenes se decodifican en paralelo y pasan juntas por el micro-batching,
+    así que se infieren en lotes reales. Devuelve las predicciones por imagen y
+    un consenso por variedad.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files received.")
+    if len(files) > settings.IA_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files ({len(files)}). Max: {settings.IA_BATCH_MAX_FILES}",
+        )
+
+    for f in files:
+        if not es_imagen(f):
+            raise HTTPException(status_code=400, detail=f"File must be an image: {f.filename}")
+
+    carril, limite = _admision(usuario, plazo_ms)
+    crono = Cronometro()
+    cronos = [Cronometro() for _ in files]
+    contenidos = []
+    for f, crono_imagen in zip(files, cronos):
+        with crono_imagen.etapa("lectura"):
+            contenidos.append(await leer_foto(f))
+        crono.add("lectura", crono_imagen.etapas["lectura"])
+
+    # Todas las imágenes a la vez y a la misma resolución: el batcher las agrupa en lotes
+    imgsz = politica.elegir(modo, executor.pendientes)
+    with crono.etapa("identificacion"), _reservar(carril, limite, len(contenidos)):
+        resultados = await asyncio.gather(
+            *(_identificar(b, c, carril, limite, imgsz, admitida=True) for b, c in zip(contenidos, cronos)),
+            return_exceptions=True,
+        )
+
+    # Admitidas todas, solo puede faltar alguna por plazo: 503 si no ha salido ninguna
+    saturadas = [res for res in resultados if isinstance(res, InferenciaSaturada)]
+    if saturadas and len(saturadas) == len(resultados):
+        raise _saturada(saturadas[0])
+
+    await asegurar_catalogo(db)
+    imagenes = []
+    validas = []
+    for f, res, crono_imagen in zip(files, resultados, cronos):
+        if isinstance(res, InferenciaSaturada):
+            imagenes.append({"archivo": f.filename, "error": str(res), "status": 503})
+            continue
+        if isinstance(res, HTTPException):
+            imagenes.append({"archivo": f.filename, "error": res.detail})
+            continue
+        if isinstance(res, Exception):
+            raise res
+        imagen = {"archivo": f.filename, **res}
+        imagen["predicciones"] = anotar(filtrar(res["predicciones"], top_k, min_confianza))
+        if debug:
+            imagen["tiempos_ms"] = crono_imagen.as_dict()
+        imagenes.append(imagen)
+        # El consenso cuenta lo mismo que se muestra por imagen: sin lo que no llega a `min_confianza`
+        validas.append(filtrar(res["predicciones"], min_confianza=min_confianza))
+
+    response.headers["Server-Timing"] = crono.server_timing()
+    respuesta = {
+        "imagenes": imagenes,
+        "consenso": anotar(filtrar(consenso(validas), top_k)),
+        "total_imagenes": len(files),
+        "imagenes_validas": len(validas),
+        "modo": modo,
+        "resolucion": imgsz,
+    }
+    if debug:
+        respuesta["tiempos_ms"] = crono.as_dict()
+    return respuesta
+
+
+def _es_video(file: UploadFile) -> bool:
+    return (file.content_type or "").split("/")[0] == "video"
+
+
+@router.post("/predict/rafaga")
+async def predict_rafaga(
+    response: Response,
+    files: List[UploadFile] = File(...),
+    umbral: Optional[float] = Query(None, gt=0, le=100, description="Puntuación del consenso (%) con la que se para"),
+    min_frames: Optional[int] = Query(None, ge=1, description="Frames válidos mínimos antes de parar"),
+    top_k: Optional[int] = Query(None, ge=1, description="Devolver solo las k variedades más probables"),
+    plazo_ms: Optional[float] = Query(None, gt=0, description="Plazo máximo de cada tanda de frames (ms)"),
+    modo: str = Query(MODO_AUTO, pattern=_PATRON_MODO, description="auto | fast | accurate"),
+    usuario: Optional[models.Usuario] = Depends(get_current_user_optional),
+    db: Session = Depends(get_db),
+):
+    """
+    Identifica una ráfaga de fotos, un GIF/WebP animado o un vídeo corto
+    (un único fichero video/*) de la misma planta.
+
+    Los frames se infieren por lotes y se para en cuanto la variedad principal
+    del consenso alcanza `umbral`: si los primeros frames son claros, el resto
+    ni se decodifica. Devuelve el consenso y cuántos frames hizo falta procesar.
+
+    `plazo_ms` vale para cada tanda (los frames que se infieren juntos), no
+    para la ráfaga entera. Si la cola se satura a mitad, se devuelve el
+    consenso de los frames ya procesados con el motivo en `interrumpida`.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files received.")
+    umbral = umbral if umbral is not None else settings.IA_RAFAGA_UMBRAL
+    min_frames = min_frames or settings.IA_RAFAGA_MIN_FRAMES
+    max_frames = settings.IA_RAFAGA_MAX_FRAMES
+    carril, plazo_s = _carril_y_plazo(usuario, plazo_ms)
+    imgsz = politica.elegir(modo, executor.pendientes)
+    crono = Cronometro()
+
+    if len(files) == 1 and (_es_video(files[0]) or files[0].content_type in ("image/gif", "image/webp", "image/apng")):
+        # Un solo fichero con varios frames: se decodifica a medida que hace falta
+        file = files[0]
+        try:
+            with crono.etapa("lectura"):
+                datos = await leer_limitado(file, settings.IA_RAFAGA_MAX_VIDEO_BYTES)
+        except ImagenDemasiadoGrande as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        extraer = frames_de_video if _es_video(file) else frames_de_animacion
+        try:
+            frames = extraer(datos, max_frames, settings.IA_DECODE_MAX_SIDE, settings.IA_MAX_PIXELS)
+        except ImagenDemasiadoGrande as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except (OSError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid video: {e}")
+        frames_totales = None
+
+        async def inferir(image: Image.Image, limite: float) -> List[dict]:
+            result = await batcher.submit(image, carril, limite, imgsz)
+            return _agregar_predicciones([result])
+    else:
+        if len(files) > max_frames:
+            raise HTTPException(status_code=413, detail=f"Too many frames ({len(files)}). Max: {max_frames}")
+        for f in files:
+            if not es_imagen(f):
+                raise HTTPException(status_code=400, detail=f"File must be an image: {f.filename}")
+        with crono.etapa("lectura"):
+            frames = [await leer_foto(f) for f in files]
+        frames_totales = len(frames)
+
+        async def inferir(image_bytes: bytes, limite: float) -> List[dict]:
+            try:
+                return (await _identificar(image_bytes, None, carril, limite, imgsz))["predicciones"]
+            except HTTPException as e:
+                # Un frame corrupto no invalida la ráfaga
+                raise ValueError(e.detail)
+
     try:
-        image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+        with crono.etapa("identificacion"):
+            resultado = await identificar_rafaga(
+                frames, inferir, lote=settings.IA_BATCH_MAX_SIZE, umbral=umbral, min_frames=min_frames, plazo_s=plazo_s,
+            )
+    except InferenciaSaturada as e:
+        raise _saturada(e)
+    except VideoNoSoportado as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ImagenDemasiadoGrande as e:
+        # Vídeo con frames de más de IA_MAX_PIXELS (se sabe al abrirlo)
+        raise HTTPException(status_code=413, detail=str(e))
+    except (OSError, ValueError) as e:
+        # Los errores de cada frame se recogen en la respuesta: esto es el vídeo/animación entero
+        raise HTTPException(status_code=400, detail=f"Invalid video: {e}")
+
+    await asegurar_catalogo(db)
+    response.headers["Server-Timing"] = crono.server_timing()
+    resultado["consenso"] = anotar(filtrar(resultado["consenso"], top_k))
+    resultado.update({
+        "frames_totales": frames_totales,
+        "umbral": umbral,
+        "modo": modo,
+        "resolucion": imgsz,
+    })
+    return resultado
+
+
+@router.post("/similares")
+async def fotos_similares(
+    file: UploadFile = File(...),
+    k: int = Query(10, ge=1, le=50, description="Número de fotos y de variedades a devolver"),
+    usuario: Optional[models.Usuario] = Depends(get_current_user_optional),
+):
+    """
+    Avistamientos parecidos a la foto (fotos de referencia de la biblioteca y de
+    la colección del propio usuario) y las variedades más cercanas.
+    """
+    if not es_imagen(file):
+        raise HTTPException(status_code=400, detail="File must be an image.")
+    if not similares.listo:
+        raise HTTPException(status_code=503, detail=f"Índice de fotos parecidas {similares.estado}")
+
+    carril, limite = _admision(usuario, None)
+    image_bytes = await leer_foto(file)
+    try:
+        image = await asyncio.to_thread(_decodificar, image_bytes)
+    except ImagenDemasiadoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
 
-    # Run inference
-    results = model.predict(image, save=False, verbose=False)  # list-like
+    inicio = time.perf_counter()
+    try:
+        encontrados = await similares.buscar(
+            image, k, usuario.id_usuario if usuario is not None else None, carril=carril, limite=limite
+        )
+    except InferenciaSaturada as e:
+        raise _saturada(e)
+    if encontrados is None:
+        # El modelo cambió de versión: el índice se está reconstruyendo
+        raise HTTPException(status_code=503, detail="Índice de fotos parecidas reconstruyéndose")
+    encontrados["tiempo_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
+    return encontrados
+
+
+@router.get("/estado")
+def estado_inferencia():
+    """Estado del modelo, tamaño del pool, cola y tiempos de espera."""
+    return {
+        "modelo": registry.info(),
+        "executor": executor.stats(),
+        "cache": cache.stats(),
+        "resolucion": politica.stats(),
+        "similares": similares.stats(),
+        "catalogo": catalogo.stats(),
+        "etapas": metricas.stats(),
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Métricas en formato Prometheus: histogramas por etapa, executor, caché y resolución."""
+    return (
+        metricas.prometheus()
+        + prometheus_valores(
+            executor.stats(), "vitia_ia_executor",
+            {clave: "counter" for clave in (
+                "rechazadas", "rechazadas_premium", "rechazadas_gratis", "descartadas_plazo", "tareas",
+            )},
+        )
+        + prometheus_valores(
+            cache.stats(), "vitia_ia_cache",
+            {"hits": "counter", "hits_disco": "counter", "hits_perceptual": "counter", "misses": "counter"},
+        )
+        + prometheus_valores(
+            politica.stats(), "vitia_ia_resolucion",
+            {"degradaciones": "counter", "recuperaciones": "counter"},
+        )
+    )
+
+
+def _pesos_en_directorio(nombre: str) -> str:
+    """
+    Ruta de `nombre` dentro de IA_MODELS_DIR. Solo se aceptan nombres de
+    fichero `.pt` de ese directorio: cargar unos pesos es deserializarlos
+    (pickle), así que una ruta arbitraria permitiría ejecutar código.
+    """
+    if not registry.models_dir:
+        raise HTTPException(status_code=400, detail="Sin IA_MODELS_DIR solo se pueden recargar los pesos configurados")
+    if nombre != os.path.basename(nombre) or nombre in (".", "..") or not nombre.endswith(".pt"):
+        raise HTTPException(status_code=400, detail="Indica solo el nombre de un fichero .pt de IA_MODELS_DIR")
+    directorio = os.path.realpath(registry.models_dir)
+    ruta = os.path.realpath(os.path.join(directorio, nombre))
+    # realpath resuelve los enlaces simbólicos: tampoco se puede salir por ahí
+    if os.path.dirname(ruta) != directorio:
+        raise HTTPException(status_code=400, detail="Los pesos tienen que estar dentro de IA_MODELS_DIR")
+    return ruta
+
+
+@router.post("/modelo/recargar", status_code=202)
+async def recargar_modelo(
+    nombre: Optional[str] = Query(None, description="Fichero .pt de IA_MODELS_DIR (por defecto, el más reciente)"),
+    x_admin_token: Optional[str] = Header(None),
+):
+    """
+    Cambia de versión del modelo sin reiniciar: carga y calienta en segundo plano
+    y después intercambia. El progreso se ve en /ia/estado. Requiere IA_ADMIN_TOKEN.
+    """
+    if not settings.IA_ADMIN_TOKEN or not secrets.compare_digest(x_admin_token or "", settings.IA_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if registry.serving_mode == "sidecar":
+        raise HTTPException(status_code=409, detail="En modo sidecar el modelo se cambia en el sidecar")
+    if registry.cambiando:
+        raise HTTPException(status_code=409, detail="Ya hay un cambio de versión en curso")
+
+    destino = _pesos_en_directorio(nombre) if nombre else registry.candidato()
+    if not destino or not os.path.exists(destino):
+        raise HTTPException(status_code=404, detail=f"No existen los pesos {destino}")
+
+    asyncio.create_task(_cambiar_modelo(destino))
+    return {"status": "cargando", "ruta": destino, "version_actual": registry.version}
+
+
+async def _cambiar_modelo(ruta: str):
+    try:
+        await asyncio.to_thread(registry.cambiar, ruta)
+    except Exception as e:
+        print(f"Error cambiando de versión del modelo: {e}")
+
+
+@router.get("/ready")
+def readiness():
+    """200 si el modelo está cargado; 503 mientras no lo esté (readiness probe)."""
+    if not registry.listo:
+        raise HTTPException(status_code=503, detail=f"Modelo {registry.estado}")
+    return {"status": "ready", "modelo": registry.info()}
+
+
+async def warmup():
+    """Carga y calienta el modelo en el pool de inferencia."""
+    try:
+        await executor.run(registry.warmup)
+    except Exception as e:
+        print(f"Error calentando el modelo: {e}")
+
+
+def cargar_catalogo():
+    """Carga el catálogo de variedades al arrancar (si falla, se carga en la 1ª petición)."""
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        catalogo.cargar(db)
+    except Exception as e:
+        print(f"Error cargando el catálogo de variedades: {e}")
+    finally:
+        db.close()
 
-    # Collect confidences per class
-    class_confidences = {}
-    for r in results:
-        for box in r.boxes:
-            cls_id = int(box.cls)
-            conf = float(box.conf)
-            cls_name = model.names[cls_id]
-            class_confidences.setdefault(cls_name, []).append(conf)
 
-    # compute average/confidence per class (in percentage)
-    averaged = [{ "variedad": cls, "confianza": round((sum(confs)/len(confs))*100, 2)}
-                for cls, confs in class_confidences.items()]
+async def iniciar_similares():
+    """
+    Carga o construye el índice de fotos parecidas (en segundo plano) y después
+    lo rehace cuando cambia la versión del modelo.
+    """
+    from ..database import SessionLocal
 
-    # If you want include all classes with 0.0 for missing:
-    '''for idx, name in model.names.items():
-        if name not in [d["variedad"] for d in averaged]:
-            averaged.append({"variedad": name, "confianza": 0.0})'''
+    await similares.iniciar(SessionLocal)
+    await similares.vigilar(settings.IA_SIMILARES_VIGILAR_S)
 
-    # sort by confianza desc
-    averaged.sort(key=lambda x: x["confianza"], reverse=True)
 
-    return {"predicciones": averaged}
+async def vigilar_modelos():
+    """Pone en servicio los pesos nuevos que aparezcan (ver IA_MODELS_DIR)."""
+    await registry.vigilar(settings.IA_MODEL_WATCH_S)
@@ -1,15 +1,22 @@
 # --- Reemplaza el contenido de /app/routes/routes_coleccion.py con esto ---
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Response, status, UploadFile, File, Form
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+import asyncio
 
 # Importaciones relativas
 from .. import crud, models, schemas
 from ..database import get_db
-from ..auth import get_current_user  # <-- ¡Importamos el REAL!
-from ..services.imagekit_service import upload_image_to_imagekit
-from datetime import datetime
+from ..auth import get_current_user, create_pending_upload_token, decode_pending_upload_token  # <-- ¡Importamos el REAL!
+from ..config import settings
+from ..paginacion import paginar
+from ..services.imagekit_service import delete_image_from_imagekit, upload_image_to_imagekit, upload_image_with_id
+from ..ia.resolucion import MODO_AUTO
+from ..ia.similares import meta_avistamiento
+from ..ia.catalogo import catalogo
+from . import ml_routes
+from datetime import datetime, timedelta, timezone
 
 router = APIRouter(
     prefix="/coleccion",
@@ -27,10 +34,13 @@ router = APIRouter(
 )
 def create_coleccion_item_endpoint(
     item: schemas.ColeccionCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_user) # <-- Dependencia real
 ):
-    return crud.create_coleccion_item(db=db, item=item, id_usuario=current_user.id_usuario)
+    db_item = crud.create_coleccion_item(db=db, item=item, id_usuario=current_user.id_usuario)
+    _indexar(background_tasks, db_item)
+    return db_item
 
 
 @router.get("/",
@@ -38,12 +48,22 @@ def create_coleccion_item_endpoint(
     summary="Obtener la colección personal del usuario"
 )
 def read_user_coleccion_endpoint(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_user) # <-- Dependencia real
 ):
-    return crud.get_user_coleccion(db=db, id_usuario=current_user.id_usuario, skip=skip, limit=limit)
+    """La más reciente primero. Para seguir, `cursor` = cabecera `X-Next-Cursor` anterior."""
+    return paginar(
+        response,
+        lambda: crud.get_user_coleccion(
+            db=db, id_usuario=current_user.id_usuario, skip=skip, limit=limit, cursor=cursor
+        ),
+        limit,
+        crud.ORDEN_COLECCION,
+    )
 
 
 @router.get("/{id_coleccion}",
@@ -71,6 +91,7 @@ def read_coleccion_item_endpoint(
 def update_coleccion_item_endpoint(
     id_coleccion: int,
     item_update: schemas.ColeccionUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_user) # <-- Dependencia real
 ):
@@ -85,7 +106,10 @@ def update_coleccion_item_endpoint(
             detail="Item de colección no encontrado o no pertenece al usuario"
         )
     
-    return crud.update_coleccion_item(db=db, db_item=db_item, item_update=item_update)
+    db_item = crud.update_coleccion_item(db=db, db_item=db_item, item_update=item_update)
+    # Puede haber cambiado la foto o la variedad: sustituye la entrada del índice
+    _indexar(background_tasks, db_item)
+    return db_item
 
 
 @router.delete("/{id_coleccion}",
@@ -103,50 +127,215 @@ def delete_coleccion_item_endpoint(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Item de colección no encontrado o no pertenece al usuario"
         )
+    ml_routes.similares.eliminar(f"col:{id_coleccion}")
     # Don't return the object as it is detached and might have lazy loads
     return {"message": "Item eliminado correctamente", "id": id_coleccion}
 
+def _indexar(background_tasks: BackgroundTasks, item: models.Coleccion, image_bytes: Optional[bytes] = None):
+    """Añade el avistamiento al índice de fotos parecidas después de responder."""
+    if ml_routes.similares.activo:
+        background_tasks.add_task(ml_routes.similares.agregar, meta_avistamiento(item), image_bytes)
+
+
+def _id_variedad(db: Session, id_variedad: Optional[int] = None, nombre_variedad: Optional[str] = None) -> int:
+    """
+    Variedad del item sin ir a la base de datos: el id que manda la app (el de
+    la predicción) o el nombre, resueltos con el catálogo en memoria. Solo si
+    no está se consulta la biblioteca y, para un nombre nuevo, se crea al vuelo.
+    """
+    catalogo.asegurar(db)
+    if id_variedad is not None:
+        if catalogo.por_id(id_variedad) is None:
+            variedad_db = crud.get_variedad(db, id_variedad)
+            if variedad_db is None:
+                raise HTTPException(status_code=404, detail="Variedad no encontrada")
+            catalogo.agregar(variedad_db)
+        return id_variedad
+
+    if not nombre_variedad:
+        raise HTTPException(status_code=422, detail="Hace falta id_variedad o nombre_variedad")
+    resumen = catalogo.por_nombre(nombre_variedad)
+    if resumen is not None:
+        return resumen["id_variedad"]
+    variedad_db = crud.get_variedad_by_nombre(db, nombre_variedad)
+    if variedad_db is None:
+        print(f"Variedad '{nombre_variedad}' no existe. Creándola...")
+        variedad_db = crud.create_variedad_automatica(db, nombre_variedad)
+    catalogo.agregar(variedad_db)
+    return variedad_db.id_variedad
+
+
+def _guardar_item(db: Session, id_usuario: int, id_variedad: int, image_url: str,
+                  notas: Optional[str], latitud: Optional[float], longitud: Optional[float]) -> models.Coleccion:
+    nuevo_item = models.Coleccion(
+        id_usuario=id_usuario,
+        id_variedad=id_variedad,
+        path_foto_usuario=image_url,
+        fecha_captura=datetime.utcnow(),
+        notas=notas,
+        latitud=latitud,
+        longitud=longitud
+    )
+    db.add(nuevo_item)
+    db.commit()
+    db.refresh(nuevo_item)
+    return nuevo_item
+
+
 @router.post("/upload", response_model=schemas.Coleccion)
 async def create_coleccion_with_image(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
-    nombre_variedad: str = Form(...), # <--- CAMBIO: Recibimos NOMBRE, no ID
+    nombre_variedad: str = Form(None),
+    id_variedad: int = Form(None),  # Si la app lo tiene (viene en /ia/predict), no se busca por nombre
     notas: str = Form(None),
     latitud: float = Form(None),
     longitud: float = Form(None),
     current_user: models.Usuario = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # 1. Lógica inteligente: Buscar ID o Crear Variedad
-    # Usamos las funciones que creamos en crud.py
-    variedad_db = crud.get_variedad_by_nombre(db, nombre_variedad)
-    
-    if not variedad_db:
-        # ¡Si no existe, la creamos al vuelo!
-        print(f"Variedad '{nombre_variedad}' no existe. Creándola...")
-        variedad_db = crud.create_variedad_automatica(db, nombre_variedad)
-    
-    id_real_variedad = variedad_db.id_variedad
+    # 0. Variedad desde el catálogo en memoria (antes de subir nada)
+    id_variedad = _id_variedad(db, id_variedad, nombre_variedad)
 
-    # 2. Subir imagen (Igual que antes)
+    # 1. Subir imagen (fuera del event loop: el SDK de ImageKit es bloqueante)
     try:
         file_bytes = await file.read()
-        image_url = upload_image_to_imagekit(file_bytes, file.filename)
+        image_url = await asyncio.to_thread(upload_image_to_imagekit, file_bytes, file.filename)
     except Exception as e:
         raise HTTPException(status_code=500, detail="Error ImageKit")
 
-    # 3. Guardar en Colección usando el ID real que acabamos de obtener
-    nuevo_item = models.Coleccion(
-        id_usuario=current_user.id_usuario,
-        id_variedad=id_real_variedad, # <--- Usamos el ID recuperado/creado
-        path_foto_usuario=image_url,
-        fecha_captura=datetime.utcnow(),
-        notas=notas,
-        latitud=latitud,
-        longitud=longitud
+    # 2. Guardar en Colección
+    item = _guardar_item(db, current_user.id_usuario, id_variedad, image_url, notas, latitud, longitud)
+    _indexar(background_tasks, item, file_bytes)
+    return item
+
+
+async def _descartar_subida(file_id: str):
+    """Borra la foto subida en paralelo a una identificación que no llega a guardarse."""
+    try:
+        await asyncio.to_thread(delete_image_from_imagekit, file_id)
+    except Exception as e:
+        print(f"No se pudo borrar de ImageKit la foto {file_id}: {e}")
+
+
+@router.post("/identificar", response_model=schemas.ColeccionIdentificada)
+async def identificar_y_guardar(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    guardar: bool = Form(True),  # False -> el usuario confirma la variedad con /coleccion/confirmar
+    notas: str = Form(None),
+    latitud: float = Form(None),
+    longitud: float = Form(None),
+    modo: str = Form(MODO_AUTO),
+    current_user: models.Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Identifica la foto y la sube a ImageKit A LA VEZ, recibiendo la imagen una
+    sola vez (antes eran /ia/predict + /coleccion/upload con los mismos bytes).
+
+    - guardar=True: crea el item con la variedad más probable.
+    - guardar=False: devuelve un `token_pendiente` de vida corta; el usuario
+      elige la variedad y la app llama a /coleccion/confirmar sin reenviar la foto.
+      Si no confirma antes de que caduque, la foto se borra de ImageKit
+      (ver services/subidas_service.py).
+    """
+    if not ml_routes.es_imagen(file):
+        raise HTTPException(status_code=400, detail="File must be an image.")
+    if modo not in ml_routes.MODOS:
+        raise HTTPException(status_code=422, detail=f"Modo no válido: {modo}")
+    file_bytes = await ml_routes.leer_foto(file)
+    # Comprobación barata (solo la cabecera) para no subir ficheros que no son imágenes
+    try:
+        ml_routes.comprobar_cabecera(file_bytes)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    identificacion, subida = await asyncio.gather(
+        ml_routes.identificar(file_bytes, current_user, modo),
+        asyncio.to_thread(upload_image_with_id, file_bytes, file.filename),
+        return_exceptions=True,
     )
-    
-    db.add(nuevo_item)
-    db.commit()
-    db.refresh(nuevo_item)
-    
-    return nuevo_item
\ No newline at end of file
+    if isinstance(identificacion, Exception):
+        # Si la subida sí terminó, no dejamos la foto huérfana en ImageKit
+        if not isinstance(subida, Exception):
+            await _descartar_subida(subida[1])
+        raise identificacion
+    if isinstance(subida, Exception):
+        raise HTTPException(status_code=500, detail="Error ImageKit")
+    subida, file_id = subida
+
+    await ml_routes.asegurar_catalogo(db)
+    respuesta = {
+        "predicciones": ml_routes.anotar(identificacion["predicciones"]),
+        "version_modelo": identificacion["version_modelo"],
+        "resolucion": identificacion["resolucion"],
+        "path_foto_usuario": subida,
+    }
+
+    if guardar:
+        if not identificacion["predicciones"]:
+            await _descartar_subida(file_id)
+            raise HTTPException(
+                status_code=422,
+                detail="No se ha reconocido ninguna variedad; usa guardar=false y confírmala a mano",
+            )
+        mejor = respuesta["predicciones"][0]
+        id_variedad = _id_variedad(db, mejor["id_variedad"], mejor["variedad"])
+        respuesta["coleccion"] = _guardar_item(
+            db, current_user.id_usuario, id_variedad, subida, notas, latitud, longitud
+        )
+        _indexar(background_tasks, respuesta["coleccion"], file_bytes)
+        return respuesta
+
+    if not identificacion["predicciones"]:
+        # Sugerencias para que el usuario elija la variedad a mano
+        respuesta["variedades_cercanas"] = await ml_routes.variedades_cercanas(file_bytes)
+
+    # La foto queda apuntada en la base: si no se confirma, la limpieza la borra de ImageKit
+    expira = datetime.now(timezone.utc) + timedelta(minutes=settings.PENDING_UPLOAD_EXPIRE_MINUTES)
+    id_subida = crud.crear_subida_pendiente(db, current_user.id_usuario, file_id, subida, expira)
+    respuesta["token_pendiente"] = create_pending_upload_token({
+        "id_usuario": current_user.id_usuario,
+        "id_subida": id_subida,
+        "path_foto_usuario": subida,
+        "notas": notas,
+        "latitud": latitud,
+        "longitud": longitud,
+    })
+    respuesta["expira_en_s"] = settings.PENDING_UPLOAD_EXPIRE_MINUTES * 60
+    return respuesta
+
+
+@router.post("/confirmar", response_model=schemas.Coleccion, status_code=status.HTTP_201_CREATED)
+def confirmar_identificacion(
+    confirmacion: schemas.ColeccionConfirmar,
+    background_tasks: BackgroundTasks,
+    current_user: models.Usuario = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Guarda en la colección una identificación pendiente con la variedad que elige el usuario."""
+    datos = decode_pending_upload_token(confirmacion.token_pendiente)
+    if datos is None or datos.get("id_usuario") != current_user.id_usuario:
+        raise HTTPException(status_code=400, detail="Token de subida no válido o caducado")
+
+    # Un mismo token no guarda la foto dos veces
+    duplicado = db.query(models.Coleccion).filter(
+        models.Coleccion.id_usuario == current_user.id_usuario,
+        models.Coleccion.path_foto_usuario == datos["path_foto_usuario"],
+    ).first()
+    if duplicado is not None:
+        raise HTTPException(status_code=409, detail="Esta foto ya está en la colección")
+
+    id_variedad = _id_variedad(db, confirmacion.id_variedad, confirmacion.nombre_variedad)
+    # La subida deja de estar pendiente en la misma transacción que guarda el item
+    if not crud.quitar_subida_pendiente(db, datos.get("id_subida"), current_user.id_usuario):
+        raise HTTPException(status_code=400, detail="Token de subida no válido o caducado")
+    item = _guardar_item(
+        db, current_user.id_usuario, id_variedad, datos["path_foto_usuario"],
+        confirmacion.notas if confirmacion.notas is not None else datos.get("notas"),
+        datos.get("latitud"), datos.get("longitud"),
+    )
+    # La foto ya no está en esta petición: el índice la descarga de ImageKit
+    _indexar(background_tasks, item)
+    return item
\ No newline at end of file
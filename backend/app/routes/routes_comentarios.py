@@ -1,12 +1,15 @@
 # --- Archivo NUEVO: app/routes/routes_comentario.py ---
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from .. import crud, models, schemas
 from ..database import get_db
 from ..auth import get_current_user
+from ..config import settings
+from ..paginacion import paginar
+from ..services.votos_service import acumulador
 
 router = APIRouter(
     prefix="/comentarios",
@@ -40,14 +43,32 @@ def create_comentario_endpoint(
 )
 def read_comentarios_publicacion(
     id_publicacion: int,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    id_padre: Optional[int] = None,
+    profundidad: int = Query(settings.FORO_MAX_PROFUNDIDAD, ge=0, le=50),
+    respuestas: int = Query(settings.FORO_MAX_RESPUESTAS, ge=0, le=500),
     db: Session = Depends(get_db)
 ):
     """
     Devuelve los comentarios en estructura de árbol (anidados).
+    Los comentarios principales se paginan con `cursor` (cabecera `X-Next-Cursor`).
+
+    - **profundidad**: niveles de respuestas bajo cada comentario.
+    - **respuestas**: respuestas por comentario. Si un comentario tiene más (o
+      más niveles), llega con `hay_mas_respuestas`; se piden con `id_padre`.
     """
-    return crud.get_comentarios_publicacion(db=db, id_publicacion=id_publicacion, skip=skip, limit=limit)
+    return paginar(
+        response,
+        lambda: crud.get_comentarios_publicacion(
+            db=db, id_publicacion=id_publicacion, skip=skip, limit=limit, cursor=cursor,
+            id_padre=id_padre, max_profundidad=profundidad, max_respuestas=respuestas
+        ),
+        limit,
+        crud.ORDEN_COMENTARIOS,
+    )
 
 @router.delete("/{id_comentario}",
     summary="Eliminar un comentario"
@@ -69,5 +90,5 @@ def votar_comentario_endpoint(
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_user)
 ):
-    estado = crud.votar_comentario(db, current_user.id_usuario, id_comentario, voto.es_like)
+    estado = crud.votar_comentario(db, current_user.id_usuario, id_comentario, voto.es_like, acumulador.sumador())
     return {"msg": estado}
\ No newline at end of file
@@ -1,13 +1,16 @@
 # --- Archivo NUEVO: /app/routes/routes_publicacion.py ---
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 # Importaciones relativas
 from .. import crud, models, schemas
+from ..config import settings
 from ..database import get_db
 from ..auth import get_current_user  # Importamos nuestra dependencia de autenticación
+from ..paginacion import paginar
+from ..services.votos_service import acumulador
 
 router = APIRouter(
     prefix="/publicaciones",
@@ -19,6 +22,27 @@ from ..services.imagekit_service import upload_image_to_imagekit
 
 # ... imports ...
 
+# Comentarios que se incrustan en cada publicación de los listados; el hilo
+# completo está en /comentarios/publicacion/{id}
+_COMENTARIOS_FEED = dict(
+    comentarios=settings.FORO_FEED_COMENTARIOS,
+    max_profundidad=settings.FORO_FEED_PROFUNDIDAD,
+    max_respuestas=settings.FORO_FEED_RESPUESTAS,
+)
+
+def _con_votos(db: Session, publicaciones: List[models.Publicacion], id_usuario: int):
+    """
+    Rellena 'is_liked' / 'is_disliked' con el voto del usuario actual.
+    Una sola consulta para toda la página, no una por publicación.
+    """
+    votos = crud.get_votos_usuario_publicaciones(db, id_usuario, [pub.id_publicacion for pub in publicaciones])
+    for pub in publicaciones:
+        voto = votos.get(pub.id_publicacion)
+        # Asignamos los atributos dinámicamente. Pydantic (from_attributes=True) los leerá.
+        pub.is_liked = voto is True
+        pub.is_disliked = voto is False
+    return publicaciones
+
 @router.post("/",
     response_model=schemas.Publicacion,
     status_code=status.HTTP_201_CREATED,
@@ -79,8 +103,10 @@ async def create_publicacion_endpoint(
     summary="Obtener todas las publicaciones del foro (Feed)"
 )
 def read_publicaciones_endpoint(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_user)
 ):
@@ -89,55 +115,49 @@ def read_publicaciones_endpoint(
     ordenadas por fecha (la más reciente primero).
     
     Incluye el estado 'is_liked' para el usuario actual.
-    """
-    publicaciones = crud.get_publicaciones(db, skip=skip, limit=limit)
-    
-    # Enriquecer con is_liked
-    for pub in publicaciones:
-        # Verificar si existe un voto del usuario actual para esta publicación
-        voto = db.query(models.VotoPublicacion).filter(
-            models.VotoPublicacion.id_publicacion == pub.id_publicacion,
-            models.VotoPublicacion.id_usuario == current_user.id_usuario,
-            models.VotoPublicacion.es_like == True
-        ).first()
-        
-        # Asignamos el atributo dinámicamente. 
-        # Pydantic (from_attributes=True) lo leerá.
-        pub.is_liked = (voto is not None)
 
-    return publicaciones
+    Para hacer scroll, pasa en `cursor` la cabecera `X-Next-Cursor` de la
+    respuesta anterior (no llega en la última página).
+    """
+    publicaciones = paginar(
+        response,
+        lambda: crud.get_publicaciones(db, skip=skip, limit=limit, cursor=cursor, **_COMENTARIOS_FEED),
+        limit,
+        crud.ORDEN_PUBLICACIONES,
+    )
+    return _con_votos(db, publicaciones, current_user.id_usuario)
 
 @router.get("/me",
     response_model=List[schemas.Publicacion],
     summary="Obtener todas las publicaciones del usuario actual"
 )
 def read_user_publicaciones_endpoint(
+    response: Response,
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_user),
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
     """
     Obtiene una lista paginada de todas las publicaciones
-    creadas por el usuario actualmente autenticado.
+    creadas por el usuario actualmente autenticado (con cursor como el feed).
     """
-    publicaciones = crud.get_user_publicaciones(
-        db=db, 
-        id_usuario=current_user.id_usuario, 
-        skip=skip, 
-        limit=limit
+    publicaciones = paginar(
+        response,
+        lambda: crud.get_user_publicaciones(
+            db=db,
+            id_usuario=current_user.id_usuario,
+            skip=skip,
+            limit=limit,
+            cursor=cursor,
+            **_COMENTARIOS_FEED
+        ),
+        limit,
+        crud.ORDEN_PUBLICACIONES,
     )
-    
-    # Enriquecer con is_liked (el usuario puede dar like a sus propios posts)
-    for pub in publicaciones:
-        voto = db.query(models.VotoPublicacion).filter(
-            models.VotoPublicacion.id_publicacion == pub.id_publicacion,
-            models.VotoPublicacion.id_usuario == current_user.id_usuario,
-            models.VotoPublicacion.es_like == True
-        ).first()
-        pub.is_liked = (voto is not None)
-
-    return publicaciones
+    # El usuario puede votar sus propios posts
+    return _con_votos(db, publicaciones, current_user.id_usuario)
 
 @router.delete("/{id_publicacion}",
     response_model=schemas.Publicacion,
@@ -186,7 +206,7 @@ def votar_publicacion_endpoint(
     - **es_like: false** -> Dislike
     - **es_like: null** -> Borrar voto (Neutro)
     """
-    estado = crud.votar_publicacion(db, current_user.id_usuario, id_publicacion, voto.es_like)
+    estado = crud.votar_publicacion(db, current_user.id_usuario, id_publicacion, voto.es_like, acumulador.sumador())
     return {"msg": estado}
 
 @router.post("/{id_publicacion}/like", summary="Dar Like (Legacy)")
@@ -196,7 +216,7 @@ def like_publicacion_endpoint(
     current_user: models.Usuario = Depends(get_current_user)
 ):
     """Endpoint simplificado para dar like (compatible con frontend anterior)"""
-    return crud.votar_publicacion(db, current_user.id_usuario, id_publicacion, True)
+    return crud.votar_publicacion(db, current_user.id_usuario, id_publicacion, True, acumulador.sumador())
 
 @router.post("/{id_publicacion}/unlike", summary="Quitar Like (Legacy)")
 def unlike_publicacion_endpoint(
@@ -206,4 +226,4 @@ def unlike_publicacion_endpoint(
 ):
     """Endpoint simplificado para quitar like (compatible con frontend anterior)"""
     # Unlike suele significar 'quitar el like', es decir, volver a neutro (None)
-    return crud.votar_publicacion(db, current_user.id_usuario, id_publicacion, None)
+    return crud.votar_publicacion(db, current_user.id_usuario, id_publicacion, None, acumulador.sumador())
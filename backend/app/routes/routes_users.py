@@ -1,16 +1,17 @@
 # --- Archivo NUEVO: /app/routes/routes_user.py ---
 
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File
 from sqlalchemy.orm import Session
 import os
 import base64
 from imagekitio import ImageKit
 
 # Importaciones relativas
-from typing import List
+from typing import List, Optional
 from .. import crud, models, schemas
 from ..database import get_db
 from ..auth import get_current_user  # Importamos nuestra dependencia de autenticación
+from ..paginacion import paginar
 
 # Inicializar ImageKit (Reutilizando configuración)
 from imagekitio.models.UploadFileRequestOptions import UploadFileRequestOptions
@@ -93,13 +94,23 @@ def delete_users_me(
 
 @router.get("/me/favoritos", response_model=List[schemas.Variedad], summary="Ver mis favoritos")
 def get_mis_favoritos(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: models.Usuario = Depends(get_current_user)
 ):
     """
     Obtiene la lista de variedades marcadas como favoritas por el usuario.
+    Paginada con skip/limit o con `cursor` (cabecera `X-Next-Cursor`).
     """
-    return crud.get_user_favoritos(db, current_user.id_usuario)
+    return paginar(
+        response,
+        lambda: crud.get_user_favoritos(db, current_user.id_usuario, skip=skip, limit=limit, cursor=cursor),
+        limit,
+        crud.ORDEN_FAVORITOS,
+    )
 
 @router.post("/me/avatar", response_model=schemas.Usuario, summary="Subir o actualizar foto de perfil")
 def upload_avatar_me(
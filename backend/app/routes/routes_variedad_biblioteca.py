@@ -6,6 +6,7 @@ from typing import List
 from .. import crud, models, schemas
 from ..database import get_db
 from ..auth import get_current_user
+from ..ia.catalogo import catalogo
 
 router = APIRouter(
     prefix="/variedades",  # Prefijo para todas las rutas de este archivo
@@ -40,7 +41,10 @@ def create_variedad_endpoint(
         )
     
     # Llama a la función CRUD para crearla
-    return crud.create_variedad(db=db, variedad=variedad)
+    db_variedad = crud.create_variedad(db=db, variedad=variedad)
+    # El índice en memoria de la IA se recarga en la próxima predicción
+    catalogo.invalidar()
+    return db_variedad
 
 
 @router.get("/", 
@@ -100,7 +104,9 @@ def update_variedad_endpoint(
         )
     
     # Llama a la función CRUD para actualizar
-    return crud.update_variedad(db=db, db_variedad=db_variedad, variedad_update=variedad_update)
+    db_variedad = crud.update_variedad(db=db, db_variedad=db_variedad, variedad_update=variedad_update)
+    catalogo.invalidar()
+    return db_variedad
 
 
 @router.delete("/{id_variedad}", 
@@ -122,6 +128,7 @@ def delete_variedad_endpoint(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Variedad no encontrada"
         )
+    catalogo.invalidar()
     return db_variedad
 
 @router.get("/check/{id_variedad}", 
@@ -115,6 +115,48 @@ class ColeccionUpdate(BaseModel):
     latitud: Optional[float] = None
     longitud: Optional[float] = None
 
+class ResumenVariedad(BaseModel):
+    """Lo mínimo de la ficha de una variedad para pintar una predicción."""
+    id_variedad: int
+    nombre: str
+    color: Optional[str] = None
+    imagen: Optional[str] = None
+
+class PrediccionVariedad(BaseModel):
+    """Una variedad candidata devuelta por el modelo de IA."""
+    variedad: str
+    confianza: float
+    id_variedad: Optional[int] = None  # None si la clase no está en la biblioteca
+    resumen: Optional[ResumenVariedad] = None
+
+class VariedadCercana(BaseModel):
+    """Variedad sugerida por las fotos más parecidas cuando el modelo no detecta ninguna."""
+    id_variedad: int
+    variedad: Optional[str] = None
+    similitud: float
+    votos: int
+
+class ColeccionIdentificada(BaseModel):
+    """
+    Respuesta de /coleccion/identificar: la predicción y, según el modo,
+    el item ya guardado o un token para confirmarlo con /coleccion/confirmar.
+    """
+    predicciones: List[PrediccionVariedad]
+    variedades_cercanas: Optional[List[VariedadCercana]] = None
+    version_modelo: Optional[str] = None
+    resolucion: Optional[int] = None
+    path_foto_usuario: str
+    coleccion: Optional[Coleccion] = None
+    token_pendiente: Optional[str] = None
+    expira_en_s: Optional[int] = None
+
+class ColeccionConfirmar(BaseModel):
+    """Confirmación de una identificación pendiente (la variedad la elige el usuario)."""
+    token_pendiente: str
+    id_variedad: Optional[int] = None  # Preferible: el de la predicción elegida
+    nombre_variedad: Optional[str] = None
+    notas: Optional[str] = None
+
 # -----------------------------------------------------
 # Esquemas: Publicacion (Foro)
 # -----------------------------------------------------
@@ -148,7 +190,9 @@ class Publicacion(PublicacionBase, BaseConfig):
     # Mostramos la información del autor usando el esquema reducido
     autor: AutorPublicacion
     likes: int
+    dislikes: int = 0
     is_liked: Optional[bool] = None # <-- Indicar si el usuario actual le dio like
+    is_disliked: Optional[bool] = None # <-- ...o si le dio dislike
     variedades: List[Variedad] = []
     comentarios: List['Comentario'] = []
 # -----------------------------------------------------
@@ -227,6 +271,7 @@ class Comentario(ComentarioBase, BaseConfig):
     id_comentario: int
     fecha_comentario: datetime
     likes: int
+    dislikes: int = 0
     id_usuario: int
     id_publicacion: int
     id_padre: Optional[int] = None
@@ -236,6 +281,10 @@ class Comentario(ComentarioBase, BaseConfig):
     # RECURSIVIDAD: Un comentario puede tener una lista de comentarios (hijos)
     # Usamos List['Comentario'] entre comillas porque la clase se está definiendo ahora mismo
     hijos: List['Comentario'] = [] 
+    # En /comentarios/publicacion/{id} el hilo viene recortado: respuestas directas
+    # que tiene en total y si faltan algunas en 'hijos'
+    num_respuestas: Optional[int] = None
+    hay_mas_respuestas: bool = False
 
 # Esto es necesario para que Pydantic resuelva la referencia circular (hijos -> Comentario)
 Comentario.model_rebuild()
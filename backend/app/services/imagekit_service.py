@@ -15,6 +15,11 @@ imagekit = ImageKit(
 )
 
 def upload_image_to_imagekit(file_bytes: bytes, filename: str, folder: str = "/vitia") -> str:
+    image_url, _ = upload_image_with_id(file_bytes, filename, folder)
+    return image_url
+
+def upload_image_with_id(file_bytes: bytes, filename: str, folder: str = "/vitia"):
+    """Como upload_image_to_imagekit, pero devuelve (url, file_id) para poder borrarla después."""
     try:
         encoded_string = base64.b64encode(file_bytes).decode("utf-8")
 
@@ -47,8 +52,12 @@ def upload_image_to_imagekit(file_bytes: bytes, filename: str, folder: str = "/v
         if not image_url:
             raise Exception("La respuesta de ImageKit no contiene URL")
 
-        return image_url
+        return image_url, upload.file_id
 
     except Exception as e:
         print("EXCEPCIÓN EN IMAGEKIT:", str(e))
-        raise
\ No newline at end of file
+        raise
+
+def delete_image_from_imagekit(file_id: str):
+    """Borra de ImageKit una imagen subida que al final no se guarda."""
+    imagekit.delete_file(file_id=file_id)
@@ -0,0 +1,66 @@
+import asyncio
+from typing import Callable, Optional
+
+from .. import crud, models
+from ..config import settings
+from ..database import SessionLocal
+from . import imagekit_service
+
+
+class LimpiezaSubidas:
+    """
+    Borra de ImageKit las fotos de /coleccion/identificar (guardar=False) que
+    nadie confirmó antes de caducar su token.
+
+    Cada foto subida queda apuntada en SubidasPendientes; /coleccion/confirmar
+    quita la fila al guardar el item. Lo que siga ahí pasada su fecha ya no se
+    puede confirmar: cada `intervalo_s` se retiran esas filas y se borran sus
+    fotos. Puede correr en todos los workers a la vez (cada fila se la lleva
+    uno solo); si ImageKit falla, la fila vuelve a la tabla para el siguiente
+    intento.
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal, intervalo_s: float = 300):
+        self.session_factory = session_factory
+        self.intervalo_s = intervalo_s
+        self._tarea: Optional[asyncio.Task] = None
+
+    def limpiar(self) -> int:
+        """Borra las fotos caducadas. Devuelve cuántas ha borrado."""
+        db = self.session_factory()
+        try:
+            caducadas = crud.retirar_subidas_caducadas(db)
+            borradas = 0
+            for id_usuario, file_id, path_foto, expira in caducadas:
+                try:
+                    imagekit_service.delete_image_from_imagekit(file_id)
+                    borradas += 1
+                except Exception as e:
+                    print(f"No se pudo borrar de ImageKit la foto {file_id} (se reintentará): {e}")
+                    db.add(models.SubidaPendiente(
+                        id_usuario=id_usuario, file_id=file_id, path_foto=path_foto, expira=expira,
+                    ))
+            db.commit()
+            return borradas
+        finally:
+            db.close()
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo_s)
+            try:
+                await asyncio.to_thread(self.limpiar)
+            except Exception as e:
+                print(f"Error limpiando las subidas pendientes: {e}")
+
+    def iniciar(self):
+        if self._tarea is None or self._tarea.done():
+            self._tarea = asyncio.create_task(self._bucle())
+
+    def detener(self):
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+
+
+limpieza = LimpiezaSubidas(intervalo_s=settings.PENDING_UPLOAD_CLEANUP_S)
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+from typing import Callable, List, Optional
+
+from .. import crud
+from ..config import settings
+from ..database import SessionLocal
+
+
+class AcumuladorVotos:
+    """
+    Agrupa las escrituras de los contadores de likes/dislikes.
+
+    En un post muy votado, cada voto haría su propio UPDATE sobre la misma fila
+    de Publicaciones y todos esperarían al bloqueo de esa fila. Con el
+    acumulador, el voto y su diferencia (una fila de ContadoresPendientes, solo
+    INSERT) se guardan al momento, y el contador se actualiza cada
+    `intervalo_ms` o cada `max_eventos` votos con un solo UPDATE por fila que
+    suma todo lo acumulado (crud.aplicar_pendientes).
+
+    Como las diferencias pendientes están en la base y no solo en memoria, el
+    reconciliador las descuenta (no las cuenta dos veces) y, si el proceso muere
+    sin vaciar, las aplica él pasado un rato. Lo pendiente se escribe también
+    al apagar (`detener`).
+    """
+
+    def __init__(self, session_factory: Callable = SessionLocal, intervalo_ms: float = 200, max_eventos: int = 500):
+        self.session_factory = session_factory
+        self.intervalo_ms = intervalo_ms
+        self.max_eventos = max_eventos
+        self._pendientes: List[int] = []  # ids de ContadoresPendientes escritos por este proceso
+        self._lock = threading.Lock()
+        # Un solo vaciado a la vez: así no se reordenan dos tandas de la misma fila
+        self._vaciando = threading.Lock()
+        self._tarea: Optional[asyncio.Task] = None
+        self.escrituras = 0  # Filas de contador actualizadas (para medir)
+
+    @property
+    def activo(self) -> bool:
+        return self._tarea is not None and not self._tarea.done()
+
+    def sumador(self) -> Optional[Callable]:
+        """`registrar` si el vaciado periódico está en marcha; si no, None (contador al momento)."""
+        return self.registrar if self.activo else None
+
+    def registrar(self, id_pendiente: int):
+        with self._lock:
+            self._pendientes.append(id_pendiente)
+            lleno = len(self._pendientes) >= self.max_eventos
+        if lleno:
+            self.vaciar()
+
+    def vaciar(self) -> int:
+        """Suma lo pendiente a los contadores. Devuelve cuántas filas ha actualizado."""
+        with self._vaciando:
+            with self._lock:
+                ids, self._pendientes = self._pendientes, []
+            if not ids:
+                return 0
+            db = self.session_factory()
+            try:
+                actualizadas = crud.aplicar_pendientes(db, ids=ids)
+            except Exception as e:
+                print(f"Error escribiendo los contadores de votos (se reintentará): {e}")
+                with self._lock:
+                    self._pendientes[:0] = ids
+                return 0
+            finally:
+                db.close()
+            self.escrituras += actualizadas
+            return actualizadas
+
+    async def _bucle(self):
+        while True:
+            await asyncio.sleep(self.intervalo_ms / 1000)
+            await asyncio.to_thread(self.vaciar)
+
+    def iniciar(self):
+        if not self.activo:
+            self._tarea = asyncio.create_task(self._bucle())
+
+    async def detener(self):
+        """Para el vaciado periódico y escribe lo que quede pendiente."""
+        if self._tarea is not None:
+            self._tarea.cancel()
+            self._tarea = None
+        await asyncio.to_thread(self.vaciar)
+
+
+acumulador = AcumuladorVotos(
+    intervalo_ms=settings.FORO_VOTOS_INTERVALO_MS,
+    max_eventos=settings.FORO_VOTOS_MAX_EVENTOS,
+)
@@ -3,8 +3,10 @@ import pytest
 import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from app.database import Base, get_db
 from app.main import app
+from app.ia.catalogo import catalogo
 from fastapi.testclient import TestClient
 
 # --- PARTE NUEVA: ENSEÑAR A SQLITE A ENTENDER JSONB ---
@@ -20,9 +22,12 @@ def compile_jsonb_sqlite(type_, compiler, **kw):
 # Usamos SQLite en memoria para tests
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 
+# StaticPool: una sola conexión compartida, así las rutas (que el TestClient
+# ejecuta en otro hilo) ven las mismas tablas en memoria que el test
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -31,6 +36,8 @@ def db_session():
     """Crea una base de datos limpia para cada test"""
     # Crea las tablas
     Base.metadata.create_all(bind=engine)
+    # El catálogo en memoria de variedades es del proceso: que no arrastre ids de otro test
+    catalogo.invalidar()
     db = TestingSessionLocal()
     try:
         yield db
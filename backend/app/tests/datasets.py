@@ -0,0 +1,126 @@
+# backend/app/tests/datasets.py
+# Muestras de validación compartidas por test_identificacion.py y por el
+# benchmark de inferencia (python -m app.ia.benchmark).
+import os
+
+SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "samples")
+
+# DEFINICIÓN DE TUS GRUPOS DE PRUEBA
+# Estructura: "NOMBRE_DEL_SET": [ (archivo, clase, confianza_minima), ... ]
+DATASETS = {
+    "DATASET_ALTA_CALIDAD": [
+    # Ahmer Bounamer
+("ahmerbounamer1.jpg", "Ahmer Bounamer", 0.50),
+("ahmerbounamer2.jpg", "Ahmer Bounamer", 0.50),
+("ahmerbounamer3.jpg", "Ahmer Bounamer", 0.50),
+
+# Aledo
+("aledo1.jpg", "Aledo", 0.50),
+("aledo2.jpg", "Aledo", 0.50),
+("aledo3.jpg", "Aledo", 0.50),
+
+# Fernandella
+("fernandella1.jpg", "Fernandella", 0.50),
+("fernandella2.jpg", "Fernandella", 0.50),
+("fernandella3.jpg", "Fernandella", 0.50),
+
+# Jacquet
+("jacquet1.jpg", "Jacquet", 0.50),
+("jacquet2.jpg", "Jacquet", 0.50),
+("jacquet3.jpg", "Jacquet", 0.50),
+
+# Merseguera
+("merseguera1.jpg", "Merseguera", 0.50),
+("merseguera2.jpg", "Merseguera", 0.50),
+("merseguera3.jpg", "Merseguera", 0.50),
+
+# Moscatell
+("moscatells1.jpg", "Moscatell", 0.50),
+("moscatells2.jpg", "Moscatell", 0.50),
+("moscatells3.jpg", "Moscatell", 0.50),
+
+# Planta fina de pedralba
+("plantafinapedralba1.jpg", "Planta fina de pedralba", 0.50),
+("plantafinapedralba2.jpg", "Planta fina de pedralba", 0.50),
+("plantafinapedralba3.jpg", "Planta fina de pedralba", 0.50),
+
+# Roseti
+("roseti1.jpg", "Roseti", 0.50),
+("roseti2.jpg", "Roseti", 0.50),
+("roseti3.jpg", "Roseti", 0.50),
+
+# Trepadell
+("trepadell1.jpg", "Trepadell", 0.50),
+("trepadell2.jpg", "Trepadell", 0.50),
+("trepadell3.jpg", "Trepadell", 0.50),
+
+# Chardonay
+("chardonay1.jpg", "Chardonay", 0.50),
+("chardonay2.jpg", "Chardonay", 0.50),
+("chardonay3.jpg", "Chardonay", 0.50),
+
+# Tintorera
+("tintorera1.jpg", "Tintorera", 0.50),
+("tintorera2.jpg", "Tintorera", 0.50),
+("tintorera3.jpg", "Tintorera", 0.50),
+
+# Monastrell
+("monastrell1.jpg", "Monastrell", 0.50),
+("monastrell2.jpg", "Monastrell", 0.50),
+("monastrell3.jpg", "Monastrell", 0.50),
+
+# Cabernet-Sauvignon
+("cabernetsauvignon1.jpg", "Cabernet-Sauvignon", 0.50),
+("cabernetsauvignon2.jpg", "Cabernet-Sauvignon", 0.50),
+("cabernetsauvignon3.jpg", "Cabernet-Sauvignon", 0.50),
+
+# De Cuerno
+("decuerno1.jpg", "De Cuerno", 0.50),
+("decuerno2.jpg", "De Cuerno", 0.50),
+("decuerno3.jpg", "De Cuerno", 0.50),
+
+# Garnacha
+("garnacha1.jpg", "Garnacha", 0.50),
+("garnacha2.jpg", "Garnacha", 0.50),
+("garnacha3.jpg", "Garnacha", 0.50),
+
+# Merlot
+("merlot1.jpg", "Merlot", 0.50),
+("merlot2.jpg", "Merlot", 0.50),
+("merlot3.jpg", "Merlot", 0.50),
+
+# Valenci negre
+("valencinegre1.jpg", "Valenci negre", 0.50),
+("valencinegre2.jpg", "Valenci negre", 0.50),
+("valencinegre3.jpg", "Valenci negre", 0.50),
+
+# Valensi blanc
+("valenciblanc1.jpg", "Valensi blanc", 0.50),
+("valenciblanc2.jpg", "Valensi blanc", 0.50),
+("valenciblanc3.jpg", "Valensi blanc", 0.50),
+
+# raim de tots sants
+("raimtotssants1.jpg", "Raim de tots sants", 0.50),
+("raimtotssants2.jpg", "Raim de tots sants", 0.50),
+("raimtotssants3.jpg", "Raim de tots sants", 0.50),
+
+    ],
+    "DATASET_BAJA_CALIDAD": [
+    ("LQahmer1.JPG", "Ahmer Bounamer", 0.50),
+    ("LQmerseguera1.JPG", "Merseguera", 0.50),
+    ("LQmerseguera2.JPG", "Merseguera", 0.50),
+    ("LQmonastrell1.JPG", "Monastrell", 0.50),
+    ("LQmoscatell1.JPG", "Moscatell", 0.50),
+    ("LQmoscatell2.JPG", "Moscatell", 0.50),
+    ("LQmoscatell3.JPG", "Moscatell", 0.50),
+    ("LQmoscatell4.JPG", "Moscatell", 0.50),
+    ("LQmoscatell5.JPG", "Moscatell", 0.50),
+    ("LQtotsants1.JPG", "Raim de tots sants", 0.50),
+    ("LQtrepadell1.JPG", "Trepadell", 0.50),
+    ("LQtrepadell2.JPG", "Trepadell", 0.50),
+    ("LQvalencinegre1.JPG", "Valenci negre", 0.50),  
+    ("LQvalencinegre2.JPG", "Valenci negre", 0.50),  
+    ("LQvalensiblanc1.JPG", "Valensi blanc", 0.50),  
+    ("LQvalensiblanc2.JPG", "Valensi blanc", 0.50), 
+    ]
+}
@@ -0,0 +1,231 @@
+# tests/test_batcher.py
+import asyncio
+import threading
+import time
+import pytest
+from app.ia.batcher import MicroBatcher
+from app.ia.executor import (
+    CARRIL_GRATIS, CARRIL_PREMIUM, InferenceExecutor, InferenciaSaturada, PlazoAgotado,
+)
+
+
+def test_peticiones_concurrentes_se_agrupan_en_un_lote():
+    """Varias peticiones simultáneas -> UNA llamada a predict con todas las imágenes."""
+    llamadas = []
+
+    def fake_predict(images):
+        llamadas.append(list(images))
+        return [f"res-{img}" for img in images]
+
+    batcher = MicroBatcher(fake_predict, max_batch_size=8, max_wait_ms=50)
+
+    async def escenario():
+        resultados = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.close()
+        return resultados
+
+    resultados = asyncio.run(escenario())
+
+    # Cada petición recibe SU resultado, en su orden
+    assert resultados == [f"res-{i}" for i in range(5)]
+    assert len(llamadas) == 1
+    assert llamadas[0] == [0, 1, 2, 3, 4]
+
+
+def test_respeta_tamano_maximo_de_lote():
+    llamadas = []
+
+    def fake_predict(images):
+        llamadas.append(len(images))
+        return images
+
+    batcher = MicroBatcher(fake_predict, max_batch_size=2, max_wait_ms=50)
+
+    async def escenario():
+        resultados = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.close()
+        return resultados
+
+    assert asyncio.run(escenario()) == [0, 1, 2, 3, 4]
+    assert llamadas == [2, 2, 1]
+
+
+def test_peticion_aislada_no_supera_la_espera_maxima():
+    """Una petición sola no espera más que el presupuesto configurado."""
+    batcher = MicroBatcher(lambda images: images, max_batch_size=8, max_wait_ms=20)
+
+    async def escenario():
+        inicio = time.perf_counter()
+        await batcher.submit("img")
+        transcurrido = time.perf_counter() - inicio
+        await batcher.close()
+        return transcurrido
+
+    assert asyncio.run(escenario()) < 0.5
+
+
+def test_error_en_inferencia_se_propaga_a_todas_las_peticiones():
+    def fake_predict(images):
+        raise RuntimeError("modelo roto")
+
+    batcher = MicroBatcher(fake_predict, max_batch_size=4, max_wait_ms=10)
+
+    async def escenario():
+        resultados = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        await batcher.close()
+        return resultados
+
+    resultados = asyncio.run(escenario())
+    assert all(isinstance(r, RuntimeError) for r in resultados)
+
+
+def test_faltan_resultados_falla_el_lote_en_vez_de_colgarse():
+    def fake_predict(images):
+        return images[:-1]
+
+    batcher = MicroBatcher(fake_predict, max_batch_size=4, max_wait_ms=10)
+
+    async def escenario():
+        peticiones = asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+        resultados = await asyncio.wait_for(peticiones, timeout=2)
+        await batcher.close()
+        return resultados
+
+    resultados = asyncio.run(escenario())
+    assert all(isinstance(r, RuntimeError) for r in resultados)
+
+
+def test_cola_llena_rechaza_con_inferencia_saturada():
+    """Con el executor dedicado, superar max_queue se rechaza en vez de esperar."""
+    liberar = threading.Event()
+
+    def fake_predict(images):
+        liberar.wait(timeout=5)
+        return images
+
+    executor = InferenceExecutor(max_workers=1, max_queue=2)
+    batcher = MicroBatcher(fake_predict, max_batch_size=1, max_wait_ms=0, executor=executor)
+
+    async def escenario():
+        t1 = asyncio.ensure_future(batcher.submit(1))
+        t2 = asyncio.ensure_future(batcher.submit(2))
+        await asyncio.sleep(0.05)
+        with pytest.raises(InferenciaSaturada):
+            await batcher.submit(3)
+        liberar.set()
+        resultados = await asyncio.gather(t1, t2)
+        await batcher.close()
+        return resultados
+
+    assert asyncio.run(escenario()) == [1, 2]
+    stats = executor.stats()
+    assert stats["rechazadas"] == 1
+    assert stats["pendientes"] == 0
+    assert stats["workers"] == 1
+    executor.shutdown()
+
+
+def test_reserva_premium_y_prioridad_en_la_cola():
+    """Las plazas reservadas solo las usa premium, y premium sale antes de la cola."""
+    liberar = threading.Event()
+    orden = []
+
+    def fake_predict(images):
+        liberar.wait(timeout=5)
+        orden.extend(images)
+        return images
+
+    executor = InferenceExecutor(max_workers=1, max_queue=4, reserva_premium=1)
+    batcher = MicroBatcher(fake_predict, max_batch_size=1, max_wait_ms=0, executor=executor)
+
+    async def escenario():
+        # g1 ocupa el modelo; g2 y g3 esperan en la cola
+        tareas = [asyncio.ensure_future(batcher.submit(f"g{i}", CARRIL_GRATIS)) for i in (1, 2, 3)]
+        await asyncio.sleep(0.05)
+        # La última plaza está reservada: un gratuito más se rechaza, un premium no
+        with pytest.raises(InferenciaSaturada):
+            await batcher.submit("g4", CARRIL_GRATIS)
+        tareas.append(asyncio.ensure_future(batcher.submit("p1", CARRIL_PREMIUM)))
+        await asyncio.sleep(0.05)
+        liberar.set()
+        await asyncio.gather(*tareas)
+        await batcher.close()
+
+    asyncio.run(escenario())
+    assert orden == ["g1", "p1", "g2", "g3"]
+    stats = executor.stats()
+    assert stats["rechazadas_gratis"] == 1 and stats["rechazadas_premium"] == 0
+    executor.shutdown()
+
+
+def test_plazos_descartan_antes_de_inferir():
+    """Fuera de plazo en la cola -> PlazoAgotado sin llegar al modelo; y si la
+    espera estimada ya supera el plazo, se rechaza al admitir."""
+    liberar = threading.Event()
+    inferidas = []
+
+    def fake_predict(images):
+        liberar.wait(timeout=5)
+        inferidas.extend(images)
+        return images
+
+    executor = InferenceExecutor(max_workers=1, max_queue=8)
+    batcher = MicroBatcher(fake_predict, max_batch_size=1, max_wait_ms=0, executor=executor)
+
+    async def escenario():
+        bloqueante = asyncio.ensure_future(batcher.submit("a"))
+        await asyncio.sleep(0.05)
+        con_prisa = asyncio.ensure_future(batcher.submit("b", limite=time.monotonic() + 0.05))
+        await asyncio.sleep(0.1)
+        liberar.set()
+        await bloqueante
+        with pytest.raises(PlazoAgotado):
+            await con_prisa
+
+        # Ya hay una media de servicio (~150 ms por lote): un plazo de 1 ms no se admite
+        with pytest.raises(InferenciaSaturada) as info:
+            await batcher.submit("c", limite=time.monotonic() + 0.001)
+        assert info.value.retry_after_s >= 1
+        await batcher.close()
+
+    asyncio.run(escenario())
+    assert inferidas == ["a"]
+    stats = executor.stats()
+    assert stats["descartadas_plazo"] == 1
+    assert stats["pendientes"] == 0
+    executor.shutdown()
+
+
+def test_lotes_en_paralelo_hasta_max_workers():
+    """Con dos hilos de inferencia se ejecutan dos lotes a la vez, nunca tres."""
+    liberar = threading.Event()
+    lock = threading.Lock()
+    activos = []
+    maximo = []
+
+    def fake_predict(images):
+        with lock:
+            activos.append(1)
+            maximo.append(len(activos))
+        liberar.wait(timeout=5)
+        with lock:
+            activos.pop()
+        return images
+
+    executor = InferenceExecutor(max_workers=2, max_queue=8)
+    batcher = MicroBatcher(fake_predict, max_batch_size=1, max_wait_ms=0, executor=executor)
+
+    async def escenario():
+        tareas = [asyncio.ensure_future(batcher.submit(i)) for i in range(4)]
+        await asyncio.sleep(0.1)
+        en_ejecucion = executor.stats()["en_ejecucion"]
+        liberar.set()
+        resultados = await asyncio.gather(*tareas)
+        await batcher.close()
+        return en_ejecucion, resultados
+
+    en_ejecucion, resultados = asyncio.run(escenario())
+    assert resultados == [0, 1, 2, 3]
+    assert en_ejecucion == 2
+    assert max(maximo) == 2
+    executor.shutdown()
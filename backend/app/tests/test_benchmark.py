@@ -0,0 +1,61 @@
+# tests/test_benchmark.py
+import io
+import json
+import numpy as np
+from PIL import Image
+from app.ia.benchmark import ejecutar_benchmark, percentiles
+
+
+class FakeBoxes:
+    cls = np.array([0, 1, 0])
+    conf = np.array([0.9, 0.4, 0.7], dtype=np.float32)
+
+
+class FakeResult:
+    boxes = FakeBoxes()
+
+
+class FakeModel:
+    names = {0: "Merlot", 1: "Garnacha"}
+
+    def __init__(self):
+        self.lotes = []
+
+    def predict(self, images, save=False, verbose=False):
+        images = images if isinstance(images, list) else [images]
+        self.lotes.append(len(images))
+        return [FakeResult() for _ in images]
+
+
+def _jpeg():
+    buffer = io.BytesIO()
+    Image.new("RGB", (320, 240), (80, 120, 40)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_percentiles():
+    p = percentiles(list(range(1, 101)))
+    assert p["n"] == 100
+    assert p["p50_ms"] == 50.5
+    assert p["p99_ms"] >= p["p95_ms"] >= p["p50_ms"]
+    assert percentiles([]) == {"n": 0}
+
+
+def test_barrido_genera_json_comparable():
+    model = FakeModel()
+    informe = ejecutar_benchmark(
+        model, [_jpeg()], niveles_concurrencia=[1, 4], lotes=[1, 4],
+        peticiones=8, warmup=2, meta={"backend": "fake"},
+    )
+
+    assert informe["meta"]["backend"] == "fake"
+    assert len(informe["ejecuciones"]) == 4
+    for fila in informe["ejecuciones"]:
+        assert fila["peticiones"] == 8
+        assert set(fila["etapas"]) == {"decode", "inferencia", "postproceso", "total"}
+        assert fila["etapas"]["total"]["n"] == 8
+        assert fila["throughput_rps"] > 0
+
+    # Con concurrencia 4 y lote 4 el batcher agrupa imágenes
+    assert max(model.lotes) > 1
+    json.dumps(informe)  # Serializable
@@ -0,0 +1,134 @@
+# tests/test_catalogo.py
+import io
+import pytest
+from PIL import Image
+from sqlalchemy import event
+from app import crud, models, schemas
+from app.auth import get_current_user
+from app.main import app
+from app.ia.cache import PredictionCache
+from app.ia.catalogo import CatalogoVariedades, catalogo
+from app.routes import ml_routes, routes_coleccion
+
+
+def _jpeg(size=(200, 100)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, (120, 60, 30)).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def biblioteca(db_session):
+    merlot = models.Variedad(nombre="Merlot", descripcion="-", color="Tinta", links_imagenes=["https://ref/merlot.jpg"])
+    albarino = models.Variedad(nombre="Albariño", descripcion="-", color="Blanca")
+    db_session.add_all([merlot, albarino])
+    db_session.commit()
+    return {"Merlot": merlot.id_variedad, "Albariño": albarino.id_variedad}
+
+
+@pytest.fixture
+def consultas(db_session):
+    """SELECT sobre la tabla Variedades ejecutados mientras dura el test."""
+    sentencias = []
+
+    def _registrar(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and '"Variedades"' in statement:
+            sentencias.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", _registrar)
+    yield sentencias
+    event.remove(engine, "before_cursor_execute", _registrar)
+
+
+def test_enlaza_clases_del_modelo_con_la_biblioteca(db_session, biblioteca):
+    indice = CatalogoVariedades()
+    indice.cargar(db_session)
+    indice.enlazar({0: "merlot", 1: "ALBARIÑO ", 2: "Syrah"}, "v1")
+
+    assert indice.por_clase(0)["id_variedad"] == biblioteca["Merlot"]
+    assert indice.por_clase(1)["id_variedad"] == biblioteca["Albariño"]
+    assert indice.por_clase(2) is None
+    assert indice.stats()["clases_enlazadas"] == 2
+
+    anotadas = indice.anotar([{"variedad": "merlot", "confianza": 90.0}, {"variedad": "Syrah", "confianza": 5.0}])
+    assert anotadas[0]["id_variedad"] == biblioteca["Merlot"]
+    assert anotadas[0]["resumen"] == {
+        "id_variedad": biblioteca["Merlot"], "nombre": "Merlot", "color": "Tinta", "imagen": "https://ref/merlot.jpg",
+    }
+    assert anotadas[1]["id_variedad"] is None
+
+
+def test_rutas_de_la_biblioteca_invalidan_el_catalogo(client, db_session, biblioteca):
+    catalogo.cargar(db_session)
+    assert catalogo.vigente
+    assert client.post("/variedades/", json={"nombre": "Syrah", "descripcion": "-"}).status_code == 201
+    assert not catalogo.vigente
+
+    catalogo.cargar(db_session)
+    assert client.delete(f"/variedades/{biblioteca['Merlot']}").status_code == 200
+    assert not catalogo.vigente
+
+
+def test_recargar_olvida_las_variedades_borradas(db_session, biblioteca):
+    indice = CatalogoVariedades()
+    indice.cargar(db_session)
+    indice.enlazar({0: "Merlot", 1: "Albariño"}, "v1")
+    assert indice.por_nombre("Merlot")["id_variedad"] == biblioteca["Merlot"]
+
+    db_session.query(models.Variedad).filter(models.Variedad.id_variedad == biblioteca["Merlot"]).delete()
+    db_session.commit()
+    indice.cargar(db_session)
+
+    # Aún sin volver a enlazar las clases, ni por clase ni por nombre
+    assert indice.por_clase(0) is None
+    assert indice.por_nombre("Merlot") is None
+    indice.enlazar({0: "Merlot", 1: "Albariño"}, "v1")
+    assert indice.por_nombre("Merlot") is None
+    assert indice.por_nombre("Albariño")["id_variedad"] == biblioteca["Albariño"]
+
+
+def test_predict_devuelve_id_y_resumen(client, biblioteca, monkeypatch):
+    monkeypatch.setattr(ml_routes.batcher, "predict_fn", lambda images, imgsz=None: list(images))
+    monkeypatch.setattr(ml_routes, "_agregar_predicciones", lambda results: [{"variedad": "Merlot", "confianza": 91.0}])
+    monkeypatch.setattr(ml_routes, "cache", PredictionCache())
+
+    response = client.post("/ia/predict", files={"file": ("a.jpg", _jpeg(), "image/jpeg")})
+    assert response.status_code == 200
+    prediccion = response.json()["predicciones"][0]
+    assert prediccion["id_variedad"] == biblioteca["Merlot"]
+    assert prediccion["resumen"]["color"] == "Tinta"
+
+
+def test_upload_no_busca_la_variedad_en_la_base(client, db_session, biblioteca, consultas, monkeypatch):
+    user = crud.create_user(
+        db_session, schemas.UsuarioCreate(email="c@test.com", nombre="C", apellidos="A", password="p"), "hash"
+    )
+    db_session.refresh(user)
+    db_session.expunge(user)
+    app.dependency_overrides[get_current_user] = lambda: user
+    monkeypatch.setattr(routes_coleccion, "upload_image_to_imagekit", lambda b, f, folder="/vitia": f"https://ik/{f}")
+    try:
+        catalogo.cargar(db_session)
+        consultas.clear()
+        por_nombre = client.post(
+            "/coleccion/upload",
+            files={"file": ("1.jpg", _jpeg(), "image/jpeg")},
+            data={"nombre_variedad": "merlot"},
+        )
+        por_id = client.post(
+            "/coleccion/upload",
+            files={"file": ("2.jpg", _jpeg(), "image/jpeg")},
+            data={"id_variedad": str(biblioteca["Albariño"])},
+        )
+        sin_variedad = client.post("/coleccion/upload", files={"file": ("3.jpg", _jpeg(), "image/jpeg")})
+    finally:
+        app.dependency_overrides.pop(get_current_user, None)
+
+    assert por_nombre.status_code == 200
+    assert por_nombre.json()["variedad"]["id_variedad"] == biblioteca["Merlot"]
+    assert por_id.json()["variedad"]["nombre"] == "Albariño"
+    assert sin_variedad.status_code == 422
+    # Solo las lecturas de la relación `variedad` para serializar la respuesta, ninguna búsqueda por nombre
+    assert not any('"Variedades".nombre = ' in s for s in consultas)
+    assert len(consultas) == 2
@@ -0,0 +1,163 @@
+# tests/test_coleccion_identificar.py
+import io
+import threading
+from datetime import datetime, timedelta, timezone
+import pytest
+from PIL import Image
+from app import crud, models, schemas
+from app.auth import get_current_user
+from app.main import app
+from app.ia.cache import PredictionCache
+from app.routes import ml_routes, routes_coleccion
+from app.services import imagekit_service
+from app.services.subidas_service import LimpiezaSubidas
+
+
+def _jpeg(size=(200, 100), color=(120, 60, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def usuario(db_session):
+    user = crud.create_user(
+        db_session, schemas.UsuarioCreate(email="v@test.com", nombre="V", apellidos="A", password="p"), "hash"
+    )
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+@pytest.fixture
+def servicios(monkeypatch):
+    """YOLO e ImageKit falsos. Devuelve las fotos borradas de ImageKit."""
+    borradas = []
+    monkeypatch.setattr(ml_routes.batcher, "predict_fn", lambda images, imgsz=None: [img.size for img in images])
+    monkeypatch.setattr(ml_routes, "_agregar_predicciones", lambda results: [{"variedad": "Tempranillo", "confianza": 88.0}])
+    monkeypatch.setattr(ml_routes, "cache", PredictionCache())
+    monkeypatch.setattr(
+        routes_coleccion, "upload_image_with_id", lambda b, f, folder="/vitia": (f"https://ik.test/{f}", f"id-{f}")
+    )
+    monkeypatch.setattr(routes_coleccion, "delete_image_from_imagekit", borradas.append)
+    return borradas
+
+
+def test_identificar_y_guardar_en_una_peticion(client, usuario, servicios, monkeypatch):
+    # Inferencia y subida en paralelo: cada una espera a que la otra haya empezado.
+    # Si fueran una detrás de otra, la barrera se rompería y la petición fallaría
+    barrera = threading.Barrier(2, timeout=5)
+
+    def fake_predict(images, imgsz=None):
+        barrera.wait()
+        return [img.size for img in images]
+
+    def fake_upload(file_bytes, filename, folder="/vitia"):
+        barrera.wait()
+        return f"https://ik.test/{filename}", f"id-{filename}"
+
+    monkeypatch.setattr(ml_routes.batcher, "predict_fn", fake_predict)
+    monkeypatch.setattr(routes_coleccion, "upload_image_with_id", fake_upload)
+    response = client.post("/coleccion/identificar", files={"file": ("cepa.jpg", _jpeg(), "image/jpeg")})
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["predicciones"][0]["variedad"] == "Tempranillo"
+    assert data["path_foto_usuario"] == "https://ik.test/cepa.jpg"
+    assert data["coleccion"]["variedad"]["nombre"] == "Tempranillo"
+    assert data["token_pendiente"] is None
+    assert servicios == []
+    assert not barrera.broken
+
+
+def test_identificacion_fallida_borra_la_foto_subida(client, usuario, servicios, monkeypatch):
+    def falla(images, imgsz=None):
+        raise RuntimeError("modelo roto")
+
+    monkeypatch.setattr(ml_routes.batcher, "predict_fn", falla)
+    with pytest.raises(RuntimeError):
+        client.post("/coleccion/identificar", files={"file": ("cepa.jpg", _jpeg(), "image/jpeg")})
+    assert servicios == ["id-cepa.jpg"]
+
+
+def test_guardar_sin_variedad_reconocida_borra_la_foto_subida(client, usuario, servicios, monkeypatch):
+    monkeypatch.setattr(ml_routes, "_agregar_predicciones", lambda results: [])
+    response = client.post("/coleccion/identificar", files={"file": ("cepa.jpg", _jpeg(), "image/jpeg")})
+    assert response.status_code == 422
+    assert servicios == ["id-cepa.jpg"]
+
+
+def test_identificar_con_confirmacion(client, db_session, usuario, servicios):
+    response = client.post(
+        "/coleccion/identificar",
+        files={"file": ("cepa.jpg", _jpeg(color=(1, 2, 3)), "image/jpeg")},
+        data={"guardar": "false", "notas": "Parcela norte", "latitud": "42.1"},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["coleccion"] is None
+    assert data["token_pendiente"] and data["expira_en_s"] > 0
+
+    # El usuario elige otra variedad distinta de la sugerida
+    confirmar = {"token_pendiente": data["token_pendiente"], "nombre_variedad": "Garnacha"}
+    item = client.post("/coleccion/confirmar", json=confirmar)
+    assert item.status_code == 201
+    assert item.json()["variedad"]["nombre"] == "Garnacha"
+    assert item.json()["notas"] == "Parcela norte"
+    assert item.json()["latitud"] == 42.1
+
+    # Un mismo token no guarda la foto dos veces
+    assert client.post("/coleccion/confirmar", json=confirmar).status_code == 409
+    # Confirmada, ya no está pendiente de limpiar
+    assert db_session.query(models.SubidaPendiente).count() == 0
+
+
+def test_confirmar_rechaza_tokens_no_validos(client, usuario):
+    response = client.post("/coleccion/confirmar", json={"token_pendiente": "basura", "nombre_variedad": "X"})
+    assert response.status_code == 400
+
+
+def test_identificar_no_sube_lo_que_no_es_imagen(client, usuario, servicios, monkeypatch):
+    subidas = []
+    monkeypatch.setattr(routes_coleccion, "upload_image_with_id", lambda *a, **k: subidas.append(a))
+    response = client.post("/coleccion/identificar", files={"file": ("x.jpg", b"no soy una imagen", "image/jpeg")})
+    assert response.status_code == 400
+    assert subidas == []
+
+
+def _pendiente_caducada(client, db_session):
+    response = client.post(
+        "/coleccion/identificar",
+        files={"file": ("cepa.jpg", _jpeg(), "image/jpeg")},
+        data={"guardar": "false"},
+    )
+    assert response.status_code == 200
+    db_session.query(models.SubidaPendiente).update(
+        {"expira": datetime.now(timezone.utc) - timedelta(minutes=1)}
+    )
+    db_session.commit()
+    return response.json()["token_pendiente"]
+
+
+def test_limpieza_borra_las_subidas_no_confirmadas(client, db_session, usuario, servicios, monkeypatch):
+    token = _pendiente_caducada(client, db_session)
+    borradas = []
+    monkeypatch.setattr(imagekit_service, "delete_image_from_imagekit", borradas.append)
+
+    assert LimpiezaSubidas(lambda: db_session).limpiar() == 1
+    assert borradas == ["id-cepa.jpg"]
+    assert db_session.query(models.SubidaPendiente).count() == 0
+    # Su token ya no guarda nada, aunque la firma siga siendo válida
+    response = client.post("/coleccion/confirmar", json={"token_pendiente": token, "nombre_variedad": "Garnacha"})
+    assert response.status_code == 400
+
+
+def test_limpieza_reintenta_si_imagekit_falla(client, db_session, usuario, servicios, monkeypatch):
+    _pendiente_caducada(client, db_session)
+
+    def falla(file_id):
+        raise RuntimeError("ImageKit caído")
+
+    monkeypatch.setattr(imagekit_service, "delete_image_from_imagekit", falla)
+    assert LimpiezaSubidas(lambda: db_session).limpiar() == 0
+    assert [s.file_id for s in db_session.query(models.SubidaPendiente)] == ["id-cepa.jpg"]
@@ -0,0 +1,76 @@
+# tests/test_comentarios.py
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from app import crud, models, schemas
+
+
+@pytest.fixture
+def hilo(db_session):
+    """
+    Una publicación con 2 comentarios principales. El primero tiene 3
+    respuestas y la primera de ellas una cadena de 4 niveles más.
+    """
+    user = crud.create_user(db_session, schemas.UsuarioCreate(email="h@test.com", nombre="H", apellidos="A", password="p"), "hash")
+    id_publicacion = crud.create_publicacion(db_session, schemas.PublicacionCreate(titulo="T", texto="-"), user.id_usuario).id_publicacion
+    id_usuario = user.id_usuario
+    inicio = datetime(2025, 1, 1)
+    ids = {}
+
+    def comentar(nombre, padre=None):
+        comentario = models.Comentario(
+            texto=nombre, id_publicacion=id_publicacion, id_usuario=id_usuario,
+            id_padre=ids.get(padre), fecha_comentario=inicio + timedelta(minutes=len(ids)),
+        )
+        db_session.add(comentario)
+        db_session.commit()
+        ids[nombre] = comentario.id_comentario
+
+    comentar("a")
+    comentar("b")
+    for r in ("a1", "a2", "a3"):
+        comentar(r, "a")
+    padre = "a1"
+    for nivel in range(4):
+        comentar(f"{padre}.1", padre)
+        padre = f"{padre}.1"
+    db_session.expunge_all()
+    return id_publicacion, ids
+
+
+def test_arbol_completo_en_dos_consultas(client, db_session, hilo):
+    id_publicacion, _ = hilo
+    sentencias = []
+    registrar = lambda conn, cursor, statement, *args: sentencias.append(statement)
+    event.listen(db_session.get_bind(), "before_cursor_execute", registrar)
+    try:
+        data = client.get(f"/comentarios/publicacion/{id_publicacion}").json()
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", registrar)
+
+    assert len(sentencias) == 2
+    assert [c["texto"] for c in data] == ["a", "b"]
+    assert [h["texto"] for h in data[0]["hijos"]] == ["a1", "a2", "a3"]
+    nodo = data[0]["hijos"][0]
+    for esperado in ("a1.1", "a1.1.1", "a1.1.1.1", "a1.1.1.1.1"):
+        nodo = nodo["hijos"][0]
+        assert nodo["texto"] == esperado
+    assert not any(c["hay_mas_respuestas"] for c in data)
+
+
+def test_profundidad_y_respuestas_recortadas(client, hilo):
+    id_publicacion, ids = hilo
+    data = client.get(f"/comentarios/publicacion/{id_publicacion}?profundidad=2&respuestas=2").json()
+
+    a = data[0]
+    assert [h["texto"] for h in a["hijos"]] == ["a1", "a2"]
+    assert a["num_respuestas"] == 3 and a["hay_mas_respuestas"] is True
+    a11 = a["hijos"][0]["hijos"][0]
+    assert a11["texto"] == "a1.1"
+    assert a11["hijos"] == [] and a11["hay_mas_respuestas"] is True  # corta en el segundo nivel
+    assert data[1]["num_respuestas"] == 0 and data[1]["hay_mas_respuestas"] is False
+
+    # El resto se pide a partir del comentario que lo indica
+    resto = client.get(f"/comentarios/publicacion/{id_publicacion}?id_padre={ids['a1.1']}&profundidad=10").json()
+    assert [c["texto"] for c in resto] == ["a1.1.1"]
+    assert resto[0]["hijos"][0]["texto"] == "a1.1.1.1"
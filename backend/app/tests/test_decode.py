@@ -0,0 +1,62 @@
+# tests/test_decode.py
+import asyncio
+import io
+import pytest
+from PIL import Image
+from app.ia.decode import decodificar, leer_limitado, ImagenDemasiadoGrande
+
+
+def _jpeg(size, exif_orientation=None):
+    buffer = io.BytesIO()
+    image = Image.new("RGB", size, (90, 140, 60))
+    if exif_orientation:
+        exif = Image.Exif()
+        exif[0x0112] = exif_orientation
+        image.save(buffer, format="JPEG", exif=exif)
+    else:
+        image.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+class FakeUpload:
+    """Imita la lectura por trozos de un UploadFile."""
+
+    def __init__(self, data: bytes, size=None):
+        self._buffer = io.BytesIO(data)
+        self.size = size
+
+    async def read(self, n=-1):
+        return self._buffer.read(n)
+
+
+def test_foto_grande_se_decodifica_cerca_del_tamano_objetivo():
+    image = decodificar(_jpeg((4000, 3000)), max_lado=1280)
+    assert max(image.size) == 1280
+    assert image.mode == "RGB"
+
+
+def test_draft_reduce_la_decodificacion_jpeg():
+    """Con draft, libjpeg ya entrega una imagen reducida (no 4000x3000)."""
+    image = Image.open(io.BytesIO(_jpeg((4000, 3000))))
+    image.draft("RGB", (1280, 1280))
+    assert image.size[0] < 4000
+
+
+def test_orientacion_exif_aplicada():
+    # Orientación 6 = girada 90º: una foto 400x200 se ve como 200x400
+    image = decodificar(_jpeg((400, 200), exif_orientation=6), max_lado=1280)
+    assert image.size == (200, 400)
+
+
+def test_limite_de_pixeles():
+    with pytest.raises(ImagenDemasiadoGrande):
+        decodificar(_jpeg((3000, 3000)), max_pixeles=1_000_000)
+
+
+def test_lectura_por_trozos_corta_al_superar_el_limite():
+    datos = b"x" * 3000
+    assert asyncio.run(leer_limitado(FakeUpload(datos), max_bytes=5000)) == datos
+    with pytest.raises(ImagenDemasiadoGrande):
+        asyncio.run(leer_limitado(FakeUpload(datos), max_bytes=1000))
+    with pytest.raises(ImagenDemasiadoGrande):
+        asyncio.run(leer_limitado(FakeUpload(b"", size=10_000), max_bytes=1000))
@@ -0,0 +1,192 @@
+# tests/test_ia_routes.py
+import io
+import time
+import types
+import pytest
+from PIL import Image
+from app.config import settings
+from app.routes import ml_routes
+from app.ia.executor import InferenciaSaturada
+from app.ia.cache import PredictionCache
+from app.ia.postproceso import consenso
+
+
+def _jpeg(size, color=(120, 60, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def fake_modelo(monkeypatch):
+    """Sustituye YOLO: las fotos anchas son 'Merlot', las estrechas 'Garnacha'."""
+    llamadas = []
+
+    def fake_predict(images, imgsz=None):
+        llamadas.append(len(images))
+        return [img.size for img in images]
+
+    def fake_agregar(results):
+        ancho = results[0][0]
+        return [{"variedad": "Merlot" if ancho > 100 else "Garnacha", "confianza": 90.0}]
+
+    monkeypatch.setattr(ml_routes.batcher, "predict_fn", fake_predict)
+    monkeypatch.setattr(ml_routes, "_agregar_predicciones", fake_agregar)
+    monkeypatch.setattr(ml_routes, "cache", PredictionCache())
+    return llamadas
+
+
+def test_predict_usa_la_cache_en_el_reintento(client, fake_modelo):
+    foto = _jpeg((200, 100))
+    r1 = client.post("/ia/predict", files={"file": ("a.jpg", foto, "image/jpeg")})
+    r2 = client.post("/ia/predict", files={"file": ("a.jpg", foto, "image/jpeg")})
+
+    assert r1.status_code == 200
+    # Merlot no está en la biblioteca de este test: sin id ni resumen
+    assert r1.json()["predicciones"] == [{"variedad": "Merlot", "confianza": 90.0, "id_variedad": None, "resumen": None}]
+    assert r1.json()["cache_hit"] is False
+    assert r2.json()["cache_hit"] is True
+    assert r1.json()["version_modelo"] == r2.json()["version_modelo"] == ml_routes.registry.version
+    assert sum(fake_modelo) == 1  # Solo una inferencia real
+
+
+def test_predict_batch_devuelve_por_imagen_y_consenso(client, fake_modelo):
+    files = [
+        ("files", ("1.jpg", _jpeg((200, 100), (10, 10, 10)), "image/jpeg")),
+        ("files", ("2.jpg", _jpeg((220, 100), (20, 20, 20)), "image/jpeg")),
+        ("files", ("3.jpg", _jpeg((50, 100), (30, 30, 30)), "image/jpeg")),
+        ("files", ("roto.jpg", b"no soy una imagen", "image/jpeg")),
+    ]
+    response = client.post("/ia/predict/batch", files=files)
+    assert response.status_code == 200
+    data = response.json()
+
+    assert data["total_imagenes"] == 4
+    assert data["imagenes_validas"] == 3
+    assert [img["archivo"] for img in data["imagenes"]] == ["1.jpg", "2.jpg", "3.jpg", "roto.jpg"]
+    assert "error" in data["imagenes"][3]
+
+    assert data["consenso"][0]["variedad"] == "Merlot"
+    assert data["consenso"][0]["votos"] == 2
+    # Las imágenes válidas se infirieron en lotes (menos llamadas que imágenes)
+    assert len(fake_modelo) < 3
+
+
+def test_predict_batch_consenso_respeta_min_confianza(client, fake_modelo, monkeypatch):
+    monkeypatch.setattr(
+        ml_routes, "_agregar_predicciones",
+        lambda results: [{"variedad": "Merlot", "confianza": 90.0}, {"variedad": "Garnacha", "confianza": 20.0}],
+    )
+    files = [("files", (f"{i}.jpg", _jpeg((200, 100), (i, i, i)), "image/jpeg")) for i in range(2)]
+    data = client.post("/ia/predict/batch?min_confianza=50", files=files).json()
+
+    assert [p["variedad"] for p in data["imagenes"][0]["predicciones"]] == ["Merlot"]
+    assert [c["variedad"] for c in data["consenso"]] == ["Merlot"]
+
+
+def test_predict_batch_rechaza_ficheros_que_no_son_imagen(client, fake_modelo):
+    response = client.post("/ia/predict/batch", files=[("files", ("a.txt", b"hola", "text/plain"))])
+    assert response.status_code == 400
+
+
+def test_predict_batch_se_admite_entero_o_nada(client, fake_modelo, monkeypatch):
+    from app.ia.executor import InferenceExecutor
+
+    files = [("files", (f"{i}.jpg", _jpeg((200, 100), (i, i, i)), "image/jpeg")) for i in range(3)]
+    # Caben dos imágenes y la petición trae tres: 503 sin inferir ninguna
+    monkeypatch.setattr(ml_routes, "executor", InferenceExecutor(max_workers=1, max_queue=2))
+    response = client.post("/ia/predict/batch", files=files)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    assert fake_modelo == []
+
+    # Con sitio, una sola reserva de tres plazas que se libera al terminar
+    executor = InferenceExecutor(max_workers=1, max_queue=3)
+    admisiones = []
+    admitir = executor.admitir
+    monkeypatch.setattr(executor, "admitir", lambda *a, **kw: admisiones.append(a) or admitir(*a, **kw))
+    monkeypatch.setattr(ml_routes, "executor", executor)
+    response = client.post("/ia/predict/batch", files=files)
+    assert response.status_code == 200
+    assert response.json()["imagenes_validas"] == 3
+    assert [a[-1] for a in admisiones] == [3]
+    assert executor.stats()["pendientes"] == 0
+
+
+def test_consenso_ordena_por_puntuacion():
+    resultado = consenso([
+        [{"variedad": "Merlot", "confianza": 80.0}, {"variedad": "Garnacha", "confianza": 30.0}],
+        [{"variedad": "Garnacha", "confianza": 60.0}],
+        [{"variedad": "Merlot", "confianza": 70.0}],
+    ])
+    assert [r["variedad"] for r in resultado] == ["Merlot", "Garnacha"]
+    assert resultado[0] == {"variedad": "Merlot", "votos": 2, "apariciones": 2, "confianza_media": 75.0, "puntuacion": 50.0}
+    assert resultado[1]["votos"] == 1 and resultado[1]["apariciones"] == 2
+
+
+def test_tiempos_por_etapa_en_cabecera_debug_y_metricas(client, fake_modelo):
+    foto = _jpeg((200, 100))
+    response = client.post("/ia/predict?debug=true", files={"file": ("a.jpg", foto, "image/jpeg")})
+    assert response.status_code == 200
+
+    server_timing = response.headers["Server-Timing"]
+    for etapa in ("lectura", "cache", "decode", "inferencia", "agregacion"):
+        assert f"{etapa};dur=" in server_timing
+    assert set(response.json()["tiempos_ms"]) >= {"lectura", "decode", "inferencia"}
+
+    # Sin debug, el cuerpo no lleva los tiempos
+    sin_debug = client.post("/ia/predict", files={"file": ("b.jpg", _jpeg((210, 100)), "image/jpeg")})
+    assert "tiempos_ms" not in sin_debug.json()
+
+    metrics = client.get("/ia/metrics")
+    assert metrics.status_code == 200
+    assert 'vitia_ia_etapa_duracion_ms_bucket{etapa="decode",le="+Inf"}' in metrics.text
+    assert "vitia_ia_cache_misses" in metrics.text
+    assert "vitia_ia_executor_workers" in metrics.text
+
+
+def test_admision_por_carril_y_plazo():
+    premium = types.SimpleNamespace(es_premium=True)
+    gratis = types.SimpleNamespace(es_premium=False)
+
+    assert ml_routes._admision(premium, None)[0] == "premium"
+    assert ml_routes._admision(gratis, None)[0] == "gratis"
+    assert ml_routes._admision(None, None)[0] == "gratis"
+
+    # El cliente puede acortar el plazo, pero no alargarlo más allá del de su carril
+    ahora = time.monotonic()
+    _, corto = ml_routes._admision(None, 100)
+    _, largo = ml_routes._admision(None, 10 ** 9)
+    assert corto - ahora < 1
+    assert largo - ahora <= settings.IA_PLAZO_GRATIS_MS / 1000 + 1
+
+
+def test_predict_saturado_responde_503_con_retry_after(client, fake_modelo, monkeypatch):
+    def saturado(*args, **kwargs):
+        raise InferenciaSaturada("sin sitio", retry_after_s=3)
+
+    monkeypatch.setattr(ml_routes.executor, "admitir", saturado)
+    response = client.post("/ia/predict", files={"file": ("s.jpg", _jpeg((90, 90)), "image/jpeg")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "3"
+
+
+def test_modo_y_resolucion_en_la_respuesta(client, fake_modelo):
+    foto = _jpeg((200, 100), (1, 2, 3))
+    preciso = client.post("/ia/predict?modo=accurate", files={"file": ("a.jpg", foto, "image/jpeg")}).json()
+    assert preciso["modo"] == "accurate"
+    assert preciso["resolucion"] == ml_routes.politica.completa
+
+    # Una predicción a resolución completa vale también para el modo rápido
+    rapido = client.post("/ia/predict?modo=fast", files={"file": ("a.jpg", foto, "image/jpeg")}).json()
+    assert rapido["cache_hit"] is True
+    assert rapido["resolucion"] == ml_routes.politica.completa
+
+    # Pero no al revés
+    otra = _jpeg((200, 100), (4, 5, 6))
+    rapido = client.post("/ia/predict?modo=fast", files={"file": ("b.jpg", otra, "image/jpeg")}).json()
+    assert rapido["resolucion"] == ml_routes.politica.niveles[-1]
+    preciso = client.post("/ia/predict?modo=accurate", files={"file": ("b.jpg", otra, "image/jpeg")}).json()
+    assert preciso["cache_hit"] is False
+
+    assert client.post("/ia/predict?modo=turbo", files={"file": ("b.jpg", otra, "image/jpeg")}).status_code == 422
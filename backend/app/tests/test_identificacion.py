@@ -3,132 +3,15 @@ import pytest
 import time
 from PIL import Image, ImageEnhance
 from collections import Counter
-from app.ia.model_loader import model
+from app.ia.model_loader import model, MODEL_PATH
+from app.ia import backends
+from app.ia.resolucion import parsear_niveles
+from app.config import settings
 
 # -------------------------------------------------------------------------
 # 1. CONFIGURACIÓN DE DATASETS
 # -------------------------------------------------------------------------
-SAMPLES_DIR = os.path.join(os.path.dirname(__file__), "samples")
-
-# DEFINICIÓN DE TUS GRUPOS DE PRUEBA
-# Estructura: "NOMBRE_DEL_SET": [ (archivo, clase, confianza_minima), ... ]
-DATASETS = {
-    "DATASET_ALTA_CALIDAD": [
-    # Ahmer Bounamer
-("ahmerbounamer1.jpg", "Ahmer Bounamer", 0.50),
-("ahmerbounamer2.jpg", "Ahmer Bounamer", 0.50),
-("ahmerbounamer3.jpg", "Ahmer Bounamer", 0.50),
-
-# Aledo
-("aledo1.jpg", "Aledo", 0.50),
-("aledo2.jpg", "Aledo", 0.50),
-("aledo3.jpg", "Aledo", 0.50),
-
-# Fernandella
-("fernandella1.jpg", "Fernandella", 0.50),
-("fernandella2.jpg", "Fernandella", 0.50),
-("fernandella3.jpg", "Fernandella", 0.50),
-
-# Jacquet
-("jacquet1.jpg", "Jacquet", 0.50),
-("jacquet2.jpg", "Jacquet", 0.50),
-("jacquet3.jpg", "Jacquet", 0.50),
-
-# Merseguera
-("merseguera1.jpg", "Merseguera", 0.50),
-("merseguera2.jpg", "Merseguera", 0.50),
-("merseguera3.jpg", "Merseguera", 0.50),
-
-# Moscatell
-("moscatells1.jpg", "Moscatell", 0.50),
-("moscatells2.jpg", "Moscatell", 0.50),
-("moscatells3.jpg", "Moscatell", 0.50),
-
-# Planta fina de pedralba
-("plantafinapedralba1.jpg", "Planta fina de pedralba", 0.50),
-("plantafinapedralba2.jpg", "Planta fina de pedralba", 0.50),
-("plantafinapedralba3.jpg", "Planta fina de pedralba", 0.50),
-
-# Roseti
-("roseti1.jpg", "Roseti", 0.50),
-("roseti2.jpg", "Roseti", 0.50),
-("roseti3.jpg", "Roseti", 0.50),
-
-# Trepadell
-("trepadell1.jpg", "Trepadell", 0.50),
-("trepadell2.jpg", "Trepadell", 0.50),
-("trepadell3.jpg", "Trepadell", 0.50),
-
-# Chardonay
-("chardonay1.jpg", "Chardonay", 0.50),
-("chardonay2.jpg", "Chardonay", 0.50),
-("chardonay3.jpg", "Chardonay", 0.50),
-
-# Tintorera
-("tintorera1.jpg", "Tintorera", 0.50),
-("tintorera2.jpg", "Tintorera", 0.50),
-("tintorera3.jpg", "Tintorera", 0.50),
-
-# Monastrell
-("monastrell1.jpg", "Monastrell", 0.50),
-("monastrell2.jpg", "Monastrell", 0.50),
-("monastrell3.jpg", "Monastrell", 0.50),
-
-# Cabernet-Sauvignon
-("cabernetsauvignon1.jpg", "Cabernet-Sauvignon", 0.50),
-("cabernetsauvignon2.jpg", "Cabernet-Sauvignon", 0.50),
-("cabernetsauvignon3.jpg", "Cabernet-Sauvignon", 0.50),
-
-# De Cuerno
-("decuerno1.jpg", "De Cuerno", 0.50),
-("decuerno2.jpg", "De Cuerno", 0.50),
-("decuerno3.jpg", "De Cuerno", 0.50),
-
-# Garnacha
-("garnacha1.jpg", "Garnacha", 0.50),
-("garnacha2.jpg", "Garnacha", 0.50),
-("garnacha3.jpg", "Garnacha", 0.50),
-
-# Merlot
-("merlot1.jpg", "Merlot", 0.50),
-("merlot2.jpg", "Merlot", 0.50),
-("merlot3.jpg", "Merlot", 0.50),
-
-# Valenci negre
-("valencinegre1.jpg", "Valenci negre", 0.50),
-("valencinegre2.jpg", "Valenci negre", 0.50),
-("valencinegre3.jpg", "Valenci negre", 0.50),
-
-# Valensi blanc
-("valenciblanc1.jpg", "Valensi blanc", 0.50),
-("valenciblanc2.jpg", "Valensi blanc", 0.50),
-("valenciblanc3.jpg", "Valensi blanc", 0.50),
-
-# raim de tots sants
-("raimtotssants1.jpg", "Raim de tots sants", 0.50),
-("raimtotssants2.jpg", "Raim de tots sants", 0.50),
-("raimtotssants3.jpg", "Raim de tots sants", 0.50),
-
-    ],
-    "DATASET_BAJA_CALIDAD": [
-    ("LQahmer1.JPG", "Ahmer Bounamer", 0.50),
-    ("LQmerseguera1.JPG", "Merseguera", 0.50),
-    ("LQmerseguera2.JPG", "Merseguera", 0.50),
-    ("LQmonastrell1.JPG", "Monastrell", 0.50),
-    ("LQmoscatell1.JPG", "Moscatell", 0.50),
-    ("LQmoscatell2.JPG", "Moscatell", 0.50),
-    ("LQmoscatell3.JPG", "Moscatell", 0.50),
-    ("LQmoscatell4.JPG", "Moscatell", 0.50),
-    ("LQmoscatell5.JPG", "Moscatell", 0.50),
-    ("LQtotsants1.JPG", "Raim de tots sants", 0.50),
-    ("LQtrepadell1.JPG", "Trepadell", 0.50),
-    ("LQtrepadell2.JPG", "Trepadell", 0.50),
-    ("LQvalencinegre1.JPG", "Valenci negre", 0.50),  
-    ("LQvalencinegre2.JPG", "Valenci negre", 0.50),  
-    ("LQvalensiblanc1.JPG", "Valensi blanc", 0.50),  
-    ("LQvalensiblanc2.JPG", "Valensi blanc", 0.50), 
-    ]
-}
+from app.tests.datasets import SAMPLES_DIR, DATASETS
 
 # Aplanamos los datos para que Pytest pueda procesarlos uno a uno
 # Formato resultante: [(dataset_name, archivo, clase, conf), ...]
@@ -140,9 +23,17 @@ for ds_name, items in DATASETS.items():
 # Almacén de Métricas Globales
 GLOBAL_METRICS = {
     "results": [],  # Lista de resultados individuales
-    "coverage": {}  # Métricas de cobertura por dataset
+    "coverage": {},  # Métricas de cobertura por dataset
+    "backends": [],  # Paridad y latencia por backend (ONNX, OpenVINO...)
+    "resoluciones": []  # Precisión y latencia por resolución de entrada (imgsz)
 }
 
+# Backends a comparar contra PyTorch (separados por comas, ej. "onnx,openvino,onnx_int8")
+PARITY_BACKENDS = [b for b in os.getenv("VITIA_PARITY_BACKENDS", "onnx").split(",") if b]
+
+# Resoluciones de la política de degradación a evaluar (ej. "640,480,320")
+RESOLUCIONES = parsear_niveles(os.getenv("VITIA_RESOLUCIONES", settings.IA_IMGSZ_NIVELES))
+
 # -------------------------------------------------------------------------
 # 2. FIXTURE MAESTRO: REPORTE FINAL MULTI-DATASET
 # -------------------------------------------------------------------------
@@ -265,6 +156,42 @@ def print_final_scorecard():
         output.append(f"   ⚠️ Flexible (Sabe qué es): {acc_total_soft:.2f}%")
         output.append("="*TABLE_WIDTH)
 
+    # --- SECCIÓN BACKENDS ---
+    if GLOBAL_METRICS["backends"]:
+        output.append("\n\n⚙️  PARIDAD Y LATENCIA POR BACKEND (vs PyTorch)")
+        output.append("-" * TABLE_WIDTH)
+        for backend in PARITY_BACKENDS:
+            rows = [r for r in GLOBAL_METRICS["backends"] if r['backend'] == backend]
+            if not rows:
+                continue
+            iguales = sum(1 for r in rows if r['misma_clase'])
+            t_ref = sum(r['time_ref_ms'] for r in rows) / len(rows)
+            t_alt = sum(r['time_ms'] for r in rows) / len(rows)
+            max_diff = max(r['diff_conf'] for r in rows)
+            output.append(
+                f"   🔸 {backend:<10} Misma clase: {iguales}/{len(rows)} | Máx. Δconf: {max_diff:.3f} | "
+                f"PyTorch: {t_ref:.0f}ms -> {backend}: {t_alt:.0f}ms (x{t_ref / t_alt:.2f})"
+            )
+
+    # --- SECCIÓN RESOLUCIONES ---
+    if GLOBAL_METRICS["resoluciones"]:
+        output.append("\n\n🔍  PRECISIÓN Y LATENCIA POR RESOLUCIÓN (imgsz, modo fast/auto)")
+        output.append("-" * TABLE_WIDTH)
+        referencia = None
+        for imgsz in RESOLUCIONES:
+            rows = [r for r in GLOBAL_METRICS["resoluciones"] if r['imgsz'] == imgsz]
+            if not rows:
+                continue
+            acc = sum(1 for r in rows if r['acierto']) / len(rows) * 100
+            t_medio = sum(r['time_ms'] for r in rows) / len(rows)
+            conf_media = sum(r['conf'] for r in rows) / len(rows)
+            if referencia is None:
+                referencia = (acc, t_medio)
+            output.append(
+                f"   🔸 {imgsz:>4}px  Aciertos: {acc:6.2f}% ({acc - referencia[0]:+.2f} pp) | "
+                f"Conf. media: {conf_media:.1%} | Tiempo medio: {t_medio:.0f}ms (x{referencia[1] / t_medio:.2f})"
+            )
+
     # --- SECCIÓN COBERTURA ---
     output.append("\n\n📍 DIAGNÓSTICO DE COBERTURA (DATASET HEALTH)")
     output.append("-" * TABLE_WIDTH)
@@ -294,10 +221,11 @@ def print_final_scorecard():
 # -------------------------------------------------------------------------
 # 3. HELPER: INFERENCIA Y REGISTRO
 # -------------------------------------------------------------------------
-def run_inference(image):
+def run_inference(image, modelo=model, imgsz=None):
     start = time.perf_counter()
 
-    results = model.predict(image, save=False, verbose=False)
+    opciones = {"imgsz": imgsz} if imgsz else {}
+    results = modelo.predict(image, save=False, verbose=False, **opciones)
 
     end = time.perf_counter()
     inference_time_ms = (end - start) * 1000
@@ -310,7 +238,7 @@ def run_inference(image):
             if conf > top_conf:
                 top_conf = conf
                 cls_id = int(box.cls)
-                top_pred = model.names[cls_id]
+                top_pred = modelo.names[cls_id]
     return top_pred, top_conf, inference_time_ms
 
 def record_metric(dataset, filename, expected, detected, conf, time_ms, passed, test_type):
@@ -408,4 +336,61 @@ def test_dataset_coverage_metrics():
     for ds_name, metric in GLOBAL_METRICS["coverage"].items():
         if metric["missing"]:
             pytest.fail(f"El dataset '{ds_name}' está incompleto. Faltan: {metric['missing']}")
+
+# -------------------------------------------------------------------------
+# 6. PARIDAD ENTRE BACKENDS (ONNX Runtime / OpenVINO / INT8)
+# -------------------------------------------------------------------------
+# Tolerancia de confianza frente a PyTorch (la cuantización INT8 pierde algo más)
+PARITY_TOLERANCE = {"onnx": 0.02, "openvino": 0.02, "onnx_int8": 0.08}
+_BACKEND_MODELS = {}
+
+def get_backend_model(backend):
+    if backend not in _BACKEND_MODELS:
+        if backend in ("onnx", "onnx_int8"):
+            pytest.importorskip("onnxruntime")
+        if backend == "openvino":
+            pytest.importorskip("openvino")
+        _BACKEND_MODELS[backend] = backends.cargar_modelo(MODEL_PATH, backend)
+    return _BACKEND_MODELS[backend]
+
+@pytest.mark.parametrize("backend", PARITY_BACKENDS)
+@pytest.mark.parametrize("ds_name, filename, expected_class, _", FULL_TEST_SUITE)
+def test_paridad_backend(backend, ds_name, filename, expected_class, _):
+    img_path = os.path.join(SAMPLES_DIR, filename)
+    image = Image.open(img_path).convert("RGB")
+    alt_model = get_backend_model(backend)
+
+    ref_pred, ref_conf, ref_time = run_inference(image)
+    alt_pred, alt_conf, alt_time = run_inference(image, alt_model)
+
+    diff = abs(ref_conf - alt_conf)
+    GLOBAL_METRICS["backends"].append({
+        "backend": backend, "img": filename,
+        "misma_clase": ref_pred == alt_pred, "diff_conf": diff,
+        "time_ref_ms": ref_time, "time_ms": alt_time
+    })
+
+    assert alt_pred == ref_pred
+    assert diff <= PARITY_TOLERANCE.get(backend, 0.02)
+
+# -------------------------------------------------------------------------
+# 7. PRECISIÓN POR RESOLUCIÓN (política de degradación de /ia/predict)
+# -------------------------------------------------------------------------
+@pytest.mark.parametrize("imgsz", RESOLUCIONES)
+@pytest.mark.parametrize("ds_name, filename, expected_class, min_conf", FULL_TEST_SUITE)
+def test_precision_por_resolucion(imgsz, ds_name, filename, expected_class, min_conf):
+    """Mide cuánto se pierde en cada nivel de resolución; solo exige acierto a la completa."""
+    img_path = os.path.join(SAMPLES_DIR, filename)
+    image = Image.open(img_path).convert("RGB")
+
+    detected, conf, time_ms = run_inference(image, imgsz=imgsz)
+    acierto = detected == expected_class
+
+    GLOBAL_METRICS["resoluciones"].append({
+        "imgsz": imgsz, "dataset": ds_name, "img": filename,
+        "acierto": acierto, "conf": conf, "time_ms": time_ms
+    })
+
+    if imgsz == RESOLUCIONES[0]:
+        assert acierto and conf >= min_conf
 #>>>>>>> a26c62b (PYtest IA)
@@ -0,0 +1,150 @@
+# tests/test_model_loader.py
+import os
+import sys
+import types
+import pytest
+from PIL import Image
+from app.ia import backends
+from app.ia.model_loader import ModelRegistry, registry
+
+
+def test_importar_la_app_no_carga_el_modelo(client):
+    """Arrancar la API (y los tests) no debe importar ultralytics ni cargar pesos."""
+    assert registry.estado in (ModelRegistry.NO_CARGADO, ModelRegistry.LISTO, ModelRegistry.ERROR)
+    if registry.estado == ModelRegistry.NO_CARGADO:
+        assert "ultralytics" not in sys.modules
+
+    response = client.get("/ia/estado")
+    assert response.status_code == 200
+    assert response.json()["modelo"]["estado"] == registry.estado
+
+
+def test_ready_devuelve_503_si_el_modelo_no_esta_cargado(client):
+    if registry.listo:
+        pytest.skip("El modelo ya está cargado en este proceso")
+    response = client.get("/ia/ready")
+    assert response.status_code == 503
+
+
+def test_carga_perezosa_y_error_reportado(tmp_path):
+    """Un registro con una ruta inexistente solo falla al usarse, y lo refleja en su estado."""
+    reg = ModelRegistry(str(tmp_path / "no_existe.pt"))
+    assert reg.estado == ModelRegistry.NO_CARGADO
+    assert reg.tiempo_carga_ms is None
+
+    with pytest.raises(Exception):
+        reg.get()
+    assert reg.estado == ModelRegistry.ERROR
+    assert reg.info()["error"]
+
+
+def test_rutas_de_backends():
+    assert backends.ruta_backend("/m/best2.pt", "pytorch") == "/m/best2.pt"
+    assert backends.ruta_backend("/m/best2.pt", "onnx") == "/m/best2.onnx"
+    assert backends.ruta_backend("/m/best2.pt", "onnx_int8") == "/m/best2_int8.onnx"
+    assert backends.ruta_backend("/m/best2.pt", "openvino") == "/m/best2_openvino_model"
+    with pytest.raises(ValueError):
+        backends.ruta_backend("/m/best2.pt", "tensorrt")
+
+
+class FakeModel:
+    def __init__(self, path):
+        self.path = path
+        self.names = {0: os.path.basename(path)}
+
+    def predict(self, images, save=False, verbose=False):
+        images = images if isinstance(images, list) else [images]
+        return [types.SimpleNamespace() for _ in images]
+
+
+@pytest.fixture
+def modelos(tmp_path, monkeypatch):
+    """Directorio de modelos con pesos falsos (cargar_modelo no usa ultralytics)."""
+    def cargar(path, backend):
+        if "roto" in path:
+            raise RuntimeError("pesos corruptos")
+        return FakeModel(path)
+
+    monkeypatch.setattr(backends, "cargar_modelo", cargar)
+
+    def nuevo(nombre, mtime):
+        ruta = tmp_path / nombre
+        ruta.write_bytes(nombre.encode())
+        os.utime(ruta, (mtime, mtime))
+        return str(ruta)
+
+    return nuevo
+
+
+def test_cambio_en_caliente_espera_a_las_inferencias_en_curso(modelos):
+    v1 = modelos("v1.pt", 1000)
+    reg = ModelRegistry(v1, models_dir=os.path.dirname(v1))
+    reg.get()
+    version_v1 = reg.version
+
+    with reg.adquirir() as en_curso:
+        v2 = modelos("v2.pt", 2000)
+        assert reg.pendiente() == v2
+        cambio = reg.cambiar(v2)
+
+        # Las peticiones nuevas ya usan v2; la que estaba en vuelo conserva v1
+        assert cambio["anterior"] == version_v1
+        assert reg.version == cambio["version"] != version_v1
+        assert en_curso.model.path == v1
+        assert reg.info()["retiradas_pendientes"] == [{"version": version_v1, "en_vuelo": 1}]
+
+    # Al terminar la última inferencia, v1 se libera
+    assert en_curso.model is None
+    assert reg.info()["retiradas_pendientes"] == []
+    assert reg.pendiente() is None
+
+    resultados = reg.predict([Image.new("RGB", (8, 8))])
+    assert resultados[0].version_modelo == reg.version
+
+
+def test_cambio_fallido_mantiene_la_version_en_servicio(modelos):
+    v1 = modelos("v1.pt", 1000)
+    reg = ModelRegistry(v1, models_dir=os.path.dirname(v1))
+    reg.get()
+    version_v1 = reg.version
+
+    modelos("roto.pt", 2000)
+    with pytest.raises(RuntimeError):
+        reg.cambiar()
+    assert reg.version == version_v1 and reg.listo
+    assert "pesos corruptos" in reg.info()["error"]
+    # No se reintenta la misma versión rota en cada vuelta del vigilante
+    assert reg.pendiente() is None
+
+
+def test_recargar_requiere_token(client):
+    response = client.post("/ia/modelo/recargar")
+    assert response.status_code == 403
+
+
+def test_recargar_solo_acepta_pesos_de_models_dir(client, tmp_path, monkeypatch):
+    from app.routes import ml_routes
+
+    modelos = tmp_path / "modelos"
+    modelos.mkdir()
+    (modelos / "v2.pt").write_bytes(b"pesos")
+    (tmp_path / "fuera.pt").write_bytes(b"pesos")
+    (modelos / "enlace.pt").symlink_to(tmp_path / "fuera.pt")
+    monkeypatch.setattr(ml_routes.settings, "IA_ADMIN_TOKEN", "secreto")
+    monkeypatch.setattr(ml_routes.registry, "models_dir", str(modelos))
+    cambios = []
+
+    async def fake_cambiar(ruta):
+        cambios.append(ruta)
+
+    monkeypatch.setattr(ml_routes, "_cambiar_modelo", fake_cambiar)
+    cabeceras = {"X-Admin-Token": "secreto"}
+
+    for nombre in (str(tmp_path / "fuera.pt"), "../fuera.pt", "enlace.pt", "v2.onnx", ".."):
+        response = client.post("/ia/modelo/recargar", params={"nombre": nombre}, headers=cabeceras)
+        assert response.status_code == 400, nombre
+    assert cambios == []
+
+    response = client.post("/ia/modelo/recargar", params={"nombre": "v2.pt"}, headers=cabeceras)
+    assert response.status_code == 202
+    assert cambios == [os.path.realpath(modelos / "v2.pt")]
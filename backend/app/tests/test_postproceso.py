@@ -0,0 +1,41 @@
+# tests/test_postproceso.py
+from app.ia.benchmark import agregacion_por_caja, medir_postproceso, resultados_aleatorios
+from app.ia.postproceso import agregar_por_clase, filtrar, tensores_de_resultados
+
+NAMES = {0: "Merlot", 1: "Garnacha", 2: "Monastrell", 3: "Aledo"}
+
+
+def _resultados_aleatorios(n_cajas, seed=0):
+    return resultados_aleatorios(n_cajas, len(NAMES), seed)
+
+
+def test_mismo_resultado_que_el_bucle_por_caja():
+    results = _resultados_aleatorios(500)
+    cls, conf = tensores_de_resultados(results)
+    assert agregar_por_clase(cls, conf, NAMES) == agregacion_por_caja(results, NAMES)
+
+
+def test_sin_cajas_devuelve_lista_vacia():
+    cls, conf = tensores_de_resultados(_resultados_aleatorios(0))
+    assert agregar_por_clase(cls, conf, NAMES) == []
+
+
+def test_top_k_y_confianza_minima():
+    preds = [{"variedad": "A", "confianza": 90.0}, {"variedad": "B", "confianza": 40.0}, {"variedad": "C", "confianza": 10.0}]
+    assert filtrar(preds, top_k=1) == preds[:1]
+    assert filtrar(preds, min_confianza=30) == preds[:2]
+    assert filtrar(preds) == preds
+
+
+def test_muchas_cajas_igual_que_el_bucle():
+    """Con miles de cajas, el group-by vectorizado sigue dando lo mismo que el bucle."""
+    results = _resultados_aleatorios(20_000, seed=1)
+    cls, conf = results[0].boxes.cls, results[0].boxes.conf
+    assert agregar_por_clase(cls, conf, NAMES) == agregacion_por_caja(results, NAMES)
+
+
+def test_benchmark_postproceso_mide_las_dos_agregaciones():
+    # Solo la forma del informe: los tiempos se miran con `python -m app.ia.benchmark --postproceso`
+    fila = medir_postproceso(200, repeticiones=1)
+    assert fila["cajas"] == 200
+    assert fila["bucle_ms"] > 0 and fila["vectorizada_ms"] > 0
@@ -0,0 +1,120 @@
+# tests/test_prediction_cache.py
+import asyncio
+import os
+import threading
+import time
+from PIL import Image
+from app.ia.cache import PredictionCache, hash_bytes, hash_perceptual, distancia_hamming
+
+PRED = [{"variedad": "Merlot", "confianza": 91.5}]
+
+
+def test_hit_exacto_y_miss():
+    cache = PredictionCache(max_entries=10)
+    clave = hash_bytes(b"foto")
+
+    assert cache.get(clave, "v1") is None
+    cache.registrar_miss()
+    cache.set(clave, PRED, "v1")
+
+    assert cache.get(clave, "v1") == PRED
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["ratio_hit"] == 0.5
+
+
+def test_lru_acotada():
+    cache = PredictionCache(max_entries=2)
+    cache.set("a", 1, "v1")
+    cache.set("b", 2, "v1")
+    cache.get("a", "v1")        # 'a' pasa a ser la más reciente
+    cache.set("c", 3, "v1")     # se expulsa 'b'
+
+    assert cache.get("b", "v1") is None
+    assert cache.get("a", "v1") == 1
+    assert cache.get("c", "v1") == 3
+
+
+def test_ttl_caduca():
+    cache = PredictionCache(ttl_s=0.01)
+    cache.set("a", PRED, "v1")
+    time.sleep(0.02)
+    assert cache.get("a", "v1") is None
+
+
+def test_cambio_de_version_invalida():
+    cache = PredictionCache()
+    cache.set("a", PRED, "v1")
+    assert cache.get("a", "v2") is None
+    assert cache.stats()["entradas"] == 0
+
+
+def test_nivel_en_disco_sobrevive_a_la_memoria(tmp_path):
+    cache = PredictionCache(disk_dir=str(tmp_path))
+    cache.set("a", PRED, "v1")
+
+    # Un proceso nuevo (memoria vacía) lee del disco
+    otra = PredictionCache(disk_dir=str(tmp_path))
+    assert otra.get("a", "v1") == PRED
+    assert otra.stats()["hits_disco"] == 1
+    # Otra versión del modelo no ve esas entradas
+    assert otra.get("a", "v2") is None
+
+
+def test_disco_acotado_borra_las_menos_usadas(tmp_path):
+    cache = PredictionCache(max_entries=1, disk_dir=str(tmp_path), disk_max_entries=3)
+    ahora = time.time()
+    for i, clave in enumerate("abc"):
+        cache.set(clave, i, "v1")
+        # Fechas de uso distintas aunque el sistema de ficheros tenga poca resolución
+        os.utime(cache._ruta_disco(clave, "v1"), (ahora - 10 + i, ahora - 10 + i))
+    cache.get("a", "v1")  # 'a' sale de disco y pasa a ser la más reciente
+    cache.set("d", 3, "v1")  # Con una cuarta entrada sobra la usada hace más tiempo: 'b'
+
+    otra = PredictionCache(disk_dir=str(tmp_path))
+    assert otra.get("b", "v1") is None
+    assert [otra.get(clave, "v1") for clave in "acd"] == [0, 2, 3]
+    assert otra.recortar_disco() == 0
+
+
+def test_disco_se_recorta_al_escribir(tmp_path):
+    cache = PredictionCache(disk_dir=str(tmp_path), disk_max_entries=10)
+    for i in range(25):
+        cache.set(f"k{i}", i, "v1")
+    assert len(os.listdir(tmp_path / "v1")) <= 10
+
+
+def test_aget_y_aset_no_tocan_el_disco_en_el_event_loop(tmp_path, monkeypatch):
+    hilos = []
+    leer, escribir = PredictionCache._leer_disco, PredictionCache._escribir_disco
+
+    def en_hilo(fn):
+        def envoltura(self, *args):
+            hilos.append(threading.current_thread() is threading.main_thread())
+            return fn(self, *args)
+        return envoltura
+
+    monkeypatch.setattr(PredictionCache, "_leer_disco", en_hilo(leer))
+    monkeypatch.setattr(PredictionCache, "_escribir_disco", en_hilo(escribir))
+
+    async def usar():
+        await PredictionCache(disk_dir=str(tmp_path)).aset("a", PRED, "v1")
+        return await PredictionCache(disk_dir=str(tmp_path)).aget("a", "v1")
+
+    assert asyncio.run(usar()) == PRED
+    assert hilos == [False, False]
+
+
+def test_hash_perceptual_detecta_casi_duplicados():
+    base = Image.linear_gradient("L").convert("RGB").resize((400, 300))
+    reescalada = base.resize((200, 150))
+    distinta = base.rotate(90)
+
+    h = hash_perceptual(base)
+    assert distancia_hamming(h, hash_perceptual(reescalada)) <= 4
+    assert distancia_hamming(h, hash_perceptual(distinta)) > 4
+
+    cache = PredictionCache(phash=True)
+    cache.set("a", PRED, "v1", phash_valor=h)
+    assert cache.get_perceptual(hash_perceptual(reescalada), "v1") == PRED
+    assert cache.stats()["hits_perceptual"] == 1
@@ -0,0 +1,182 @@
+# tests/test_publicaciones.py
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from app import crud, models, schemas
+from app.auth import get_current_user
+from app.main import app
+
+
+def _usuario(db, email):
+    user = crud.create_user(db, schemas.UsuarioCreate(email=email, nombre="N", apellidos="A", password="p"), "hash")
+    db.refresh(user)
+    db.expunge(user)
+    return user
+
+
+@pytest.fixture
+def lector(db_session):
+    user = _usuario(db_session, "lector@test.com")
+    app.dependency_overrides[get_current_user] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_current_user, None)
+
+
+@pytest.fixture
+def consultas(db_session):
+    """Sentencias SQL ejecutadas mientras dura el test."""
+    sentencias = []
+
+    def _registrar(conn, cursor, statement, *args):
+        sentencias.append(statement)
+
+    engine = db_session.get_bind()
+    event.listen(engine, "before_cursor_execute", _registrar)
+    yield sentencias
+    event.remove(engine, "before_cursor_execute", _registrar)
+
+
+def _publicar(db, id_usuario, n):
+    return [
+        crud.create_publicacion(db, schemas.PublicacionCreate(titulo=f"P{i}", texto="-"), id_usuario).id_publicacion
+        for i in range(n)
+    ]
+
+
+def test_feed_incluye_like_y_dislike_del_usuario(client, db_session, lector):
+    autor = _usuario(db_session, "autor@test.com")
+    like, dislike, neutra = _publicar(db_session, autor.id_usuario, 3)
+    crud.votar_publicacion(db_session, lector.id_usuario, like, True)
+    crud.votar_publicacion(db_session, lector.id_usuario, dislike, False)
+    crud.votar_publicacion(db_session, autor.id_usuario, neutra, True)  # el voto de otro no cuenta
+
+    estados = {
+        p["id_publicacion"]: (p["is_liked"], p["is_disliked"])
+        for p in client.get("/publicaciones/").json()
+    }
+    assert estados == {like: (True, False), dislike: (False, True), neutra: (False, False)}
+
+
+def test_votos_del_feed_en_una_sola_consulta(client, db_session, lector, consultas):
+    def consultas_de_votos(n):
+        ids = _publicar(db_session, lector.id_usuario, n)
+        for id_publicacion in ids[::2]:
+            crud.votar_publicacion(db_session, lector.id_usuario, id_publicacion, True)
+        for ruta in ("/publicaciones/", "/publicaciones/me"):
+            consultas.clear()
+            assert client.get(ruta).status_code == 200
+            yield sum('FROM "VotosPublicacion"' in s for s in consultas)
+
+    assert list(consultas_de_votos(2)) == [1, 1]
+    assert list(consultas_de_votos(30)) == [1, 1]
+
+
+def _foro(db, id_usuario, n):
+    """n publicaciones con dos variedades y un hilo de tres niveles cada una."""
+    variedades = [crud.create_variedad(db, schemas.VariedadCreate(nombre=f"V{i}", descripcion="-")) for i in range(2)]
+    ids = []
+    for i in range(n):
+        pub = crud.create_publicacion(
+            db,
+            schemas.PublicacionCreate(titulo=f"P{i}", texto="-", variedades_ids=[v.id_variedad for v in variedades]),
+            id_usuario,
+        )
+        padre = None
+        for nivel in range(3):
+            padre = crud.create_comentario(
+                db, schemas.ComentarioCreate(texto=f"c{nivel}", id_publicacion=pub.id_publicacion, id_padre=padre), id_usuario
+            ).id_comentario
+        ids.append(pub.id_publicacion)
+    return ids
+
+
+def test_pagina_de_100_publicaciones_en_pocas_consultas(client, db_session, lector, consultas):
+    _foro(db_session, lector.id_usuario, 100)
+    db_session.expunge_all()
+
+    for ruta in ("/publicaciones/", "/publicaciones/me"):
+        consultas.clear()
+        response = client.get(ruta)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data) == 100
+        assert len(data[0]["variedades"]) == 2
+        # Publicación + autor, variedades, primeros comentarios, su árbol + autor, votos
+        assert len(consultas) <= 5, consultas
+
+    raiz = next(c for c in data[0]["comentarios"] if c["id_padre"] is None)
+    assert raiz["hijos"][0]["hijos"][0]["texto"] == "c2"
+
+
+def test_feed_solo_incrusta_los_primeros_comentarios(client, db_session, lector):
+    (id_publicacion,) = _publicar(db_session, lector.id_usuario, 1)
+    raices = []
+    for i in range(10):
+        raiz = crud.create_comentario(
+            db_session, schemas.ComentarioCreate(texto=f"r{i}", id_publicacion=id_publicacion), lector.id_usuario
+        ).id_comentario
+        raices.append(raiz)
+        padre = raiz
+        for nivel in range(4):
+            padre = crud.create_comentario(
+                db_session,
+                schemas.ComentarioCreate(texto=f"r{i}-{nivel}", id_publicacion=id_publicacion, id_padre=padre),
+                lector.id_usuario,
+            ).id_comentario
+    for i in range(5):
+        crud.create_comentario(
+            db_session,
+            schemas.ComentarioCreate(texto=f"extra{i}", id_publicacion=id_publicacion, id_padre=raices[0]),
+            lector.id_usuario,
+        )
+    db_session.expunge_all()
+
+    data = client.get("/publicaciones/").json()
+    comentarios = data[0]["comentarios"]
+    assert [c["texto"] for c in comentarios] == ["r0", "r1", "r2"]
+    primero = comentarios[0]
+    assert primero["num_respuestas"] == 6
+    assert len(primero["hijos"]) == 3
+    assert primero["hay_mas_respuestas"]
+    # Dos niveles de respuestas, y del tercero solo se avisa que hay más
+    nieto = primero["hijos"][0]["hijos"][0]
+    assert nieto["texto"] == "r0-1"
+    assert nieto["hijos"] == [] and nieto["hay_mas_respuestas"]
+
+
+def test_scroll_por_cursor_sin_repetir_ni_saltar(client, db_session, lector):
+    # Fechas repetidas a propósito: la id desempata
+    inicio = datetime(2025, 1, 1)
+    for i in range(25):
+        db_session.add(models.Publicacion(
+            titulo=f"P{i}", texto="-", id_usuario=lector.id_usuario, fecha_publicacion=inicio + timedelta(minutes=i // 3)
+        ))
+    db_session.commit()
+
+    vistas, cursor, paginas = [], None, 0
+    while True:
+        response = client.get("/publicaciones/", params={"limit": 10, **({"cursor": cursor} if cursor else {})})
+        vistas += [p["id_publicacion"] for p in response.json()]
+        paginas += 1
+        if paginas == 1:
+            # Una publicación nueva durante el scroll no desplaza las páginas siguientes
+            db_session.add(models.Publicacion(titulo="nueva", texto="-", id_usuario=lector.id_usuario,
+                                              fecha_publicacion=inicio + timedelta(days=1)))
+            db_session.commit()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert paginas == 3
+    assert len(vistas) == len(set(vistas)) == 25
+    orden = db_session.query(models.Publicacion.id_publicacion).filter(models.Publicacion.titulo != "nueva")\
+        .order_by(models.Publicacion.fecha_publicacion.desc(), models.Publicacion.id_publicacion.desc()).all()
+    assert vistas == [i for (i,) in orden]
+
+    # skip/limit sigue funcionando igual
+    assert [p["id_publicacion"] for p in client.get("/publicaciones/?skip=1&limit=2").json()] == [vistas[0], vistas[1]]
+
+
+def test_cursor_invalido_devuelve_400(client, lector):
+    assert client.get("/publicaciones/", params={"cursor": "basura"}).status_code == 400
+    assert client.get("/publicaciones/", params={"cursor": "WzFd"}).status_code == 400  # [1]: faltan columnas
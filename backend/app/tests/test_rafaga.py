@@ -0,0 +1,166 @@
+# tests/test_rafaga.py
+import asyncio
+import importlib.util
+import io
+import pytest
+from PIL import Image
+from app.ia.cache import PredictionCache
+from app.ia.decode import ImagenDemasiadoGrande
+from app.ia.rafaga import frames_de_animacion, identificar_rafaga
+from app.routes import ml_routes
+
+
+def _jpeg(ancho, color=(120, 60, 30)):
+    buffer = io.BytesIO()
+    Image.new("RGB", (ancho, 100), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _gif(n_frames):
+    frames = [Image.new("RGB", (200 if i % 2 else 50, 100), (i * 20, 0, 0)) for i in range(n_frames)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, format="GIF", save_all=True, append_images=frames[1:], duration=40)
+    return buffer.getvalue()
+
+
+def test_para_en_cuanto_el_consenso_es_claro():
+    inferidos = []
+
+    async def inferir(frame, limite):
+        inferidos.append(frame)
+        return [{"variedad": "Merlot", "confianza": 92.0}]
+
+    resultado = asyncio.run(identificar_rafaga(range(20), inferir, lote=4, umbral=80, min_frames=2))
+    assert resultado["umbral_alcanzado"] is True
+    assert resultado["frames_procesados"] == 4 == len(inferidos)
+    assert resultado["consenso"][0]["variedad"] == "Merlot"
+
+
+def test_sin_consenso_procesa_todo_y_cuenta_los_errores():
+    async def inferir(frame, limite):
+        if frame == 3:
+            raise ValueError("frame corrupto")
+        return [{"variedad": "Merlot" if frame % 2 else "Garnacha", "confianza": 60.0}]
+
+    resultado = asyncio.run(identificar_rafaga(range(10), inferir, lote=4, umbral=80))
+    assert resultado["umbral_alcanzado"] is False
+    assert resultado["frames_procesados"] == 10
+    assert resultado["frames_validos"] == 9
+    assert resultado["errores"] == [{"frame": 3, "error": "frame corrupto"}]
+
+
+def test_plazo_por_tanda_y_consenso_parcial_si_se_satura():
+    from app.ia.executor import PlazoAgotado
+
+    limites = []
+
+    async def inferir(frame, limite):
+        limites.append(limite)
+        await asyncio.sleep(0.05)
+        if frame >= 8:
+            raise PlazoAgotado("Plazo agotado esperando en la cola de inferencia")
+        return [{"variedad": "Merlot" if frame % 2 else "Garnacha", "confianza": 60.0}]
+
+    resultado = asyncio.run(identificar_rafaga(range(20), inferir, lote=4, umbral=80, plazo_s=10))
+    # Cada tanda estrena plazo (las tres tandas tienen límites distintos y crecientes)
+    assert len(set(limites)) == 3 and limites == sorted(limites)
+    assert resultado["frames_validos"] == 8
+    assert resultado["frames_procesados"] == 12
+    assert resultado["interrumpida"] == "Plazo agotado esperando en la cola de inferencia"
+    assert {c["variedad"] for c in resultado["consenso"]} == {"Merlot", "Garnacha"}
+
+    async def saturada(frame, limite):
+        raise PlazoAgotado("sin sitio")
+
+    with pytest.raises(PlazoAgotado):
+        asyncio.run(identificar_rafaga(range(4), saturada, lote=4))
+
+
+def test_frames_de_animacion_reparte_el_muestreo():
+    frames = list(frames_de_animacion(_gif(12), max_frames=4))
+    assert len(frames) == 4
+    assert all(f.mode == "RGB" for f in frames)
+
+
+def test_animacion_con_lienzo_enorme_se_rechaza_antes_de_decodificar():
+    # Lienzo de 50x100 = 5.000 px; el límite se mira en la cabecera, al llamar
+    with pytest.raises(ImagenDemasiadoGrande):
+        frames_de_animacion(_gif(3), max_frames=4, max_pixeles=1_000)
+
+
+def test_cierra_el_generador_de_frames_al_parar_pronto():
+    cerrado = []
+
+    def frames():
+        try:
+            yield from range(20)
+        finally:
+            cerrado.append(True)
+
+    async def inferir(frame, limite):
+        return [{"variedad": "Merlot", "confianza": 92.0}]
+
+    resultado = asyncio.run(identificar_rafaga(frames(), inferir, lote=4, umbral=80, min_frames=2))
+    assert resultado["frames_procesados"] == 4
+    assert cerrado == [True]
+
+
+@pytest.fixture
+def fake_modelo(monkeypatch):
+    """Fotos anchas: 'Merlot' al 90 %; estrechas: 'Garnacha' al 90 %."""
+    llamadas = []
+
+    def fake_predict(images, imgsz=None):
+        llamadas.append(len(images))
+        return [img.size for img in images]
+
+    def fake_agregar(results):
+        return [{"variedad": "Merlot" if results[0][0] > 100 else "Garnacha", "confianza": 90.0}]
+
+    monkeypatch.setattr(ml_routes.batcher, "predict_fn", fake_predict)
+    monkeypatch.setattr(ml_routes, "_agregar_predicciones", fake_agregar)
+    monkeypatch.setattr(ml_routes, "cache", PredictionCache())
+    return llamadas
+
+
+def test_rafaga_de_fotos_para_pronto(client, fake_modelo):
+    files = [("files", (f"{i}.jpg", _jpeg(200, (i, i, i)), "image/jpeg")) for i in range(20)]
+    response = client.post("/ia/predict/rafaga", files=files)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["umbral_alcanzado"] is True
+    assert data["frames_totales"] == 20
+    assert data["frames_procesados"] < 20
+    assert sum(fake_modelo) == data["frames_procesados"]
+    assert data["consenso"][0]["variedad"] == "Merlot"
+
+
+def test_rafaga_ambigua_procesa_todos_los_frames(client, fake_modelo):
+    files = [("files", (f"{i}.jpg", _jpeg(200 if i % 2 else 50, (i, i, i)), "image/jpeg")) for i in range(10)]
+    files.append(("files", ("roto.jpg", b"no soy una imagen", "image/jpeg")))
+    response = client.post("/ia/predict/rafaga", files=files)
+    data = response.json()
+    assert data["umbral_alcanzado"] is False
+    assert data["frames_procesados"] == 11
+    assert data["frames_validos"] == 10
+    assert data["errores"][0]["frame"] == 10
+
+
+def test_rafaga_desde_gif_animado(client, fake_modelo):
+    response = client.post("/ia/predict/rafaga?umbral=40", files={"files": ("vid.gif", _gif(30), "image/gif")})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["frames_totales"] is None
+    assert data["umbral_alcanzado"] is True
+
+
+@pytest.mark.skipif(importlib.util.find_spec("cv2") is not None, reason="OpenCV instalado")
+def test_gif_con_lienzo_enorme_devuelve_413(client, fake_modelo, monkeypatch):
+    monkeypatch.setattr(ml_routes.settings, "IA_MAX_PIXELS", 1_000)
+    response = client.post("/ia/predict/rafaga", files={"files": ("vid.gif", _gif(3), "image/gif")})
+    assert response.status_code == 413
+
+
+def test_video_sin_opencv_devuelve_415(client, fake_modelo):
+    response = client.post("/ia/predict/rafaga", files={"files": ("v.mp4", b"\x00" * 100, "video/mp4")})
+    assert response.status_code == 415
@@ -0,0 +1,92 @@
+# tests/test_regresion.py
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from app.ia import regresion
+
+
+class _Cajas:
+    def __init__(self, cls, conf):
+        self.cls = np.array([cls])
+        self.conf = np.array([conf])
+
+
+class _Resultado:
+    def __init__(self, cls, conf):
+        self.boxes = _Cajas(cls, conf)
+
+
+class ModeloFalso:
+    """Acierta con las fotos rojas; con poco brillo la confianza baja a 0.3."""
+    names = {0: "Merlot", 1: "Garnacha"}
+
+    def predict(self, image, save=False, verbose=False):
+        r, g, _ = np.asarray(image, dtype=np.float32).reshape(-1, 3).max(axis=0)
+        return [_Resultado(0 if r > g else 1, 0.9 if max(r, g) > 150 else 0.3)]
+
+
+def cargar_falso(backend, model_path):
+    return ModeloFalso()
+
+
+def _tareas(tmp_path, n=4):
+    tareas = []
+    for i in range(n):
+        ruta = str(tmp_path / f"m{i}.jpg")
+        Image.new("RGB", (80, 60), (220, 10, 10)).save(ruta)
+        tareas.append({"dataset": "D", "archivo": f"m{i}.jpg", "ruta": ruta, "clase": "Merlot", "min_conf": 0.5})
+    return tareas
+
+
+def test_evalua_variantes_y_cachea_las_muestras(tmp_path):
+    cache = str(tmp_path / "cache")
+    filas = regresion.ejecutar(_tareas(tmp_path), "fake", "-", procesos=0, cache_dir=cache, cargador=cargar_falso)
+
+    assert len(filas) == 4 * len(regresion.VARIANTES)
+    assert len(os.listdir(cache)) == 4
+    resumen = regresion.metricas(filas)
+    assert resumen["normal"]["precision"] == 100.0
+    assert resumen["brillo"]["precision"] == 0.0  # 0.3 < 0.40
+    assert resumen["rotacion"]["n"] == 4
+
+
+def test_procesos_en_paralelo_dan_lo_mismo(tmp_path):
+    tareas = _tareas(tmp_path, n=3)
+    serie = regresion.ejecutar(tareas, "fake", "-", procesos=0, cargador=cargar_falso)
+    paralelo = regresion.ejecutar(tareas, "fake", "-", procesos=2, cargador=cargar_falso)
+    clave = lambda f: (f["archivo"], f["variante"], f["detectada"], f["acierto"])
+    assert sorted(map(clave, serie)) == sorted(map(clave, paralelo))
+
+
+def test_comparar_con_la_baseline():
+    base = {"normal": {"precision": 95.0, "p95_ms": 100.0}}
+    assert regresion.comparar({"normal": {"precision": 94.0, "p95_ms": 120.0}}, base) == []
+    regresiones = regresion.comparar({"normal": {"precision": 90.0, "p95_ms": 130.0}}, base)
+    assert len(regresiones) == 2
+    assert regresion.comparar({}, base) == ["normal: sin resultados"]
+
+
+@pytest.fixture
+def argumentos(tmp_path, monkeypatch):
+    """main() con el modelo falso y sin leer los pesos reales."""
+    from app.ia import model_loader
+
+    tareas = _tareas(tmp_path, n=2)
+    ejecutar = regresion.ejecutar
+    monkeypatch.setattr(regresion, "tareas_de_datasets", lambda datasets, max_muestras: tareas)
+    monkeypatch.setattr(model_loader, "version_de", lambda path, backend="pytorch": "v-test")
+    monkeypatch.setattr(
+        regresion, "ejecutar",
+        lambda tareas, backend, ruta, procesos, cache: ejecutar(tareas, backend, ruta, 0, cargador=cargar_falso),
+    )
+    return ["--resultados", str(tmp_path / "resultados.json"), "--baseline", str(tmp_path / "baseline.json")]
+
+
+def test_sin_baseline_no_sale_con_exito(argumentos):
+    assert regresion.main(argumentos) == 2
+    assert regresion.main(argumentos + ["--permitir-sin-baseline"]) == 0
+
+    assert regresion.main(argumentos + ["--actualizar-baseline"]) == 0
+    # La latencia de dos ejecuciones seguidas varía: aquí solo cuenta la precisión
+    assert regresion.main(argumentos + ["--tolerancia-p95", "1e9"]) == 0
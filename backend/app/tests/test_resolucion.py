@@ -0,0 +1,71 @@
+# tests/test_resolucion.py
+import asyncio
+from app.ia.batcher import MicroBatcher
+from app.ia.resolucion import PoliticaResolucion, parsear_niveles
+
+
+def test_parsear_niveles():
+    assert parsear_niveles("320, 640,480,640") == [640, 480, 320]
+
+
+def test_modos_explicitos_ignoran_la_carga():
+    politica = PoliticaResolucion([640, 480, 320], cola_alta=1, enfriamiento_s=0)
+    assert politica.elegir("accurate", profundidad=100) == 640
+    assert politica.elegir("fast", profundidad=0) == 320
+    assert politica.aceptables(480) == [640, 480]
+
+
+def test_degrada_con_carga_y_se_recupera_con_histeresis():
+    politica = PoliticaResolucion(
+        [640, 480, 320], cola_alta=10, cola_baja=2, p95_alto_ms=500, p95_bajo_ms=100, enfriamiento_s=0
+    )
+    assert politica.elegir("auto", profundidad=0) == 640
+
+    # Cola larga -> baja un nivel en cada evaluación hasta el mínimo
+    assert politica.elegir("auto", profundidad=12) == 480
+    assert politica.elegir("auto", profundidad=12) == 320
+    assert politica.elegir("auto", profundidad=12) == 320
+
+    # Cola intermedia: ni sube ni baja
+    assert politica.elegir("auto", profundidad=5) == 320
+
+    # p95 alto con cola corta tampoco permite subir
+    for _ in range(20):
+        politica.observar(700)
+    assert politica.elegir("auto", profundidad=0) == 320
+
+    # Carga baja y latencias bajas -> recupera la resolución completa
+    politica._latencias.clear()
+    for _ in range(20):
+        politica.observar(50)
+    assert politica.elegir("auto", profundidad=0) == 480
+    assert politica.elegir("auto", profundidad=0) == 640
+    assert politica.stats()["degradaciones"] == 2 and politica.stats()["recuperaciones"] == 2
+
+
+def test_enfriamiento_evita_oscilar():
+    politica = PoliticaResolucion([640, 320], cola_alta=10, cola_baja=2, enfriamiento_s=60)
+    assert politica.elegir("auto", profundidad=20) == 320
+    assert politica.elegir("auto", profundidad=0) == 320  # Aún en enfriamiento
+
+
+def test_el_batcher_separa_los_lotes_por_resolucion():
+    llamadas = []
+
+    def fake_predict(images, imgsz=None):
+        llamadas.append((imgsz, len(images)))
+        return [(imgsz, img) for img in images]
+
+    batcher = MicroBatcher(fake_predict, max_batch_size=8, max_wait_ms=50)
+
+    async def escenario():
+        resultados = await asyncio.gather(
+            batcher.submit("a", imgsz=640),
+            batcher.submit("b", imgsz=320),
+            batcher.submit("c", imgsz=640),
+        )
+        await batcher.close()
+        return resultados
+
+    assert asyncio.run(escenario()) == [(640, "a"), (320, "b"), (640, "c")]
+    assert sorted(llamadas) == [(320, 1), (640, 2)]
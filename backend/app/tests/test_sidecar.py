@@ -0,0 +1,105 @@
+# tests/test_sidecar.py
+import asyncio
+import io
+import os
+import stat
+import threading
+import time
+import numpy as np
+import pytest
+from PIL import Image
+from app.ia import sidecar
+from app.ia.postproceso import agregar_por_clase, tensores_de_resultados
+
+
+class FakeBoxes:
+    def __init__(self, ancho):
+        # Las imágenes anchas -> clase 0, las estrechas -> clase 1
+        self.cls = np.array([0 if ancho > 100 else 1, 0])
+        self.conf = np.array([0.9, 0.5], dtype=np.float32)
+
+
+class FakeResult:
+    def __init__(self, ancho):
+        self.boxes = FakeBoxes(ancho)
+        self.speed = {"preprocess": 1.0, "inference": 10.0, "postprocess": 0.5}
+
+
+class FakeModel:
+    names = {0: "Merlot", 1: "Garnacha"}
+
+    def predict(self, images, save=False, verbose=False):
+        images = images if isinstance(images, list) else [images]
+        return [FakeResult(img.size[0]) for img in images]
+
+
+@pytest.fixture
+def socket_sidecar(tmp_path):
+    ruta = str(tmp_path / "ia.sock")
+    loop = asyncio.new_event_loop()
+    tarea = loop.create_task(sidecar.servir(ruta, model=FakeModel()))
+
+    def ejecutar():
+        try:
+            loop.run_until_complete(tarea)
+        except asyncio.CancelledError:
+            pass
+
+    hilo = threading.Thread(target=ejecutar, daemon=True)
+    hilo.start()
+    for _ in range(100):
+        if os.path.exists(ruta):
+            break
+        time.sleep(0.02)
+    yield ruta
+    loop.call_soon_threadsafe(tarea.cancel)
+    hilo.join(timeout=2)
+
+
+def test_modelo_remoto_infiere_en_el_sidecar(socket_sidecar):
+    remoto = sidecar.ModeloRemoto(socket_sidecar)
+    assert remoto.names == {0: "Merlot", 1: "Garnacha"}
+
+    resultados = remoto.predict([Image.new("RGB", (200, 50)), Image.new("RGB", (50, 50))])
+    assert len(resultados) == 2
+    assert resultados[0].speed["inference"] == 10.0
+
+    # El post-proceso de la API funciona igual con resultados remotos
+    cls, conf = tensores_de_resultados([resultados[0]])
+    assert agregar_por_clase(cls, conf, remoto.names) == [{"variedad": "Merlot", "confianza": 70.0}]
+    cls, conf = tensores_de_resultados([resultados[1]])
+    assert agregar_por_clase(cls, conf, remoto.names)[0]["variedad"] == "Garnacha"
+
+
+def test_el_socket_solo_es_del_usuario_y_su_grupo(socket_sidecar):
+    assert stat.S_IMODE(os.stat(socket_sidecar).st_mode) == 0o660
+
+
+def test_varias_peticiones_por_la_misma_conexion(socket_sidecar):
+    remoto = sidecar.ModeloRemoto(socket_sidecar)
+    for _ in range(3):
+        assert len(remoto.predict(Image.new("RGB", (120, 80)))) == 1
+
+
+def test_errores_del_sidecar_son_inferencia_saturada(socket_sidecar, tmp_path, client, monkeypatch):
+    from app.ia.executor import InferenciaSaturada
+    from app.routes import ml_routes
+
+    remoto = sidecar.ModeloRemoto(socket_sidecar)
+    # Error dentro del sidecar (aquí, una imagen que el modelo falso no sabe leer)
+    with pytest.raises(sidecar.SidecarNoDisponible):
+        remoto._llamar({"op": "predict", "imagenes": [{"shape": [2, 2, 3]}]}, [b"\x00"])
+    # Sidecar caído
+    with pytest.raises(InferenciaSaturada):
+        sidecar.ModeloRemoto(str(tmp_path / "no-existe.sock"))
+
+    def caido(images, imgsz=None):
+        raise sidecar.SidecarNoDisponible("Sidecar de inferencia no disponible", retry_after_s=2)
+
+    monkeypatch.setattr(ml_routes.batcher, "predict_fn", caido)
+    monkeypatch.setattr(ml_routes, "cache", ml_routes.PredictionCache())
+    buffer = io.BytesIO()
+    Image.new("RGB", (90, 90)).save(buffer, format="JPEG")
+    response = client.post("/ia/predict", files={"file": ("s.jpg", buffer.getvalue(), "image/jpeg")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
@@ -0,0 +1,306 @@
+# tests/test_similares.py
+import asyncio
+import io
+import threading
+import numpy as np
+import pytest
+from PIL import Image
+from app import crud, models, schemas
+from app.auth import get_current_user, get_current_user_optional
+from app.main import app
+from app.ia.embeddings import IndiceVectorial, normalizar
+from app.ia.executor import InferenciaSaturada
+from app.ia.similares import IndiceSimilares
+from app.ia.cache import PredictionCache
+from app.routes import ml_routes, routes_coleccion
+from sqlalchemy.orm import sessionmaker
+
+ROJO, VERDE, AZUL = (200, 20, 20), (20, 200, 20), (20, 20, 200)
+
+
+def _jpeg(color, size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _vectores(n, dim=32, semilla=0):
+    return normalizar(np.random.default_rng(semilla).normal(size=(n, dim)).astype(np.float32))
+
+
+# --- Índice vectorial ---
+
+def test_fuerza_bruta_es_exacta_y_filtra_por_usuario():
+    vectores = _vectores(500)
+    metas = [{"clave": i, "id_variedad": i % 5, "id_usuario": (i % 3) or None} for i in range(500)]
+    indice = IndiceVectorial()
+    indice.agregar(vectores, metas)
+
+    consulta = vectores[7] + 0.01
+    esperados = list(np.argsort(-(vectores @ normalizar(consulta[None])[0]))[:10])
+    assert [m["clave"] for _, m in indice.buscar(consulta, 10)] == esperados
+
+    # Usuario 1: sus avistamientos y las fotos de referencia (sin id_usuario)
+    visibles = indice.buscar(consulta, 500, id_usuario_visible=1)
+    assert {m.get("id_usuario") for _, m in visibles} == {None, 1}
+
+
+def test_altas_incrementales_y_bajas():
+    indice = IndiceVectorial()
+    vectores = _vectores(3)
+    indice.agregar(vectores[:2], [{"clave": "a", "id_variedad": 1}, {"clave": "b", "id_variedad": 2}])
+    indice.agregar(vectores[2:], [{"clave": "c", "id_variedad": 3}])
+    assert indice.buscar(vectores[2], 1)[0][1]["clave"] == "c"
+
+    assert indice.eliminar("c")
+    assert len(indice) == 2
+    assert all(m["clave"] != "c" for _, m in indice.buscar(vectores[2], 3))
+    # Repetir una clave sustituye la entrada
+    indice.agregar(vectores[2:], [{"clave": "a", "id_variedad": 9}])
+    assert len(indice) == 2
+    assert indice.buscar(vectores[2], 1)[0][1]["id_variedad"] == 9
+
+
+def test_ivf_recupera_casi_los_mismos_vecinos_que_la_busqueda_exacta():
+    # Datos agrupados (como fotos de la misma variedad)
+    rng = np.random.default_rng(1)
+    centros = _vectores(40, dim=64, semilla=2)
+    vectores = normalizar(np.repeat(centros, 100, axis=0) + rng.normal(scale=0.05, size=(4000, 64)))
+    indice = IndiceVectorial(min_ann=1000, nprobe=8)
+    # agregar solo avisa de que toca entrenar: el k-means no corre con el lock cogido
+    assert indice.agregar(vectores, [{"clave": i, "id_variedad": i // 100} for i in range(4000)])
+    assert not indice.usa_ann
+    assert indice.entrenar()
+    assert indice.usa_ann
+
+    aciertos = 0
+    for q in vectores[rng.choice(4000, 50, replace=False)]:
+        exactos = {m["clave"] for _, m in indice.buscar(q, 10, exacta=True)}
+        aproximados = {m["clave"] for _, m in indice.buscar(q, 10)}
+        aciertos += len(exactos & aproximados)
+    assert aciertos / 500 >= 0.9
+
+
+def test_entrenar_no_bloquea_altas_ni_busquedas():
+    vectores = _vectores(300, dim=16)
+    indice = IndiceVectorial(min_ann=100, nprobe=4)
+    assert indice.agregar(vectores[:200], [{"clave": i, "id_variedad": 1} for i in range(200)])
+
+    # Mientras corre el k-means, otro hilo añade y busca
+    kmeans = indice._kmeans
+    durante = []
+
+    def kmeans_con_altas(datos, iteraciones):
+        hilo = threading.Thread(target=lambda: durante.append((
+            indice.agregar(vectores[200:], [{"clave": i, "id_variedad": 2} for i in range(200, 300)]),
+            indice.buscar(vectores[0], 1)[0][1]["clave"],
+        )))
+        hilo.start()
+        hilo.join(timeout=5)
+        return kmeans(datos, iteraciones)
+
+    indice._kmeans = kmeans_con_altas
+    assert indice.entrenar()
+    assert durante == [(False, 0)]  # Sin esperar al lock y sin pedir otro entrenamiento a la vez
+    # Las filas añadidas durante el entrenamiento también tienen su lista
+    assert indice.buscar(vectores[250], 1)[0][1]["clave"] == 250
+
+
+def test_guardar_no_deja_el_fichero_a_medias(tmp_path, monkeypatch):
+    indice = IndiceVectorial()
+    indice.agregar(_vectores(4), [{"clave": f"k{i}", "id_variedad": i} for i in range(4)])
+    ruta = str(tmp_path / "indice.npz")
+    indice.guardar(ruta, "v1")
+
+    def falla(*args, **kwargs):
+        raise OSError("disco lleno")
+
+    monkeypatch.setattr(np, "savez", falla)
+    with pytest.raises(OSError):
+        indice.guardar(ruta, "v2")
+    assert IndiceVectorial.cargar(ruta)[1] == "v1"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["indice.npz"]
+
+
+def test_guardar_y_cargar(tmp_path):
+    indice = IndiceVectorial()
+    vectores = _vectores(4)
+    indice.agregar(vectores, [{"clave": f"k{i}", "id_variedad": i} for i in range(4)])
+    indice.eliminar("k0")
+    ruta = str(tmp_path / "indice.npz")
+    indice.guardar(ruta, "v1")
+
+    cargado, version = IndiceVectorial.cargar(ruta)
+    assert version == "v1"
+    assert len(cargado) == 3
+    assert cargado.buscar(vectores[2], 1)[0][1]["clave"] == "k2"
+
+
+# --- Servicio sobre la base de datos ---
+
+async def _embed_por_color(images, carril=None, limite=None):
+    """Embedding falso: el color medio de la foto."""
+    return normalizar(np.stack([np.asarray(img, dtype=np.float32).mean(axis=(0, 1)) for img in images])), "v1"
+
+
+def _decodificar(datos):
+    return Image.open(io.BytesIO(datos)).convert("RGB")
+
+
+FOTOS = {"https://ref/rojo.jpg": _jpeg(ROJO), "https://ref/verde.jpg": _jpeg(VERDE), "https://ik/azul.jpg": _jpeg(AZUL)}
+
+
+@pytest.fixture
+def usuario(db_session):
+    user = crud.create_user(
+        db_session, schemas.UsuarioCreate(email="s@test.com", nombre="S", apellidos="A", password="p"), "hash"
+    )
+    app.dependency_overrides[get_current_user] = lambda: user
+    app.dependency_overrides[get_current_user_optional] = lambda: user
+    yield user
+    app.dependency_overrides.pop(get_current_user, None)
+    app.dependency_overrides.pop(get_current_user_optional, None)
+
+
+@pytest.fixture
+def datos(db_session, usuario):
+    """Merlot (foto roja) y Albariño (verde) en la biblioteca; Garnacha (azul) en la colección de otro."""
+    merlot = models.Variedad(nombre="Merlot", descripcion="-", links_imagenes=["https://ref/rojo.jpg"])
+    albarino = models.Variedad(nombre="Albariño", descripcion="-", links_imagenes=["https://ref/verde.jpg", "https://ref/rota.jpg"])
+    garnacha = models.Variedad(nombre="Garnacha", descripcion="-", links_imagenes=[])
+    otro = models.Usuario(email="o@test.com", nombre="O", apellidos="B", password_hash="x")
+    db_session.add_all([merlot, albarino, garnacha, otro])
+    db_session.commit()
+    db_session.add(models.Coleccion(id_usuario=otro.id_usuario, id_variedad=garnacha.id_variedad, path_foto_usuario="https://ik/azul.jpg"))
+    db_session.commit()
+    # Fuera de la sesión: los commits de las rutas no lo caducan
+    db_session.refresh(usuario)
+    db_session.expunge(usuario)
+    return {"merlot": merlot.id_variedad, "garnacha": garnacha.id_variedad, "sesiones": sessionmaker(bind=db_session.get_bind())}
+
+
+@pytest.fixture
+def servicio(monkeypatch):
+    def descargar(url):
+        if url not in FOTOS:
+            raise OSError("404")
+        return FOTOS[url]
+
+    indice = IndiceSimilares(_embed_por_color, lambda: "v1", _decodificar, descargar_fn=descargar)
+    monkeypatch.setattr(ml_routes, "similares", indice)
+    return indice
+
+
+def test_construye_desde_la_base_y_agrupa_por_variedad(datos, servicio):
+    asyncio.run(servicio.construir(datos["sesiones"]))
+    assert servicio.listo
+    assert servicio.stats()["fotos"] == 3
+    assert servicio.fallidas == 1  # La referencia rota se salta
+
+    encontrados = asyncio.run(servicio.buscar(_decodificar(_jpeg((30, 30, 210))), k=2, id_usuario=None))
+    assert encontrados["variedades_cercanas"][0]["variedad"] == "Garnacha"
+    # Sin usuario solo se ven fotos de referencia, no colecciones ajenas
+    assert all(a["tipo"] == "referencia" for a in encontrados["avistamientos"])
+
+
+def test_se_reconstruye_si_cambia_la_version_del_modelo(datos, servicio):
+    asyncio.run(servicio.construir(datos["sesiones"]))
+    servicio.version_fn = lambda: "v2"
+
+    async def v2(images, carril=None, limite=None):
+        vectores, _ = await _embed_por_color(images)
+        return vectores, "v2"
+
+    servicio.embed_fn = v2
+    # Buscar no lanza la reconstrucción: solo dice que no hay índice vigente
+    assert asyncio.run(servicio.buscar(_decodificar(_jpeg(ROJO)))) is None
+    assert servicio.version == "v1"
+
+    # La reconstruye el vigilante de versiones
+    asyncio.run(servicio.comprobar_version())
+    assert servicio.listo and servicio.version == "v2"
+    assert asyncio.run(servicio.buscar(_decodificar(_jpeg(ROJO)))) is not None
+
+
+def test_solo_descarga_de_los_origenes_permitidos():
+    from app.ia.similares import OrigenNoPermitido, descargar, permitida
+
+    origenes = ["https://ik.imagekit.io/VitIA"]
+    assert permitida("https://ik.imagekit.io/VitIA/vitia/foto.jpg", origenes)
+    for url in (
+        "http://ik.imagekit.io/VitIA/foto.jpg",
+        "https://ik.imagekit.io/Otro/foto.jpg",
+        "https://ik.imagekit.io/VitIAmal/foto.jpg",
+        "https://ik.imagekit.io@169.254.169.254/VitIA/foto.jpg",
+        "https://ik.imagekit.io:8443/VitIA/foto.jpg",
+        "https://169.254.169.254/latest/meta-data/",
+        "file:///etc/passwd",
+    ):
+        assert not permitida(url, origenes), url
+        with pytest.raises(OrigenNoPermitido):
+            descargar(url, origenes)
+    with pytest.raises(OrigenNoPermitido):
+        descargar("https://ik.imagekit.io/VitIA/foto.jpg")  # Sin orígenes no se descarga nada
+
+
+def test_similares_saturado_responde_503(client, datos, servicio, monkeypatch):
+    asyncio.run(servicio.construir(datos["sesiones"]))
+
+    async def saturado(images, carril=None, limite=None):
+        raise InferenciaSaturada("sin sitio", retry_after_s=2)
+
+    servicio.embed_fn = saturado
+    response = client.post("/ia/similares", files={"file": ("x.jpg", _jpeg(ROJO), "image/jpeg")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "2"
+
+
+def test_embed_pasa_por_la_admision(monkeypatch):
+    from app.ia.executor import InferenceExecutor
+
+    executor = InferenceExecutor(max_workers=1, max_queue=2)
+    monkeypatch.setattr(ml_routes, "executor", executor)
+    monkeypatch.setattr(ml_routes.registry, "embed", lambda images: (np.zeros((len(images), 3)), "v1"))
+    with pytest.raises(InferenciaSaturada):
+        asyncio.run(ml_routes._embed([object()] * 3))
+    vectores, _ = asyncio.run(ml_routes._embed([object()] * 2))
+    assert len(vectores) == 2
+    assert executor.stats()["pendientes"] == 0
+    executor.shutdown()
+
+
+def test_predict_sugiere_variedades_si_yolo_no_detecta_nada(client, datos, servicio, monkeypatch):
+    asyncio.run(servicio.construir(datos["sesiones"]))
+    monkeypatch.setattr(ml_routes.batcher, "predict_fn", lambda images, imgsz=None: list(images))
+    monkeypatch.setattr(ml_routes, "_agregar_predicciones", lambda results: [])
+    monkeypatch.setattr(ml_routes, "cache", PredictionCache())
+
+    response = client.post("/ia/predict", files={"file": ("x.jpg", _jpeg((210, 30, 30)), "image/jpeg")})
+    assert response.status_code == 200
+    assert response.json()["predicciones"] == []
+    assert response.json()["variedades_cercanas"][0]["id_variedad"] == datos["merlot"]
+
+
+def test_endpoint_similares_y_alta_incremental(client, usuario, datos, servicio, monkeypatch):
+    response = client.post("/ia/similares", files={"file": ("x.jpg", _jpeg(ROJO), "image/jpeg")})
+    assert response.status_code == 503  # Aún no se ha construido
+
+    asyncio.run(servicio.construir(datos["sesiones"]))
+    monkeypatch.setattr(routes_coleccion, "upload_image_to_imagekit", lambda b, f, folder="/vitia": f"https://ik/{f}")
+    subida = client.post(
+        "/coleccion/upload",
+        files={"file": ("mia.jpg", _jpeg((240, 240, 0)), "image/jpeg")},
+        data={"nombre_variedad": "Verdejo"},
+    )
+    assert subida.status_code == 200
+    assert servicio.stats()["fotos"] == 4
+
+    response = client.post("/ia/similares?k=2", files={"file": ("x.jpg", _jpeg((230, 230, 10)), "image/jpeg")})
+    assert response.status_code == 200
+    primero = response.json()["avistamientos"][0]
+    assert primero["tipo"] == "avistamiento"
+    assert primero["id_usuario"] == usuario.id_usuario
+    assert primero["variedad"] == "Verdejo"
+
+    client.delete(f"/coleccion/{subida.json()['id_coleccion']}")
+    assert servicio.stats()["fotos"] == 3
@@ -0,0 +1,181 @@
+# tests/test_votos.py
+import pytest
+from sqlalchemy import event
+from app import crud, models, schemas
+
+
+def _usuario(db, email):
+    return crud.create_user(db, schemas.UsuarioCreate(email=email, nombre="N", apellidos="A", password="p"), "hash").id_usuario
+
+
+@pytest.fixture
+def publicacion(db_session):
+    autor = _usuario(db_session, "autor@test.com")
+    return crud.create_publicacion(db_session, schemas.PublicacionCreate(titulo="T", texto="-"), autor).id_publicacion
+
+
+def _contadores(db, id_publicacion):
+    db.expire_all()
+    pub = crud.get_publicacion(db, id_publicacion)
+    return pub.likes, pub.dislikes
+
+
+def test_transiciones_de_voto(db_session, publicacion):
+    yo = _usuario(db_session, "yo@test.com")
+    pasos = [
+        (True, "voto_creado", (1, 0)),
+        (True, "sin_cambios", (1, 0)),
+        (False, "voto_actualizado", (0, 1)),
+        (True, "voto_actualizado", (1, 0)),
+        (None, "voto_eliminado", (0, 0)),
+        (None, "sin_cambios", (0, 0)),
+        (False, "voto_creado", (0, 1)),
+    ]
+    for es_like, estado, contadores in pasos:
+        assert crud.votar_publicacion(db_session, yo, publicacion, es_like) == estado
+        assert _contadores(db_session, publicacion) == contadores
+
+
+def test_votar_no_cuenta_los_votos_existentes(db_session, publicacion):
+    # Usuarios directos a la tabla: create_user calcula el hash de la contraseña
+    votantes = [models.Usuario(nombre="N", apellidos="A", email=f"u{i}@test.com", password_hash="x") for i in range(30)]
+    db_session.add_all(votantes)
+    db_session.flush()
+    db_session.add_all(
+        models.VotoPublicacion(es_like=i % 3 != 0, id_usuario=u.id_usuario, id_publicacion=publicacion)
+        for i, u in enumerate(votantes)
+    )
+    db_session.commit()
+    crud.reconciliar_contadores(db_session)
+    yo = _usuario(db_session, "yo@test.com")
+
+    sentencias = []
+    registrar = lambda conn, cursor, statement, *args: sentencias.append(statement)
+    event.listen(db_session.get_bind(), "before_cursor_execute", registrar)
+    try:
+        crud.votar_publicacion(db_session, yo, publicacion, True)
+    finally:
+        event.remove(db_session.get_bind(), "before_cursor_execute", registrar)
+
+    # UPDATE del voto (no había), INSERT ... ON CONFLICT y UPDATE likes = likes + 1
+    assert len(sentencias) == 3
+    assert not any("count(" in s.lower() for s in sentencias)
+    assert _contadores(db_session, publicacion) == (21, 10)
+
+
+def test_reconciliador_corrige_la_deriva(db_session, publicacion):
+    yo = _usuario(db_session, "yo@test.com")
+    crud.votar_publicacion(db_session, yo, publicacion, False)
+    comentario = crud.create_comentario(db_session, schemas.ComentarioCreate(texto="c", id_publicacion=publicacion), yo)
+    crud.votar_comentario(db_session, yo, comentario.id_comentario, True)
+    assert crud.reconciliar_contadores(db_session) == 0
+
+    # Un voto borrado sin pasar por gestionar_voto desvía el contador
+    db_session.query(models.VotoPublicacion).delete()
+    db_session.commit()
+    assert _contadores(db_session, publicacion) == (0, 1)
+
+    assert crud.reconciliar_contadores(db_session) == 1
+    assert _contadores(db_session, publicacion) == (0, 0)
+    assert crud.reconciliar_contadores(db_session) == 0
+
+
+def test_acumulador_agrupa_los_contadores(db_session, publicacion):
+    from sqlalchemy.orm import sessionmaker
+    from app.services.votos_service import AcumuladorVotos
+
+    acumulador = AcumuladorVotos(sessionmaker(bind=db_session.get_bind()), max_eventos=1000)
+    votantes = [models.Usuario(nombre="N", apellidos="A", email=f"u{i}@test.com", password_hash="x") for i in range(40)]
+    db_session.add_all(votantes)
+    db_session.commit()
+
+    for i, u in enumerate(votantes):
+        crud.votar_publicacion(db_session, u.id_usuario, publicacion, i % 4 != 0, acumulador.registrar)
+    crud.votar_publicacion(db_session, votantes[1].id_usuario, publicacion, None, acumulador.registrar)
+
+    # Los votos ya están guardados; el contador, aún no
+    assert db_session.query(models.VotoPublicacion).count() == 39
+    assert _contadores(db_session, publicacion) == (0, 0)
+
+    assert acumulador.vaciar() == 1  # Una sola fila actualizada, una vez
+    assert _contadores(db_session, publicacion) == (29, 10)
+    assert acumulador.vaciar() == 0
+    assert crud.reconciliar_contadores(db_session) == 0
+
+
+def test_reconciliar_con_votos_acumulados_no_los_cuenta_dos_veces(db_session, publicacion):
+    from sqlalchemy.orm import sessionmaker
+    from app.services.votos_service import AcumuladorVotos
+
+    acumulador = AcumuladorVotos(sessionmaker(bind=db_session.get_bind()), max_eventos=1000)
+    yo = _usuario(db_session, "yo@test.com")
+    crud.votar_publicacion(db_session, yo, publicacion, True, acumulador.registrar)
+    assert _contadores(db_session, publicacion) == (0, 0)
+
+    # El reconciliador pasa entre el voto y el vaciado: lo pendiente no es deriva
+    assert crud.reconciliar_contadores(db_session) == 0
+    assert _contadores(db_session, publicacion) == (0, 0)
+
+    assert acumulador.vaciar() == 1
+    assert _contadores(db_session, publicacion) == (1, 0)
+    assert crud.reconciliar_contadores(db_session) == 0
+    assert _contadores(db_session, publicacion) == (1, 0)
+
+
+def test_reconciliador_aplica_los_pendientes_huerfanos(db_session, publicacion):
+    yo = _usuario(db_session, "yo@test.com")
+    # Un worker que muere antes de vaciar deja sus diferencias en la tabla
+    perdidas = []
+    crud.votar_publicacion(db_session, yo, publicacion, False, perdidas.append)
+    assert len(perdidas) == 1
+    assert _contadores(db_session, publicacion) == (0, 0)
+
+    # Recientes: aún puede vaciarlas su worker, no se tocan
+    assert crud.reconciliar_contadores(db_session) == 0
+    assert _contadores(db_session, publicacion) == (0, 0)
+
+    assert crud.reconciliar_contadores(db_session, antiguedad_huerfanos_s=0) == 0
+    assert _contadores(db_session, publicacion) == (0, 1)
+    assert db_session.query(models.ContadorPendiente).count() == 0
+
+
+def test_carga_sobre_post_caliente(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app import bench_votos
+    from app.database import Base
+    from app.services.votos_service import AcumuladorVotos
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'votos.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    directo = bench_votos.medir(session_factory, votos=60, hilos=4)
+    acumulador = AcumuladorVotos(session_factory, max_eventos=25)
+    acumulado = bench_votos.medir(session_factory, votos=60, hilos=4, acumulador=acumulador)
+
+    assert directo["contador_correcto"] and acumulado["contador_correcto"]
+    # 60 votos y como mucho 3 escrituras del contador (cada 25 votos y el resto al final)
+    assert 1 <= acumulado["escrituras_contador"] <= 3
+
+
+def test_reconciliacion_desde_la_linea_de_comandos(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app import reconciliar_votos
+    from app.database import Base
+
+    url = f"sqlite:///{tmp_path / 'foro.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    autor = models.Usuario(nombre="N", apellidos="A", email="a@test.com", password_hash="x")
+    db.add(autor)
+    db.flush()
+    pub = models.Publicacion(titulo="T", texto="-", id_usuario=autor.id_usuario, likes=5)
+    db.add(pub)
+    db.commit()
+    db.close()
+
+    assert reconciliar_votos.reconciliar(url) == 1
+    assert reconciliar_votos.reconciliar(url) == 0
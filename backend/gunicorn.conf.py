@@ -0,0 +1,46 @@
+# Configuración de gunicorn para servir VitIA con varios workers (ver SERVING.md).
+#
+#   gunicorn -c gunicorn.conf.py app.main:app
+#
+# IA_SERVING_MODE (en .env o entorno):
+#   local   -> cada worker carga su propio modelo la primera vez que lo usa.
+#   preload -> el maestro carga el modelo ANTES del fork y los workers comparten
+#              las páginas de los pesos por copy-on-write.
+#   sidecar -> ningún worker carga YOLO; todos infieren en `python -m app.ia.sidecar`.
+import gc
+import os
+
+bind = os.getenv("VITIA_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("VITIA_WORKERS", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("VITIA_TIMEOUT", "120"))
+
+# Importa app.main en el maestro antes de hacer fork (necesario para 'preload')
+preload_app = True
+
+
+def when_ready(server):
+    """Se ejecuta en el maestro con la app ya importada y antes de crear los workers."""
+    from app.config import settings
+
+    if settings.IA_SERVING_MODE != "preload":
+        return
+
+    from app.ia.model_loader import registry
+
+    # Solo cargamos pesos: no hacemos inferencia en el maestro para no arrancar
+    # pools de hilos de torch/OpenMP antes del fork.
+    registry.get()
+    server.log.info(f"Modelo precargado en el maestro en {registry.tiempo_carga_ms} ms")
+
+    # Mueve todos los objetos actuales a una generación permanente: el GC de los
+    # workers ya no los recorre, así no ensucia (y duplica) las páginas compartidas.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from app.config import settings
+
+    if settings.IA_SERVING_MODE == "preload" and settings.IA_TORCH_THREADS:
+        import torch
+        torch.set_num_threads(settings.IA_TORCH_THREADS)